@@ -0,0 +1,227 @@
+#!/usr/bin/python3
+
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+"""
+Benchmark decoding UAI pod and service lists through the Kubernetes
+client models (the default path) against the raw JSON decode path
+(UAS_K8S_RAW_DECODE=true).  Run from the top of the source tree:
+
+    python3 dev/bench_decode.py [count ...]
+
+The default counts are 1000 and 10000 UAIs.
+"""
+import json
+import sys
+import time
+from datetime import datetime, timezone
+from kubernetes import client
+from swagger_server.uas_lib.uas_base import UasBase
+
+SVC_TYPE = {
+    'svc_type': "NodePort",
+    'ip_pool': None,
+    'valid': True,
+    'sub_domain': None
+}
+
+
+class FakeResponse:  # pylint: disable=too-few-public-methods
+    """Stand-in for the urllib3 response the client deserializes from.
+
+    """
+    def __init__(self, data):
+        self.data = data
+
+
+def make_pod(name):
+    """Make a realistic looking running UAI pod.
+
+    """
+    labels = {
+        'app': name,
+        'uas': "managed",
+        'user': "user-%s" % name,
+        'uas-uai-opt-ports': "8888",
+        'uas-public-ip': "False",
+        'uas-uai-has-timeout': "False",
+    }
+    container = client.V1Container(
+        name=name,
+        image="registry.local/cray/cray-uai-sles15sp3:latest",
+        env=[
+            client.V1EnvVar(name="UAS_NAME", value=name),
+            client.V1EnvVar(name="UAS_PASSWD", value="x" * 128),
+        ],
+        volume_mounts=[
+            client.V1VolumeMount(name="vol-%d" % idx, mount_path="/m%d" % idx)
+            for idx in range(8)
+        ],
+        ports=[client.V1ContainerPort(container_port=30123)],
+    )
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(
+            name=name + "-abcde",
+            namespace="user",
+            labels=labels,
+            annotations={'k8s.v1.cni.cncf.io/networks': "macvlan-uas-nmn-conf"}
+        ),
+        spec=client.V1PodSpec(
+            node_name="ncn-w001",
+            containers=[container],
+            volumes=[
+                client.V1Volume(
+                    name="vol-%d" % idx,
+                    host_path=client.V1HostPathVolumeSource(path="/h%d" % idx)
+                )
+                for idx in range(8)
+            ],
+            tolerations=[
+                client.V1Toleration(key="uai_only", operator="Exists")
+            ]
+        ),
+        status=client.V1PodStatus(
+            phase="Running",
+            start_time=datetime.now(timezone.utc),
+            conditions=[client.V1PodCondition(type="Ready", status="True")],
+            container_statuses=[
+                client.V1ContainerStatus(
+                    name=name,
+                    image=container.image,
+                    image_id="",
+                    ready=True,
+                    restart_count=0,
+                    state=client.V1ContainerState(
+                        running=client.V1ContainerStateRunning(
+                            started_at=datetime.now(timezone.utc)
+                        )
+                    )
+                )
+            ]
+        )
+    )
+
+
+def make_service(name):
+    """Make the SSH service for a UAI.
+
+    """
+    return client.V1Service(
+        metadata=client.V1ObjectMeta(
+            name=name + "-ssh",
+            namespace="user",
+            labels={'app': name, 'uas': "managed", 'uas-public-ip': "False"}
+        ),
+        spec=client.V1ServiceSpec(
+            cluster_ip="10.0.0.1",
+            type="NodePort",
+            ports=[
+                client.V1ServicePort(port=30123, target_port=30123),
+                client.V1ServicePort(port=8888, target_port=8888),
+            ]
+        )
+    )
+
+
+def serialize(api_client, kind, items):
+    """Serialize a list of objects the way the API server would.
+
+    """
+    return json.dumps(
+        {
+            'kind': kind,
+            'apiVersion': "v1",
+            'metadata': {'resourceVersion': "1"},
+            'items': api_client.sanitize_for_serialization(items),
+        }
+    ).encode('utf-8')
+
+
+def bench(count):
+    """Time both decode paths for 'count' UAIs.
+
+    """
+    api_client = client.ApiClient()
+    names = ["uai-%08d" % idx for idx in range(count)]
+    pod_data = serialize(
+        api_client, "PodList", [make_pod(name) for name in names]
+    )
+    srv_data = serialize(
+        api_client, "ServiceList", [make_service(name) for name in names]
+    )
+    # Bypass the constructor, which needs a Kubernetes cluster and a UAS
+    # configuration, neither of which composing UAIs uses when the
+    # service type is passed in.
+    base = UasBase.__new__(UasBase)
+
+    start = time.perf_counter()
+    pods = api_client.deserialize(FakeResponse(pod_data), 'V1PodList').items
+    srvs = api_client.deserialize(FakeResponse(srv_data), 'V1ServiceList').items
+    srv_map = {srv.metadata.name: srv for srv in srvs}
+    models = [
+        base.compose_uai(
+            pod,
+            srv_map.get(pod.metadata.labels['app'] + "-ssh"),
+            SVC_TYPE
+        )
+        for pod in pods
+    ]
+    model_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pods = json.loads(pod_data)['items']
+    srvs = json.loads(srv_data)['items']
+    srv_map = {srv['metadata']['name']: srv for srv in srvs}
+    raw = [
+        base.compose_uai_dict(
+            pod,
+            srv_map.get(pod['metadata']['labels']['app'] + "-ssh"),
+            SVC_TYPE
+        )
+        for pod in pods
+    ]
+    raw_time = time.perf_counter() - start
+
+    assert [uai.to_dict() for uai in models] == [uai.to_dict() for uai in raw]
+    print(
+        "%6d UAIs (%5.1f MB): models %7.3fs, raw %7.3fs, speedup %5.1fx" % (
+            count,
+            (len(pod_data) + len(srv_data)) / 1e6,
+            model_time,
+            raw_time,
+            model_time / raw_time
+        )
+    )
+
+
+def main(argv):
+    """Run the benchmark for each requested count.
+
+    """
+    counts = [int(arg) for arg in argv] or [1000, 10000]
+    for count in counts:
+        bench(count)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -29,11 +29,15 @@ from swagger_server import version
 from swagger_server.uas_lib.uai_mgr import UaiManager
 from swagger_server.uas_lib.uas_mgr import UasManager
 from swagger_server.uas_lib.uas_cfg import UasCfg
+from swagger_server.uas_lib.uas_metrics import get_metrics
+from swagger_server.uas_lib.vault_cleanup import VaultCleanupQueue
+from swagger_server.uas_data_model.config_snapshot import config_snapshot
 
 
 uas_cfg = UasCfg()  # pylint: disable=invalid-name
 
 
+@config_snapshot
 def create_uai(publickey=None, imagename=None, ports=None, uai_name=None):
     """Create a new UAI for user
 
@@ -55,6 +59,7 @@ def create_uai(publickey=None, imagename=None, ports=None, uai_name=None):
     return uai_response
 
 
+@config_snapshot
 def delete_uai_by_name(uai_list):
     """Delete UAIs in uai_list
 
@@ -71,6 +76,7 @@ def delete_uai_by_name(uai_list):
     return uai_resp
 
 
+@config_snapshot
 def get_uais_for_user():
     """List all UAIs for user
 
@@ -82,6 +88,7 @@ def get_uais_for_user():
     return uai_resp
 
 
+@config_snapshot
 def get_uas_images():
     """List available UAS images
 
@@ -96,6 +103,7 @@ def get_uas_images():
     return uas_img_info
 
 
+@config_snapshot
 def get_uas_mgr_info():
     """List uas-mgr service info
 
@@ -109,14 +117,25 @@ def get_uas_mgr_info():
     # for that and avoids the need for threading.  For now we will
     # reap the default number of UAIs at a go.  In the future this may
     # want to be configurable.
-    UaiManager().reap_uais()
+    uai_mgr = UaiManager()
+    uai_mgr.reap_uais()
+    # The same goes for picking up Vault cleanups left over from other
+    # or earlier UAS Managers.
+    VaultCleanupQueue.get_instance().resume()
     uas_mgr_info = {
         'service_name': 'cray-uas-mgr',
-        'version': version
+        'version': version,
+        'metrics': get_metrics()
     }
+    # If the UAI cache is turned on, report how long it has been since
+    # each part of it was known to be in sync, so a stuck watch shows
+    # up here.
+    if uai_mgr.uai_cache is not None:
+        uas_mgr_info['k8s_cache'] = uai_mgr.uai_cache.staleness()
     return uas_mgr_info
 
 
+@config_snapshot
 def get_all_uais(username=None, host=None):
     """List all UAIs matching optional parameters
 
@@ -136,6 +155,7 @@ def get_all_uais(username=None, host=None):
     return uai_resp
 
 
+@config_snapshot
 def delete_all_uais(username=None):
     """Delete all UAIs
 
@@ -148,10 +168,10 @@ def delete_all_uais(username=None):
 
     if username:
         uai_list = uai_mgr.select_jobs(
-            labels='uas=managed,user=%s' % username
+            labels=['user=%s' % username]
         )
         if not uai_list:
-            return "User %s has no UAIs, none deleted"
+            return "User %s has no UAIs, none deleted" % username
     uai_resp = uai_mgr.delete_uais(job_list=uai_list)
     return uai_resp
 
@@ -159,6 +179,7 @@ def delete_all_uais(username=None):
 # Admin API
 #
 # UAIs
+@config_snapshot
 def create_uai_admin(class_id=None,
                      owner=None,
                      passwd_str=None,
@@ -185,6 +206,7 @@ def create_uai_admin(class_id=None,
     )
 
 
+@config_snapshot
 def delete_uais_admin(class_id=None, owner=None, uai_list=None):
     """ Delete UAIs, optionally by class or by owner or both
 
@@ -201,6 +223,7 @@ def delete_uais_admin(class_id=None, owner=None, uai_list=None):
     )
 
 
+@config_snapshot
 def get_uais_admin(class_id=None, owner=None):
     """ List UAIs, optionally by class or by owner
 
@@ -216,6 +239,7 @@ def get_uais_admin(class_id=None, owner=None):
     )
 
 
+@config_snapshot
 def get_uai_admin(uai_name=None):
     """ Retrieve a UAI by its name
 
@@ -229,6 +253,7 @@ def get_uai_admin(uai_name=None):
 
 
 # Images...
+@config_snapshot
 def create_uas_image_admin(imagename, default=None):
     """Add an image
 
@@ -251,6 +276,7 @@ def create_uas_image_admin(imagename, default=None):
                                      default=default)
 
 
+@config_snapshot
 def get_uas_images_admin():
     """List UAS images
 
@@ -262,6 +288,7 @@ def get_uas_images_admin():
     return UasManager().get_images()
 
 
+@config_snapshot
 def get_uas_image_admin(image_id):
     """Get image info
 
@@ -277,6 +304,7 @@ def get_uas_image_admin(image_id):
     return UasManager().get_image(image_id=image_id)
 
 
+@config_snapshot
 def update_uas_image_admin(image_id, imagename=None, default=None):
     """Update an image
 
@@ -299,6 +327,7 @@ def update_uas_image_admin(image_id, imagename=None, default=None):
                                      imagename=imagename,
                                      default=default)
 
+@config_snapshot
 def delete_uas_image_admin(image_id):
     """Remove the imagename from set of valid images
 
@@ -316,6 +345,7 @@ def delete_uas_image_admin(image_id):
     return UasManager().delete_image(image_id=image_id)
 
 # Volumes...
+@config_snapshot
 def create_uas_volume_admin(volumename, mount_path,
                             volume_description):
     """Add a volume
@@ -374,6 +404,7 @@ def create_uas_volume_admin(volumename, mount_path,
     )
 
 
+@config_snapshot
 def get_uas_volumes_admin():
     """List volumes
 
@@ -388,6 +419,7 @@ def get_uas_volumes_admin():
     return UasManager().get_volumes()
 
 
+@config_snapshot
 def get_uas_volume_admin(volume_id):
     """Get volume info for volume ID
 
@@ -403,6 +435,7 @@ def get_uas_volume_admin(volume_id):
     return UasManager().get_volume(volume_id=volume_id)
 
 
+@config_snapshot
 def update_uas_volume_admin(volume_id, volumename=None, mount_path=None,
                             volume_description=None):
     """Update a volume
@@ -461,6 +494,7 @@ def update_uas_volume_admin(volume_id, volumename=None, mount_path=None,
     )
 
 
+@config_snapshot
 def delete_uas_volume_admin(volume_id):
     """Remove volume from the volume list
 
@@ -478,6 +512,7 @@ def delete_uas_volume_admin(volume_id):
         return "Must provide volume_id to delete."
     return UasManager().delete_volume(volume_id=volume_id)
 
+@config_snapshot
 def delete_local_config_admin():
     """Remove all local configuration and reset to defaults
 
@@ -488,7 +523,19 @@ def delete_local_config_admin():
     """
     return UasManager().factory_reset()
 
+
+def get_vault_cleanup_admin():
+    """List pending Vault cleanups
+
+    Lists the removals of the Broker UAI data in Vault of deleted UAI
+    Classes that are still pending.
+
+    :rtype: list
+    """
+    return UasManager.get_vault_cleanups()
+
 # Resource Configs...
+@config_snapshot
 def create_uas_resource_admin(comment=None, limit=None, request=None):
     """Add a resource limit / request configuration item
 
@@ -509,6 +556,7 @@ def create_uas_resource_admin(comment=None, limit=None, request=None):
                                         request=request)
 
 
+@config_snapshot
 def get_uas_resources_admin():
     """List UAS resource limit / request config items
 
@@ -520,6 +568,7 @@ def get_uas_resources_admin():
     return UasManager().get_resources()
 
 
+@config_snapshot
 def get_uas_resource_admin(resource_id):
     """Get the specified resource limit / request configuration item
 
@@ -535,6 +584,7 @@ def get_uas_resource_admin(resource_id):
     return UasManager().get_resource(resource_id=resource_id)
 
 
+@config_snapshot
 def update_uas_resource_admin(resource_id,
                               comment=None,
                               limit=None,
@@ -563,6 +613,7 @@ def update_uas_resource_admin(resource_id,
                                         limit=limit,
                                         request=request)
 
+@config_snapshot
 def delete_uas_resource_admin(resource_id):
     """Remove the specified resource limit / request configuration
 
@@ -578,6 +629,7 @@ def delete_uas_resource_admin(resource_id):
 
 # UAI Classes
 #pylint: disable=too-many-arguments,too-many-locals
+@config_snapshot
 def create_uas_class_admin(comment=None,
                            default=None,
                            public_ip=None,
@@ -647,6 +699,7 @@ def create_uas_class_admin(comment=None,
                                      replicas=replicas)
 
 
+@config_snapshot
 def get_uas_classes_admin():
     """List UAI Classes
 
@@ -657,6 +710,7 @@ def get_uas_classes_admin():
     return UasManager().get_classes()
 
 
+@config_snapshot
 def get_uas_class_admin(class_id=None):
     """Get the specified UAI Class
 
@@ -673,6 +727,7 @@ def get_uas_class_admin(class_id=None):
 
 
 #pylint: disable=too-many-arguments,too-many-locals
+@config_snapshot
 def update_uas_class_admin(class_id=None,
                            comment=None,
                            default=None,
@@ -746,6 +801,7 @@ def update_uas_class_admin(class_id=None,
                                      service_account=service_account,
                                      replicas=replicas)
 
+@config_snapshot
 def delete_uas_class_admin(class_id):
     """Remove the specified UAI Class
 
@@ -0,0 +1,154 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+"""Shared fixtures for tests of the Kubernetes side of UAS Manager:
+made up UAI objects, mocked Kubernetes APIs and fake watches.
+
+"""
+import threading
+from unittest import mock
+import flask
+from kubernetes import client
+from swagger_server.uas_lib.uai_mgr import UaiManager
+
+app = flask.Flask(__name__)  # pylint: disable=invalid-name
+
+
+def make_uai_pod(name, namespace="user"):
+    """Make a pending UAI pod for the UAI 'name'.
+
+    """
+    return client.V1Pod(
+        metadata=client.V1ObjectMeta(
+            name=name + "-abcde",
+            namespace=namespace,
+            labels={
+                'app': name,
+                'uas': 'managed',
+                'user': 'test-user',
+                'uas-uai-opt-ports': '8888',
+                'uas-public-ip': 'False'
+            }
+        ),
+        spec=client.V1PodSpec(
+            node_name="ncn-w001",
+            containers=[client.V1Container(name=name, image="my-image")]
+        ),
+        status=client.V1PodStatus(phase='Pending')
+    )
+
+
+def make_uai_service(name, namespace="user"):
+    """Make the SSH service of the UAI 'name'.
+
+    """
+    return client.V1Service(
+        metadata=client.V1ObjectMeta(
+            name=name + "-ssh",
+            namespace=namespace,
+            labels={'app': name, 'uas': 'managed', 'uas-public-ip': 'False'}
+        ),
+        spec=client.V1ServiceSpec(
+            cluster_ip="10.0.0.1",
+            ports=[
+                client.V1ServicePort(port=30123),
+                client.V1ServicePort(port=8888)
+            ]
+        )
+    )
+
+
+def make_job(name, namespace, user, successful=0):
+    """Make a UAI Job for the UAI 'name' owned by 'user'.
+
+    """
+    return client.V1Job(
+        metadata=client.V1ObjectMeta(
+            name=name,
+            namespace=namespace,
+            labels={'app': name, 'uas': 'managed', 'user': user}
+        ),
+        status=client.V1JobStatus(succeeded=successful)
+    )
+
+
+def mock_uai_mgr(namespaces=None):
+    """Make a UAI manager whose Kubernetes APIs are mocks and that looks
+    for UAIs in only the specified namespaces ('user' by default).
+    Return the UAI manager and its (core, batch) API mocks.
+
+    """
+    with app.test_request_context('/'):
+        uai_mgr = UaiManager()
+    api = mock.Mock()
+    batch_v1 = mock.Mock()
+    uai_mgr.uai_cache = None
+    uai_mgr.managed_namespaces = None
+    uai_mgr.api = api
+    uai_mgr.batch_v1 = batch_v1
+    uai_mgr.uas_cfg = mock.Mock(wraps=uai_mgr.uas_cfg)
+    uai_mgr.uas_cfg.get_uai_namespaces.return_value = (
+        ["user"] if namespaces is None else namespaces
+    )
+    return uai_mgr, api, batch_v1
+
+
+def wait_for_uai(uai_mgr, streams, timeout=40):
+    """Run wait_for_uai_ip() for the UAI 'uai-w' in the namespace 'user'
+    against fake pod, service and event watch streams (lists of events
+    keyed by the name of the list function: 'pods', 'services' or
+    'events') and return the resulting UAI.  'uai_mgr' comes from
+    mock_uai_mgr().
+
+    """
+    class FakeWatch:
+        """Stands in for kubernetes.watch.Watch.
+
+        """
+        def __init__(self):
+            self.stopped = threading.Event()
+
+        def stream(self, func, *args, **kwargs):
+            """Stream the events for the list function 'func'.
+
+            """
+            resp = func(*args, **kwargs)
+            yield from streams.get(resp.name, [])
+            # Like a real watch, block until stopped or the response is
+            # closed
+            resp.close.side_effect = self.stopped.set
+            self.stopped.wait(timeout)
+
+        def stop(self):
+            """Stop streaming.
+
+            """
+            self.stopped.set()
+
+    uai_mgr.api.list_namespaced_pod.return_value.name = "pods"
+    uai_mgr.api.list_namespaced_service.return_value.name = "services"
+    uai_mgr.api.list_namespaced_event.return_value.name = "events"
+    with mock.patch(
+            "swagger_server.uas_lib.uai_wait.watch.Watch", FakeWatch
+    ), mock.patch(
+        "swagger_server.uas_lib.uas_base.UAI_IP_TIMEOUT", timeout
+    ):
+        return uai_mgr.wait_for_uai_ip("uai-w", "uai-w-ssh", "user")
@@ -0,0 +1,272 @@
+#!/usr/bin/python3
+
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# pylint: disable=missing-docstring,too-few-public-methods
+
+import json
+import unittest
+from unittest import mock
+from etcd3_model import Etcd3Model
+from swagger_server.uas_data_model.config_replica import (
+    ConfigReplica,
+    decode_model,
+    encode_model
+)
+from swagger_server.uas_data_model.uai_class import UAIClass
+from swagger_server.uas_data_model.uai_image import UAIImage
+
+PREFIX = UAIImage.model_prefix.rsplit('/', 1)[0]
+
+
+class Meta:
+    def __init__(self, key, mod_revision, revision):
+        self.key = key.encode('utf-8')
+        self.mod_revision = mod_revision
+        self.response_header = Header(revision)
+
+
+class Header:
+    def __init__(self, revision):
+        self.revision = revision
+
+
+class PutEvent:
+    def __init__(self, key, value, mod_revision):
+        self.key = key.encode('utf-8')
+        self.value = value
+        self.mod_revision = mod_revision
+
+
+class DeleteEvent(PutEvent):
+    pass
+
+
+class Response:
+    def __init__(self, events):
+        self.events = events
+
+
+class FakeEtcd:
+    """Just enough of an ETCD client to replicate from.  Watch events
+    are only delivered when the test says so.
+
+    """
+    def __init__(self):
+        self.data = {}
+        self.revision = 0
+        self.reads = 0
+        self.watches = 0
+        self.callback = None
+        self.watch_prefix = None
+        self.pending = []
+
+    def get_prefix(self, prefix):
+        self.reads += 1
+        return [
+            (value, Meta(key, mod_revision, self.revision))
+            for key, (value, mod_revision) in sorted(self.data.items())
+            if key.startswith(prefix)
+        ]
+
+    def add_watch_prefix_callback(self, prefix, callback):
+        self.watches += 1
+        self.watch_prefix = prefix
+        self.callback = callback
+        return self.watches
+
+    def put(self, key, value):
+        self.revision += 1
+        self.data[key] = (value, self.revision)
+        self.pending.append(PutEvent(key, value, self.revision))
+
+    def delete(self, key):
+        self.revision += 1
+        del self.data[key]
+        self.pending.append(DeleteEvent(key, None, self.revision))
+
+    def deliver(self):
+        events, self.pending = self.pending, []
+        self.callback(Response(events))
+
+
+def image_value(image_id, imagename):
+    return json.dumps(
+        {'image_id': image_id, 'imagename': imagename}
+    ).encode('utf-8')
+
+
+class TestConfigReplica(unittest.TestCase):
+    """Tester for the in-process replica of the UAS configuration
+
+    """
+    def setUp(self):
+        self.etcd = FakeEtcd()
+        self.etcd.put(
+            "%s/image-1" % UAIImage.model_prefix,
+            image_value("image-1", "one")
+        )
+        self.etcd.pending = []
+        self.replica = ConfigReplica(etcd=self.etcd, prefix=PREFIX)
+
+    def test_load_once(self):
+        for _ in range(3):
+            usable, imgs = self.replica.get_all(UAIImage)
+            self.assertTrue(usable)
+            self.assertEqual([img.imagename for img in imgs], ["one"])
+            usable, img = self.replica.get(UAIImage, "image-1")
+            self.assertEqual(img.image_id, "image-1")
+            self.assertEqual(self.replica.get(UAIImage, "x"), (True, None))
+        self.assertEqual(self.etcd.reads, 1)
+        self.assertEqual(self.etcd.watches, 1)
+        self.assertEqual(self.etcd.watch_prefix, PREFIX + "/")
+
+    def test_watch(self):
+        self.replica.values()
+        key = "%s/image-2" % UAIImage.model_prefix
+        self.etcd.put(key, image_value("image-2", "two"))
+        self.etcd.delete("%s/image-1" % UAIImage.model_prefix)
+        self.assertEqual(list(self.replica.values()), [
+            "%s/image-1" % UAIImage.model_prefix
+        ])
+        self.etcd.deliver()
+        self.assertEqual(list(self.replica.values()), [key])
+        # Events older than what the replica has are ignored
+        self.etcd.callback(
+            Response([PutEvent(key, image_value("image-2", "old"), 1)])
+        )
+        _, img = self.replica.get(UAIImage, "image-2")
+        self.assertEqual(img.imagename, "two")
+        self.assertEqual(self.etcd.reads, 1)
+
+    def test_read_your_writes(self):
+        self.replica.values()
+        key = "%s/image-2" % UAIImage.model_prefix
+        self.etcd.put(key, image_value("image-2", "two"))
+        self.etcd.delete("%s/image-1" % UAIImage.model_prefix)
+        self.replica.invalidate(UAIImage.model_prefix + "/")
+        _, imgs = self.replica.get_all(UAIImage)
+        self.assertEqual([img.imagename for img in imgs], ["two"])
+        self.assertEqual(self.etcd.reads, 2)
+        # The (late) watch events change nothing
+        self.etcd.deliver()
+        _, imgs = self.replica.get_all(UAIImage)
+        self.assertEqual([img.imagename for img in imgs], ["two"])
+        self.assertEqual(self.etcd.reads, 2)
+
+    def test_watch_failure(self):
+        self.replica.values()
+        self.etcd.callback(Exception("watch failed"))
+        self.replica.values()
+        self.assertEqual(self.etcd.reads, 2)
+        self.assertEqual(self.etcd.watches, 2)
+
+    def test_index(self):
+        key = "%s/image-2" % UAIImage.model_prefix
+        usable, index = self.replica.get_index(UAIImage, 'imagename')
+        self.assertTrue(usable)
+        self.assertEqual(index, {"one": ("image-1",)})
+        self.assertIs(self.replica.get_index(UAIImage, 'imagename')[1], index)
+        self.etcd.put(key, image_value("image-2", "one"))
+        self.etcd.deliver()
+        _, index = self.replica.get_index(UAIImage, 'imagename')
+        self.assertEqual(index, {"one": ("image-1", "image-2")})
+        self.assertEqual(self.etcd.reads, 1)
+
+    def test_index_by_model_revision(self):
+        values, revisions = self.replica.copy()
+        self.assertEqual(list(values), ["%s/image-1" % UAIImage.model_prefix])
+        revision = revisions[UAIImage.model_prefix + "/"]
+        _, index = self.replica.get_index(UAIImage, 'imagename', revision)
+        self.assertEqual(index, {"one": ("image-1",)})
+        # A change to another model keeps the index
+        self.etcd.put(
+            "%s/class-1" % UAIClass.model_prefix,
+            json.dumps({'class_id': "class-1"}).encode('utf-8')
+        )
+        self.etcd.deliver()
+        self.assertIs(
+            self.replica.get_index(UAIImage, 'imagename', revision)[1], index
+        )
+        # A change to the model means an index pinned to the old model
+        # revision is not available any more
+        self.etcd.put(
+            "%s/image-2" % UAIImage.model_prefix,
+            image_value("image-2", "two")
+        )
+        self.etcd.deliver()
+        self.assertEqual(
+            self.replica.get_index(UAIImage, 'imagename', revision),
+            (False, None)
+        )
+        _, index = self.replica.get_index(UAIImage, 'imagename')
+        self.assertEqual(index, {"one": ("image-1",), "two": ("image-2",)})
+
+    def test_read_outside_lock(self):
+        key = "%s/image-2" % UAIImage.model_prefix
+        get_prefix = self.etcd.get_prefix
+
+        def racing_get_prefix(prefix):
+            values = get_prefix(prefix)
+            # ETCD is read without the replica lock held, so a watch
+            # event can be delivered while reading, and it is kept even
+            # though the read did not see it.
+            self.assertFalse(self.replica.lock.locked())
+            self.etcd.put(key, image_value("image-2", "two"))
+            self.etcd.deliver()
+            return values
+
+        self.etcd.get_prefix = racing_get_prefix
+        usable, imgs = self.replica.get_all(UAIImage)
+        self.assertTrue(usable)
+        self.assertEqual([img.imagename for img in imgs], ["one", "two"])
+
+    def test_encode_round_trip(self):
+        image = UAIImage(imagename="one", default=True)
+        etcd = mock.Mock()
+        with mock.patch.object(UAIImage, 'etcd_instance', etcd):
+            # Store it the way the data model does, bypassing the
+            # registration and snapshot handling in UAIImage.
+            Etcd3Model.put(image)
+        stored_key, stored_value = etcd.put.call_args[0][:2]
+        key, value = encode_model(image)
+        self.assertEqual(key, stored_key)
+        self.assertEqual(json.loads(value), json.loads(stored_value))
+        usable, decoded = decode_model(UAIImage, key, value)
+        self.assertTrue(usable)
+        self.assertEqual(decoded.image_id, image.image_id)
+        self.assertEqual(decoded.imagename, "one")
+        self.assertTrue(decoded.default)
+        self.assertEqual(encode_model(decoded), (key, value))
+
+    def test_unsupported(self):
+        replica = ConfigReplica(etcd=object(), prefix=PREFIX)
+        self.assertIsNone(replica.values())
+        self.assertEqual(replica.get_all(UAIImage), (False, None))
+        self.assertEqual(
+            replica.get_index(UAIImage, 'imagename'), (False, None)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
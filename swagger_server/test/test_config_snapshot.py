@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# pylint: disable=missing-docstring
+
+import json
+import unittest
+from unittest import mock
+import flask
+from swagger_server.uas_lib.uas_cfg import UasCfg
+from swagger_server.uas_data_model.config_replica import ConfigReplica
+from swagger_server.uas_data_model.config_snapshot import (
+    ConfigSnapshot,
+    config_snapshot
+)
+from swagger_server.uas_data_model.populated_config import PopulatedConfig
+from swagger_server.uas_data_model.uai_image import UAIImage
+from swagger_server.test.test_config_replica import (
+    PREFIX,
+    FakeEtcd,
+    image_value
+)
+
+
+app = flask.Flask(__name__)  # pylint: disable=invalid-name
+
+
+def etcd_item(model, object_id, **attrs):
+    """Make a (value, metadata) tuple the way an ETCD range read returns
+    them for a data model object.
+
+    """
+    meta = mock.Mock()
+    meta.key = ("%s/%s" % (model.model_prefix, object_id)).encode('utf-8')
+    return (json.dumps(attrs).encode('utf-8'), meta)
+
+
+class TestConfigSnapshot(unittest.TestCase):
+    """Tester for the request scoped configuration snapshot
+
+    """
+    def setUp(self):
+        self.etcd = mock.Mock()
+        self.etcd.get_prefix.side_effect = lambda prefix: [
+            etcd_item(
+                PopulatedConfig,
+                "UAIImage",
+                config_name="UAIImage"
+            ),
+            etcd_item(
+                UAIImage,
+                "image-1",
+                image_id="image-1",
+                imagename="registry.local/image-1:latest",
+                default=True
+            ),
+        ]
+        patcher = mock.patch(
+            "swagger_server.uas_data_model.config_snapshot.ETCD_INSTANCE",
+            self.etcd
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Read from (fake) ETCD, not from the in-process replica
+        patcher = mock.patch(
+            "swagger_server.uas_data_model.config_snapshot.ConfigReplica."
+            "get_instance",
+            return_value=None
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_no_snapshot(self):
+        self.assertIsNone(ConfigSnapshot.current())
+        with app.test_request_context('/'):
+            self.assertIsNone(ConfigSnapshot.current())
+            UAIImage.get_all()
+        self.etcd.get_prefix.assert_not_called()
+
+    def test_one_range_read(self):
+        with app.test_request_context('/'):
+            ConfigSnapshot.start()
+            for _ in range(3):
+                imgs = UAIImage.get_all()
+                self.assertEqual(len(imgs), 1)
+                self.assertEqual(imgs[0].image_id, "image-1")
+                self.assertTrue(imgs[0].default)
+            self.assertEqual(UAIImage.get("image-1").imagename,
+                             "registry.local/image-1:latest")
+            self.assertIsNone(UAIImage.get("image-2"))
+            self.assertEqual(self.etcd.get_prefix.call_count, 1)
+            # A change made by the request is seen by the request
+            ConfigSnapshot.invalidate()
+            UAIImage.get_all()
+            self.assertEqual(self.etcd.get_prefix.call_count, 2)
+
+    def test_get_many(self):
+        with app.test_request_context('/'):
+            ConfigSnapshot.start()
+            imgs = UAIImage.get_many(["image-1", "image-2"])
+            self.assertEqual(list(imgs), ["image-1"])
+            imgs = UAIImage.get_many(["image-2"], expandable=True)
+            self.assertEqual(
+                imgs["image-2"].expand(),
+                "<unknown UAIImage instance, ID = 'image-2'>"
+            )
+            self.assertEqual(UAIImage.get_many([]), {})
+            self.assertEqual(self.etcd.get_prefix.call_count, 1)
+
+    def test_get_by_index(self):
+        with app.test_request_context('/'):
+            snapshot = ConfigSnapshot.start()
+            img = UAIImage.get_by_name("registry.local/image-1:latest")
+            self.assertEqual(img.image_id, "image-1")
+            self.assertIsNone(UAIImage.get_by_name("unknown"))
+            self.assertEqual(UAIImage.get_default().image_id, "image-1")
+            self.assertEqual(
+                snapshot.get_index(UAIImage, 'default'),
+                (True, {True: ("image-1",)})
+            )
+            self.assertEqual(self.etcd.get_prefix.call_count, 1)
+            # Indexes are rebuilt after a change
+            ConfigSnapshot.invalidate()
+            self.assertEqual(snapshot.indexes, {})
+
+    def test_invalidate_model(self):
+        with app.test_request_context('/'):
+            snapshot = ConfigSnapshot.start()
+            UAIImage.get_by_name("registry.local/image-1:latest")
+            self.assertEqual(len(snapshot.indexes), 1)
+            ConfigSnapshot.invalidate(PopulatedConfig.model_prefix + "/")
+            # Only the changed model is read again
+            self.assertEqual(len(snapshot.indexes), 1)
+            self.assertEqual(UAIImage.get("image-1").image_id, "image-1")
+            self.assertEqual(self.etcd.get_prefix.call_count, 1)
+            ConfigSnapshot.invalidate(UAIImage.model_prefix + "/")
+            self.assertEqual(snapshot.indexes, {})
+            self.assertEqual(UAIImage.get("image-1").image_id, "image-1")
+            self.assertEqual(self.etcd.get_prefix.call_count, 2)
+            self.etcd.get_prefix.assert_called_with(
+                UAIImage.model_prefix + "/"
+            )
+
+    def test_replica_index(self):
+        etcd = FakeEtcd()
+        etcd.put(
+            "%s/image-1" % UAIImage.model_prefix,
+            image_value("image-1", "one")
+        )
+        replica = ConfigReplica(etcd=etcd, prefix=PREFIX)
+        with mock.patch(
+                "swagger_server.uas_data_model.config_snapshot.ConfigReplica."
+                "get_instance",
+                return_value=replica
+        ), app.test_request_context('/'):
+            snapshot = ConfigSnapshot.start()
+            _, index = snapshot.get_index(UAIImage, 'imagename')
+            # The replica's index is used, not one built for the request
+            self.assertIs(index, replica.get_index(UAIImage, 'imagename')[1])
+            # Unless the model changed in the replica since the snapshot
+            # was taken
+            ConfigSnapshot.start()
+            etcd.put(
+                "%s/image-2" % UAIImage.model_prefix,
+                image_value("image-2", "two")
+            )
+            snapshot = ConfigSnapshot.current()
+            snapshot.get_all(UAIImage)
+            etcd.deliver()
+            _, index = snapshot.get_index(UAIImage, 'imagename')
+            self.assertEqual(index, {"one": ("image-1",)})
+        self.assertEqual(etcd.reads, 1)
+
+    def test_unusable(self):
+        self.etcd.get_prefix.side_effect = AttributeError("get_prefix")
+        with app.test_request_context('/'):
+            snapshot = ConfigSnapshot.start()
+            self.assertEqual(snapshot.get_all(UAIImage), (False, None))
+            self.assertEqual(snapshot.get(UAIImage, "x"), (False, None))
+            self.assertEqual(self.etcd.get_prefix.call_count, 1)
+
+    def test_configmap(self):
+        uas_cfg = UasCfg(uas_cfg='swagger_server/test/cray-uas-mgr.yaml')
+        with app.test_request_context('/'):
+            snapshot = ConfigSnapshot.start()
+            snapshot.set_configmap(uas_cfg.uas_cfg, {'uai_namespace': "x"})
+            self.assertEqual(uas_cfg.get_uai_namespace(), "x")
+
+    def test_decorator(self):
+        @config_snapshot
+        def controller():
+            return ConfigSnapshot.current()
+
+        self.assertIsNone(controller())
+        with app.test_request_context('/'):
+            self.assertIsNotNone(controller())
+            self.assertIsNone(ConfigSnapshot.current())
+
+
+if __name__ == '__main__':
+    unittest.main()
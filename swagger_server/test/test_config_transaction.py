@@ -0,0 +1,215 @@
+#!/usr/bin/python3
+
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# pylint: disable=missing-docstring,too-few-public-methods
+
+import json
+import unittest
+from unittest import mock
+from swagger_server.uas_data_model.config_transaction import (
+    ConfigTransaction,
+    prefix_range_end,
+    version_key
+)
+from swagger_server.uas_data_model.uas_data_model import UASDataModel
+from swagger_server.uas_data_model.populated_config import PopulatedConfig
+from swagger_server.uas_data_model.uai_image import UAIImage
+
+
+class Meta:
+    def __init__(self, mod_revision):
+        self.mod_revision = mod_revision
+
+
+class Mod:
+    def __init__(self, key):
+        self.key = key
+
+    def __eq__(self, revision):
+        return ('mod', self.key, revision)
+
+    __hash__ = None
+
+
+class Transactions:
+    @staticmethod
+    def mod(key):
+        return Mod(key)
+
+    @staticmethod
+    def put(key, value):
+        return ('put', key, value)
+
+    @staticmethod
+    def delete(key, range_end=None):
+        return ('delete', key, range_end)
+
+
+class FakeEtcd:
+    """Just enough of an ETCD client to run transactions on.
+
+    """
+    transactions = Transactions()
+
+    def __init__(self):
+        self.data = {}
+        self.revision = 0
+        self.transactions_run = 0
+
+    def get(self, key):
+        if key not in self.data:
+            return None, None
+        value, mod_revision = self.data[key]
+        return value, Meta(mod_revision)
+
+    def bump(self, key):
+        self.revision += 1
+        self.data[key] = ("x", self.revision)
+
+    def transaction(self, compare, success, failure):
+        self.transactions_run += 1
+        for _, key, revision in compare:
+            if self.data.get(key, (None, 0))[1] != revision:
+                return False, failure
+        self.revision += 1
+        for op, key, value in success:
+            if op == 'put':
+                self.data[key] = (value, self.revision)
+            elif value is None:
+                self.data.pop(key, None)
+            else:
+                for doomed in [
+                        doomed for doomed in self.data
+                        if key <= doomed < value.decode('utf-8')
+                ]:
+                    del self.data[doomed]
+        return True, []
+
+
+class TestConfigTransaction(unittest.TestCase):
+    """Tester for atomic multi-object changes to the UAS configuration
+
+    """
+    def setUp(self):
+        self.etcd = FakeEtcd()
+        patcher = mock.patch(
+            "swagger_server.uas_data_model.config_transaction.ETCD_INSTANCE",
+            self.etcd
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_commit(self):
+        imgs = [
+            UAIImage(imagename="one", default=False),
+            UAIImage(imagename="two", default=True),
+        ]
+
+        def build(txn):
+            for img in imgs:
+                txn.put(img)
+            # Only the last write of an object counts
+            imgs[0].default = True
+            txn.put(imgs[0])
+
+        self.assertTrue(UASDataModel.transaction(build, UAIImage))
+        self.assertEqual(self.etcd.transactions_run, 1)
+        for img in imgs:
+            value, _ = self.etcd.data[
+                "%s/%s" % (UAIImage.model_prefix, img.image_id)
+            ]
+            self.assertEqual(json.loads(value)['imagename'], img.imagename)
+            self.assertTrue(json.loads(value)['default'])
+        self.assertIn(version_key(UAIImage), self.etcd.data)
+
+    def test_conflict(self):
+        attempts = []
+
+        def build(txn):
+            attempts.append(txn)
+            if len(attempts) == 1:
+                # Someone else commits a change in the meantime
+                self.etcd.bump(version_key(UAIImage))
+            txn.put(UAIImage(imagename="one"))
+
+        self.assertTrue(UASDataModel.transaction(build, UAIImage))
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(self.etcd.transactions_run, 2)
+
+        def conflicting(_txn):
+            self.etcd.bump(version_key(UAIImage))
+
+        self.assertFalse(UASDataModel.transaction(conflicting, UAIImage))
+
+    def test_remove_all(self):
+        key = "%s/image-1" % UAIImage.model_prefix
+        self.etcd.data[key] = ("{}", 1)
+        self.etcd.data["%sx" % UAIImage.model_prefix] = ("{}", 1)
+        txn = ConfigTransaction([UAIImage])
+        txn.remove_all(UAIImage)
+        self.assertTrue(txn.commit())
+        self.assertNotIn(key, self.etcd.data)
+        self.assertIn("%sx" % UAIImage.model_prefix, self.etcd.data)
+        self.assertEqual(prefix_range_end("/a/b/"), b"/a/b0")
+
+    def test_registration(self):
+        img = UAIImage(imagename="one")
+        with mock.patch.object(
+                UAIImage, '_is_registered', return_value=False
+        ), mock.patch.object(PopulatedConfig, 'put') as put:
+            txn = ConfigTransaction([UAIImage])
+            txn.put(img)
+            self.assertTrue(txn.commit())
+        # Registered in the same transaction, not by a separate write
+        put.assert_not_called()
+        self.assertEqual(self.etcd.transactions_run, 1)
+        value, _ = self.etcd.data[
+            "%s/%s" % (PopulatedConfig.model_prefix, "UAIImage")
+        ]
+        self.assertEqual(json.loads(value)['config_name'], "UAIImage")
+        self.assertIn(
+            "%s/%s" % (UAIImage.model_prefix, img.image_id), self.etcd.data
+        )
+
+    def test_error(self):
+        txn = ConfigTransaction([UAIImage])
+        txn.put(UAIImage(imagename="one"))
+        with mock.patch.object(
+                self.etcd, 'transaction', side_effect=TypeError("boom")
+        ), self.assertRaises(TypeError):
+            txn.commit()
+
+    def test_unsupported(self):
+        img = UAIImage(imagename="unsupported-image")
+        txn = ConfigTransaction([UAIImage], etcd=object())
+        txn.put(img)
+        self.assertTrue(txn.commit())
+        self.assertEqual(
+            UAIImage.get(img.image_id).imagename, "unsupported-image"
+        )
+        img.remove()
+
+
+if __name__ == '__main__':
+    unittest.main()
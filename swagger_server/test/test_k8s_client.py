@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# pylint: disable=missing-docstring
+
+import copy
+import os
+import tempfile
+import unittest
+from kubernetes.client import Configuration
+from swagger_server.uas_lib.k8s_client import (
+    ServiceAccountToken,
+    k8s_pool_maxsize
+)
+
+
+class TestK8sClient(unittest.TestCase):
+    """Tester for the shared Kubernetes client setup
+
+    """
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.path = os.path.join(self.tmpdir.name, "token")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def __write_token(self, token):
+        # Rotation replaces the file, so write a new one and rename it
+        # into place.
+        tmp_path = self.path + ".new"
+        with open(tmp_path, "w", encoding='utf-8') as token_file:
+            token_file.write(token)
+        os.replace(tmp_path, self.path)
+
+    def test_token_rotation(self):
+        self.__write_token("token-1")
+        tracker = ServiceAccountToken(self.path)
+        configuration = Configuration()
+        configuration.refresh_api_key_hook = tracker.refresh
+        self.assertEqual(
+            configuration.get_api_key_with_prefix('authorization'),
+            "bearer token-1"
+        )
+        # Copies of the configuration share the tracker
+        config_copy = copy.deepcopy(configuration)
+        self.__write_token("token-2")
+        self.assertEqual(
+            configuration.get_api_key_with_prefix('authorization'),
+            "bearer token-2"
+        )
+        self.assertEqual(
+            config_copy.get_api_key_with_prefix('authorization'),
+            "bearer token-2"
+        )
+        # A missing token file leaves the last good token in place
+        os.remove(self.path)
+        self.assertEqual(
+            configuration.get_api_key_with_prefix('authorization'),
+            "bearer token-2"
+        )
+
+    def test_pool_maxsize(self):
+        os.environ['UAS_K8S_POOL_MAXSIZE'] = "32"
+        try:
+            self.assertEqual(k8s_pool_maxsize(), 32)
+            os.environ['UAS_K8S_POOL_MAXSIZE'] = "lots"
+            self.assertEqual(k8s_pool_maxsize(), 16)
+        finally:
+            del os.environ['UAS_K8S_POOL_MAXSIZE']
+
+
+if __name__ == '__main__':
+    unittest.main()
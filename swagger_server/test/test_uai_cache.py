@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# pylint: disable=missing-docstring
+
+import unittest
+from kubernetes import client
+from swagger_server.uas_lib.uai_cache import (
+    UaiCache,
+    parse_selectors
+)
+from swagger_server.test.k8s_fixtures import make_job
+
+
+class FakeBatchV1:  # pylint: disable=too-few-public-methods
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    # pylint: disable=unused-argument
+    def list_job_for_all_namespaces(self, **kwargs):
+        return client.V1JobList(
+            items=self.jobs,
+            metadata=client.V1ListMeta(resource_version="42")
+        )
+
+
+class FakeCoreV1:
+    # pylint: disable=unused-argument
+    @staticmethod
+    def list_pod_for_all_namespaces(**kwargs):
+        return client.V1PodList(
+            items=[],
+            metadata=client.V1ListMeta(resource_version="42")
+        )
+
+    # pylint: disable=unused-argument
+    @staticmethod
+    def list_service_for_all_namespaces(**kwargs):
+        return client.V1ServiceList(
+            items=[],
+            metadata=client.V1ListMeta(resource_version="42")
+        )
+
+
+class TestUaiCache(unittest.TestCase):
+    """Tester for the UAI Cache
+
+    """
+    def setUp(self):
+        self.jobs = [
+            make_job("uai-alice-1", "user", "alice"),
+            make_job("uai-alice-2", "user", "alice", successful=1),
+            make_job("uai-bob-1", "uas", "bob"),
+        ]
+        self.cache = UaiCache(FakeCoreV1(), FakeBatchV1(self.jobs))
+        for reflector in self.cache.reflectors():
+            self.assertEqual(reflector.relist(), "42")
+
+    def test_parse_selectors(self):
+        self.assertEqual(
+            parse_selectors(["uas=managed,user==alice", "app!=x"]),
+            [
+                ('uas', '=', 'managed'),
+                ('user', '=', 'alice'),
+                ('app', '!=', 'x')
+            ]
+        )
+        self.assertEqual(parse_selectors(None), [])
+        self.assertIsNone(parse_selectors(["app"]))
+        self.assertIsNone(parse_selectors(["!app"]))
+        self.assertIsNone(parse_selectors(["app in (a,b)"]))
+
+    def test_fresh(self):
+        self.assertTrue(self.cache.fresh())
+        for staleness in self.cache.staleness().values():
+            self.assertIsNotNone(staleness)
+
+    def test_select_jobs(self):
+        names = self.cache.select_jobs(
+            labels=["uas=managed"],
+            fields=["status.successful=0"]
+        )
+        self.assertEqual(sorted(names), ["uai-alice-1", "uai-bob-1"])
+        names = self.cache.select_jobs(
+            labels=["uas=managed", "user=alice"],
+            fields=[]
+        )
+        self.assertEqual(sorted(names), ["uai-alice-1", "uai-alice-2"])
+        names = self.cache.select_jobs(
+            labels=["user!=alice"],
+            fields=["metadata.namespace=uas"]
+        )
+        self.assertEqual(names, ["uai-bob-1"])
+        # Selectors that cannot be evaluated locally
+        self.assertIsNone(
+            self.cache.select_jobs(labels=["user"], fields=[])
+        )
+        self.assertIsNone(
+            self.cache.select_jobs(labels=[], fields=["spec.nodeName=x"])
+        )
+
+    def test_get_uai_jobs(self):
+        jobs = self.cache.get_uai_jobs("uai-bob-1")
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0].metadata.namespace, "uas")
+        self.assertEqual(self.cache.get_uai_jobs("uai-nobody"), [])
+        self.assertEqual(self.cache.get_uai_pods("uai-bob-1"), [])
+        self.assertIsNone(self.cache.get_service("uas", "uai-bob-1-ssh"))
+
+    def test_relist_replaces(self):
+        del self.jobs[0]
+        self.cache.jobs.relist()
+        self.assertEqual(self.cache.get_uai_jobs("uai-alice-1"), [])
+        self.assertEqual(len(self.cache.jobs.list()), 2)
+
+
+    def test_read_your_writes(self):
+        self.cache.jobs.created(make_job("uai-carol-1", "user", "carol"))
+        self.assertEqual(
+            self.cache.select_jobs(labels=["user=carol"], fields=[]),
+            ["uai-carol-1"]
+        )
+        self.cache.jobs.removed("user", "uai-alice-1")
+        self.assertEqual(self.cache.get_uai_jobs("uai-alice-1"), [])
+        # Neither a relist nor a late update brings a deleted job back
+        self.cache.jobs.relist()
+        self.assertEqual(self.cache.get_uai_jobs("uai-alice-1"), [])
+        self.assertNotIn(
+            "uai-alice-1",
+            self.cache.select_jobs(labels=["user=alice"], fields=[])
+        )
+
+if __name__ == '__main__':
+    unittest.main()
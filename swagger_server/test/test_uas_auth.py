@@ -24,16 +24,28 @@
 #
 # pylint: disable=missing-docstring
 
+import base64
 import json
+import threading
+import time
 import unittest
 from unittest import mock
 
 import requests
 import werkzeug
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
 
-from swagger_server.uas_lib.uas_auth import UasAuth
+from swagger_server.uas_lib.uas_auth import (
+    UasAuth,
+    UserinfoCache,
+    token_expiry
+)
+from swagger_server.uas_lib import uas_metrics
+from swagger_server.uas_lib.uas_jwt import JwksCache
 
 host = 'shasta.grapenehi.dev.cray.com'  # pylint: disable=invalid-name
+issuer = 'https://api-gw-service-nmn.local/keycloak/realms/shasta'  # pylint: disable=invalid-name
 
 class TestUasAuth(unittest.TestCase):
     """Tester for the UasAuth Class
@@ -100,7 +112,7 @@ class TestUasAuth(unittest.TestCase):
 
 
 @mock.patch("swagger_server.uas_lib.uas_auth.UAS_AUTH_LOGGER")
-@mock.patch("swagger_server.uas_lib.uas_auth.requests.post")
+@mock.patch("swagger_server.uas_lib.uas_auth.KEYCLOAK.post")
 class TestKeycloakErrorLogging(unittest.TestCase):
     """ Keycloak error logging tester class """
     def test_timeout(self, mock_post, mock_logger):
@@ -224,5 +236,277 @@ class TestKeycloakErrorLogging(unittest.TestCase):
         )
 
 
+class TestUserinfoCache(unittest.TestCase):
+    """Tester for the Keycloak user information cache
+
+    """
+    userinfo = {'preferred_username': "hal"}
+
+    @staticmethod
+    def jwt(exp):
+        payload = base64.urlsafe_b64encode(
+            json.dumps({'exp': exp}).encode('utf-8')
+        ).decode('utf-8').rstrip('=')
+        return "Bearer header.%s.signature" % payload
+
+    def setUp(self):
+        UserinfoCache.get_instance().reset()
+        self.addCleanup(UserinfoCache.get_instance().reset)
+        patcher = mock.patch(
+            "swagger_server.uas_lib.uas_auth.KEYCLOAK.post"
+        )
+        self.post = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.post.return_value.json.return_value = self.userinfo
+
+    def test_token_expiry(self):
+        self.assertEqual(token_expiry(self.jwt(1234)), 1234.0)
+        self.assertIsNone(token_expiry("Bearer opaque"))
+        self.assertIsNone(token_expiry(None))
+
+    def test_cached(self):
+        auth = UasAuth()
+        token = self.jwt(time.time() + 3600)
+        before = uas_metrics.get_metrics()
+        for _ in range(3):
+            self.assertEqual(auth.userinfo(host, token), self.userinfo)
+        self.assertEqual(self.post.call_count, 1)
+        after = uas_metrics.get_metrics()
+        self.assertEqual(
+            after['userinfo_cache_hits'] -
+            before.get('userinfo_cache_hits', 0),
+            2
+        )
+        self.assertEqual(
+            after['userinfo_cache_misses'] -
+            before.get('userinfo_cache_misses', 0),
+            1
+        )
+        # A different token is looked up
+        auth.userinfo(host, self.jwt(time.time() + 3601))
+        self.assertEqual(self.post.call_count, 2)
+
+    def test_expired_token(self):
+        auth = UasAuth()
+        token = self.jwt(time.time() - 1)
+        auth.userinfo(host, token)
+        auth.userinfo(host, token)
+        self.assertEqual(self.post.call_count, 2)
+
+    def test_ttl(self):
+        auth = UasAuth()
+        with mock.patch.dict('os.environ', {'UAS_USERINFO_CACHE_TTL': "0"}):
+            auth.userinfo(host, "Bearer opaque")
+            auth.userinfo(host, "Bearer opaque")
+        self.assertEqual(self.post.call_count, 2)
+
+    def test_single_flight(self):
+        auth = UasAuth()
+        release = threading.Event()
+
+        def slow_post(*_args, **_kwargs):
+            release.wait(5)
+            return mock.DEFAULT
+
+        self.post.side_effect = slow_post
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(
+                    auth.userinfo(host, "Bearer opaque")
+                )
+            )
+            for _ in range(4)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [self.userinfo] * 4)
+        self.assertEqual(self.post.call_count, 1)
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('utf-8').rstrip('=')
+
+
+class TestTokenUserinfo(unittest.TestCase):
+    """Tester for taking user information from locally verified tokens
+
+    """
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    claims = dict(
+        TestUasAuth.userinfo, iss=issuer, typ="Bearer", azp="shasta"
+    )
+
+    @classmethod
+    def jwk(cls, kid):
+        numbers = cls.key.public_key().public_numbers()
+        return {
+            'kid': kid,
+            'kty': "RSA",
+            'alg': "RS256",
+            'use': "sig",
+            'n': b64encode(numbers.n.to_bytes(256, 'big')),
+            'e': b64encode(numbers.e.to_bytes(3, 'big')),
+        }
+
+    @classmethod
+    def jwt(cls, claims, kid="key-1"):
+        signing_input = "%s.%s" % (
+            b64encode(json.dumps({'alg': "RS256", 'kid': kid}).encode()),
+            b64encode(json.dumps(claims).encode())
+        )
+        signature = cls.key.sign(
+            signing_input.encode(), padding.PKCS1v15(), hashes.SHA256()
+        )
+        return "Bearer %s.%s" % (signing_input, b64encode(signature))
+
+    def setUp(self):
+        JwksCache.get_instance().reset()
+        UserinfoCache.get_instance().reset()
+        self.claims['exp'] = time.time() + 300
+        patcher = mock.patch.dict('os.environ', {
+            'UAS_AUTH_MODE': "jwt",
+            'UAS_JWT_ISSUER': issuer
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("swagger_server.uas_lib.uas_jwt.KEYCLOAK.get")
+        self.get = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.get.return_value.json.return_value = {
+            'keys': [self.jwk("key-1")]
+        }
+        patcher = mock.patch("swagger_server.uas_lib.uas_auth.KEYCLOAK.post")
+        self.post = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.post.return_value.json.return_value = TestUasAuth.userinfo
+
+    def test_verified(self):
+        auth = UasAuth()
+        for _ in range(2):
+            userinfo = auth.userinfo(host, self.jwt(self.claims))
+            self.assertTrue(auth.validUserinfo(userinfo))
+            self.assertEqual(
+                auth.createPasswd(userinfo),
+                auth.createPasswd(TestUasAuth.userinfo)
+            )
+        self.assertEqual(self.get.call_count, 1)
+        # The keys come from the configured realm, whatever the Host
+        # of the request.
+        auth.userinfo("attacker.example.com", self.jwt(self.claims))
+        self.assertEqual(self.get.call_count, 1)
+        self.assertEqual(
+            self.get.call_args[0][0],
+            issuer + "/protocol/openid-connect/certs"
+        )
+        self.post.assert_not_called()
+
+    def test_claims_checked(self):
+        auth = UasAuth()
+        rejected = [
+            dict(self.claims, iss="https://other.example.com/realms/x"),
+            dict(self.claims, typ="ID"),
+            dict(self.claims, azp="other-client"),
+        ]
+        for claims in rejected:
+            auth.userinfo(host, self.jwt(claims))
+        self.assertEqual(self.post.call_count, len(rejected))
+        # Issued for (rather than to) a configured client is fine
+        accepted = dict(self.claims, azp="other-client", aud=["shasta"])
+        auth.userinfo(host, self.jwt(accepted))
+        self.assertEqual(self.post.call_count, len(rejected))
+
+    def test_no_issuer(self):
+        auth = UasAuth()
+        with mock.patch.dict('os.environ', {'UAS_JWT_ISSUER': ""}):
+            auth.userinfo(host, self.jwt(self.claims))
+        self.get.assert_not_called()
+        self.post.assert_called_once()
+
+    def test_single_realm(self):
+        cache = JwksCache.get_instance()
+        auth = UasAuth()
+        auth.userinfo(host, self.jwt(self.claims))
+        with mock.patch.dict('os.environ', {
+                'UAS_JWKS_URL': "https://keys.local/certs"
+        }):
+            auth.userinfo(host, self.jwt(self.claims))
+        self.assertEqual(self.get.call_count, 2)
+        self.assertEqual(cache.url, "https://keys.local/certs")
+        self.assertEqual(list(cache.keys), ["key-1"])
+
+    def test_kid_miss(self):
+        auth = UasAuth()
+        auth.userinfo(host, self.jwt(self.claims))
+        self.get.return_value.json.return_value = {
+            'keys': [self.jwk("key-1"), self.jwk("key-2")]
+        }
+        with mock.patch("swagger_server.uas_lib.uas_jwt.time.monotonic",
+                        return_value=time.monotonic() + 60):
+            auth.userinfo(host, self.jwt(self.claims, kid="key-2"))
+        self.assertEqual(self.get.call_count, 2)
+        self.post.assert_not_called()
+        # Unknown keys do not cause the JWKS to be retrieved again right
+        # away.
+        auth.userinfo(host, self.jwt(self.claims, kid="key-3"))
+        self.assertEqual(self.get.call_count, 2)
+        self.post.assert_called_once()
+
+    def test_jwks_single_fetch(self):
+        cache = JwksCache.get_instance()
+        started = threading.Event()
+        release = threading.Event()
+        fetch = JwksCache.fetch
+
+        def slow_fetch(url, cacert):
+            # Keys are retrieved without holding the cache lock
+            self.assertFalse(cache.lock.locked())
+            started.set()
+            release.wait(timeout=10)
+            return fetch(url, cacert)
+
+        url = issuer + "/protocol/openid-connect/certs"
+        with mock.patch.object(JwksCache, 'fetch', side_effect=slow_fetch):
+            results = []
+            threads = [
+                threading.Thread(
+                    target=lambda: results.append(
+                        cache.get_key(url, None, "key-1")
+                    )
+                )
+                for _ in range(3)
+            ]
+            threads[0].start()
+            self.assertTrue(started.wait(timeout=10))
+            for thread in threads[1:]:
+                thread.start()
+            release.set()
+            for thread in threads:
+                thread.join(timeout=10)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(key is not None for key in results))
+        self.assertEqual(self.get.call_count, 1)
+
+    def test_fallback(self):
+        auth = UasAuth()
+        claims = dict(self.claims)
+        del claims['uidNumber']
+        auth.userinfo(host, self.jwt(claims))
+        self.assertEqual(self.post.call_count, 1)
+        expired = dict(self.claims, exp=time.time() - 300)
+        auth.userinfo(host, self.jwt(expired))
+        self.assertEqual(self.post.call_count, 2)
+        token = self.jwt(self.claims)
+        forged = token[:-10] + ("A" * 10 if token[-10:] != "A" * 10 else "B" * 10)
+        auth.userinfo(host, forged)
+        self.assertEqual(self.post.call_count, 3)
+        auth.userinfo(host, "Bearer opaque")
+        self.assertEqual(self.post.call_count, 4)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,542 @@
+#!/usr/bin/python3
+
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# pylint: disable=missing-docstring
+
+import unittest
+from unittest import mock
+import os
+import time
+import threading
+import json
+from datetime import datetime, timezone, timedelta
+import werkzeug
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+from swagger_server.uas_lib.uas_mgr import UasManager
+from swagger_server.uas_lib.uas_parallel import parallel_map
+from swagger_server.uas_lib.uai_namespaces import (
+    ManagedNamespaces,
+    NAMESPACE_RETRY_INTERVAL
+)
+from swagger_server.uas_lib.uai_cache import UaiCache
+from swagger_server.uas_data_model.uai_class import UAIClass
+from swagger_server.test.k8s_fixtures import (
+    app,
+    make_job,
+    make_uai_pod,
+    make_uai_service,
+    mock_uai_mgr,
+    wait_for_uai
+)
+
+
+class TestUasBase(unittest.TestCase):
+    """Tester for the Kubernetes side of the UasBase Class
+
+    """
+    os.environ["KUBERNETES_SERVICE_PORT"] = "443"
+    os.environ["KUBERNETES_SERVICE_HOST"] = "127.0.0.1"
+    with app.test_request_context('/'):
+        uas_mgr = UasManager()
+
+    # pylint: disable=missing-docstring
+    def test_list_uai_objects(self):
+        uai_mgr, api, _ = mock_uai_mgr(namespaces=["user", "uas"])
+        api.list_namespaced_pod.side_effect = (
+            lambda namespace, **_kwargs: client.V1PodList(
+                items=[make_uai_pod("uai-a", namespace)]
+            )
+        )
+        pods = uai_mgr.list_uai_objects("pod", label_selector="uas=managed")
+        self.assertEqual(
+            sorted(pod.metadata.namespace for pod in pods),
+            ["uas", "user"]
+        )
+        api.list_pod_for_all_namespaces.assert_not_called()
+        # Cluster-wide fallback
+        api.list_pod_for_all_namespaces.return_value = (
+            client.V1PodList(items=[make_uai_pod("uai-b")])
+        )
+        os.environ['UAS_K8S_NAMESPACED_QUERIES'] = "false"
+        try:
+            pods = uai_mgr.list_uai_objects(
+                "pod", label_selector="uas=managed"
+            )
+        finally:
+            del os.environ['UAS_K8S_NAMESPACED_QUERIES']
+        self.assertEqual(pods[0].metadata.name, "uai-b-abcde")
+
+    # pylint: disable=missing-docstring
+    def test_get_uai_namespaces(self):
+        uai_class = UAIClass(namespace="class-ns", image_id="image")
+        uai_class.put()
+        try:
+            namespaces = self.uas_mgr.uas_cfg.get_uai_namespaces()
+        finally:
+            uai_class.remove()
+        self.assertIn("class-ns", namespaces)
+        self.assertIn("uas", namespaces)
+        self.assertIn(self.uas_mgr.uas_cfg.get_uai_namespace(), namespaces)
+
+    # pylint: disable=missing-docstring
+    def test_managed_namespaces(self):
+        uai_mgr, api, batch_v1 = mock_uai_mgr()
+        batch_v1.api_client.call_api.return_value.data = json.dumps(
+            {
+                'items': [
+                    {'metadata': {'name': "uai-a", 'namespace': "old-ns"}},
+                ]
+            }
+        ).encode('utf-8')
+        uai_mgr.managed_namespaces = ManagedNamespaces(batch_v1, "x")
+        api.list_namespaced_pod.return_value = client.V1PodList(items=[])
+        uai_mgr.list_uai_objects("pod", label_selector="uas=managed")
+        # UAIs left in a namespace no class uses any more are found
+        self.assertEqual(
+            sorted(
+                args[0]
+                for args, _ in api.list_namespaced_pod.call_args_list
+            ),
+            ["old-ns", "user"]
+        )
+        # Checked once in a while, not on every listing
+        uai_mgr.managed_namespaces.add("new-ns")
+        self.assertEqual(uai_mgr.uai_namespaces(), ["new-ns", "old-ns", "user"])
+        self.assertEqual(batch_v1.api_client.call_api.call_count, 1)
+        # A failed check keeps what was found before and is retried
+        # soon rather than after the full refresh interval
+        namespaces = uai_mgr.managed_namespaces
+        batch_v1.api_client.call_api.side_effect = ApiException(status=500)
+        namespaces.refresh()
+        self.assertEqual(
+            uai_mgr.uai_namespaces(), ["new-ns", "old-ns", "user"]
+        )
+        self.assertLessEqual(
+            namespaces.expires - time.monotonic(), NAMESPACE_RETRY_INTERVAL
+        )
+        self.assertFalse(namespaces.refreshing)
+        # Once due, the check is made in the background
+        batch_v1.api_client.call_api.side_effect = None
+        namespaces.expires = 0
+        checked = threading.Event()
+        refresh = namespaces.refresh
+
+        def background_refresh():
+            refresh()
+            checked.set()
+
+        with mock.patch.object(namespaces, "refresh", background_refresh):
+            uai_mgr.uai_namespaces()
+            self.assertTrue(checked.wait(timeout=10))
+        self.assertEqual(batch_v1.api_client.call_api.call_count, 3)
+        self.assertEqual(uai_mgr.uai_namespaces(), ["old-ns", "user"])
+
+    # pylint: disable=missing-docstring
+    def test_get_uai_list_batched(self):
+        pods = [make_uai_pod("uai-a"), make_uai_pod("uai-b")]
+        services = [make_uai_service("uai-a")]
+        uai_mgr, api, _ = mock_uai_mgr()
+        api.list_namespaced_pod.return_value = (
+            client.V1PodList(items=pods)
+        )
+        api.list_namespaced_service.return_value = (
+            client.V1ServiceList(items=services)
+        )
+        uais = uai_mgr.get_uai_list(["uai-a", "uai-b", "uai-missing"])
+        self.assertEqual(
+            [uai.uai_name for uai in uais],
+            ["uai-a", "uai-b"]
+        )
+        self.assertEqual(uais[0].uai_ip, "10.0.0.1")
+        self.assertEqual(uais[0].uai_port, 30123)
+        self.assertEqual(uais[0].uai_status, "Pending")
+        self.assertIsNone(uais[1].uai_port)
+        # One pod list and one service list regardless of UAI count
+        self.assertEqual(api.list_namespaced_pod.call_count, 1)
+        self.assertEqual(api.list_namespaced_service.call_count, 1)
+        api.list_pod_for_all_namespaces.assert_not_called()
+        api.read_namespaced_service.assert_not_called()
+        self.assertEqual(uai_mgr.get_uai_list([]), [])
+
+    # pylint: disable=missing-docstring
+    def test_select_jobs_metadata_only(self):
+        uai_mgr, _, batch_v1 = mock_uai_mgr()
+        call_api = batch_v1.api_client.call_api
+        call_api.return_value.data = json.dumps(
+            {
+                'kind': "PartialObjectMetadataList",
+                'apiVersion': "meta.k8s.io/v1",
+                'items': [
+                    {'metadata': {'name': "uai-a", 'namespace': "user"}},
+                    {'metadata': {'name': "uai-b", 'namespace': "user"}}
+                ]
+            }
+        ).encode('utf-8')
+        names = uai_mgr.select_jobs(labels=["user=test-user"])
+        self.assertEqual(names, ["uai-a", "uai-b"])
+        args, kwargs = call_api.call_args
+        self.assertEqual(args[0], '/apis/batch/v1/namespaces/user/jobs')
+        self.assertIn(
+            ('labelSelector', "user=test-user,uas=managed"), args[3]
+        )
+        self.assertIn(('fieldSelector', "status.successful=0"), args[3])
+        self.assertIn("as=PartialObjectMetadataList", args[4]['Accept'])
+        self.assertFalse(kwargs['_preload_content'])
+        batch_v1.list_job_for_all_namespaces.assert_not_called()
+        call_api.return_value.data = b'{"items": null}'
+        self.assertEqual(uai_mgr.select_jobs(), [])
+
+    # pylint: disable=missing-docstring
+    def test_compose_uai_dict(self):
+        uai_mgr, _, _ = mock_uai_mgr()
+        sanitize = client.ApiClient().sanitize_for_serialization
+        running = make_uai_pod("uai-run")
+        running.status = client.V1PodStatus(
+            phase='Running',
+            start_time=datetime.now(timezone.utc) - timedelta(hours=2),
+            conditions=[
+                client.V1PodCondition(
+                    type='Ready', status='False', message="not yet"
+                )
+            ],
+            container_statuses=[
+                client.V1ContainerStatus(
+                    name="uai-run",
+                    image="my-image",
+                    image_id="",
+                    ready=False,
+                    restart_count=0,
+                    state=client.V1ContainerState(
+                        running=client.V1ContainerStateRunning()
+                    )
+                )
+            ]
+        )
+        srv = make_uai_service("uai-run")
+        for pod, service in [
+                (running, srv),
+                (running, None),
+                (make_uai_pod("uai-pend"), None)
+        ]:
+            expected = uai_mgr.compose_uai(pod, service)
+            actual = uai_mgr.compose_uai_dict(
+                sanitize(pod),
+                sanitize(service) if service is not None else None
+            )
+            self.assertEqual(expected.to_dict(), actual.to_dict())
+
+    # pylint: disable=missing-docstring
+    def test_get_uai_list_raw(self):
+        sanitize = client.ApiClient().sanitize_for_serialization
+        pods = [make_uai_pod("uai-a"), make_uai_pod("uai-b")]
+        services = [make_uai_service("uai-a")]
+        uai_mgr, api, _ = mock_uai_mgr()
+        api.list_namespaced_pod.return_value.data = (
+            json.dumps({'items': sanitize(pods)}).encode('utf-8')
+        )
+        api.list_namespaced_service.return_value.data = (
+            json.dumps({'items': sanitize(services)}).encode('utf-8')
+        )
+        os.environ['UAS_K8S_RAW_DECODE'] = "true"
+        try:
+            uais = uai_mgr.get_uai_list(["uai-a", "uai-b"])
+        finally:
+            del os.environ['UAS_K8S_RAW_DECODE']
+        self.assertEqual([uai.uai_name for uai in uais], ["uai-a", "uai-b"])
+        self.assertEqual(uais[0].uai_port, 30123)
+        _, kwargs = api.list_namespaced_pod.call_args
+        self.assertFalse(kwargs['_preload_content'])
+
+    # pylint: disable=missing-docstring
+    def test_wait_for_uai_ip(self):
+        pod = make_uai_pod("uai-w")
+        pending = make_uai_service("uai-w")
+        pending.spec.cluster_ip = None
+        ready = make_uai_service("uai-w")
+        uai_mgr, api, _ = mock_uai_mgr()
+        uai_mgr.remove_uais = mock.Mock()
+        uai = wait_for_uai(
+            uai_mgr,
+            {
+                'pods': [{'type': 'ADDED', 'object': pod}],
+                'services': [
+                    {'type': 'ADDED', 'object': pending},
+                    {'type': 'MODIFIED', 'object': ready},
+                ],
+            }
+        )
+        self.assertEqual(uai.uai_name, "uai-w")
+        self.assertEqual(uai.uai_ip, "10.0.0.1")
+        api.list_pod_for_all_namespaces.assert_not_called()
+        api.read_namespaced_service.assert_not_called()
+        uai_mgr.remove_uais.assert_not_called()
+        # The watch responses are closed once the wait is over
+        for list_func in (
+                api.list_namespaced_pod,
+                api.list_namespaced_service,
+                api.list_namespaced_event
+        ):
+            list_func.return_value.close.assert_called()
+            list_func.return_value.release_conn.assert_called()
+
+        # No IP before the deadline is a 504
+        with self.assertRaises(werkzeug.exceptions.GatewayTimeout):
+            wait_for_uai(
+                uai_mgr,
+                {
+                    'pods': [{'type': 'ADDED', 'object': pod}],
+                    'services': [{'type': 'ADDED', 'object': pending}],
+                },
+                timeout=1
+            )
+
+    # pylint: disable=missing-docstring
+    def test_wait_for_doomed_uai(self):
+        pod = make_uai_pod("uai-w")
+        pod.status.container_statuses = [
+            client.V1ContainerStatus(
+                name="uai-w",
+                image="my-image",
+                image_id="",
+                ready=False,
+                restart_count=0,
+                state=client.V1ContainerState(
+                    waiting=client.V1ContainerStateWaiting(
+                        reason="ImagePullBackOff",
+                        message="Back-off pulling image"
+                    )
+                )
+            )
+        ]
+        pending = make_uai_service("uai-w")
+        pending.spec.cluster_ip = None
+        uai_mgr, api, batch_v1 = mock_uai_mgr()
+        with self.assertRaises(werkzeug.exceptions.BadRequest) as ctx:
+            wait_for_uai(
+                uai_mgr,
+                {
+                    'pods': [{'type': 'ADDED', 'object': pod}],
+                    'services': [{'type': 'ADDED', 'object': pending}],
+                }
+            )
+        self.assertIn("ImagePullBackOff", ctx.exception.description)
+        self.assertIn("(UAI uai-w removed)", ctx.exception.description)
+        # Removed directly in the namespace it was created in
+        _, kwargs = api.delete_namespaced_service.call_args
+        self.assertEqual(kwargs['name'], "uai-w-ssh")
+        self.assertEqual(kwargs['namespace'], "user")
+        _, kwargs = batch_v1.delete_namespaced_job.call_args
+        self.assertEqual(kwargs['name'], "uai-w")
+        self.assertEqual(kwargs['namespace'], "user")
+
+        quota_event = client.V1Event(
+            metadata=client.V1ObjectMeta(name="uai-w.1"),
+            involved_object=client.V1ObjectReference(
+                kind="Job", name="uai-w"
+            ),
+            type="Warning",
+            reason="FailedCreate",
+            message="pods is forbidden: exceeded quota: user-quota"
+        )
+        # Not claimed to be removed if removing it fails
+        uai_mgr, _, batch_v1 = mock_uai_mgr()
+        batch_v1.delete_namespaced_job.side_effect = ApiException(
+            status=500, reason="Internal Server Error"
+        )
+        with self.assertRaises(
+                werkzeug.exceptions.ServiceUnavailable
+        ) as ctx:
+            wait_for_uai(
+                uai_mgr,
+                {'events': [{'type': 'ADDED', 'object': quota_event}]}
+            )
+        self.assertIn("exceeded quota", ctx.exception.description)
+        self.assertNotIn("removed", ctx.exception.description)
+        batch_v1.delete_namespaced_job.assert_called_once()
+
+    # pylint: disable=missing-docstring
+    def test_remove_uais_by_selector(self):
+        uai_mgr, api, batch_v1 = mock_uai_mgr()
+        batch_v1.api_client.call_api.return_value.data = json.dumps(
+            {
+                'items': [
+                    {'metadata': {'name': "uai-a", 'namespace': "user"}},
+                    {'metadata': {'name': "uai-b", 'namespace': "user"}},
+                    {'metadata': {'name': "uai-c", 'namespace': "uas"}},
+                ]
+            }
+        ).encode('utf-8')
+        deleted = {
+            'user': {'kind': "JobList", 'items': [
+                {'metadata': {'name': "uai-a"}},
+                {'metadata': {'name': "uai-late"}},
+            ]},
+            'uas': {'kind': "Status"},
+        }
+
+        def delete_collection(namespace, **_kwargs):
+            ret = mock.Mock()
+            ret.data = json.dumps(deleted[namespace]).encode('utf-8')
+            return ret
+
+        batch_v1.delete_collection_namespaced_job.side_effect = (
+            delete_collection
+        )
+
+        def delete_service(name, namespace, **_kwargs):
+            if name == "uai-b-ssh":
+                raise ApiException(status=404)
+            return mock.Mock(name="%s/%s" % (namespace, name))
+
+        api.delete_namespaced_service.side_effect = delete_service
+        resp = uai_mgr.remove_uais_by_selector(labels=["user=someone"])
+        self.assertEqual(
+            resp,
+            [
+                "Successfully deleted uai-a",
+                "Failed to delete uai-b - Not found",
+                "Successfully deleted uai-c",
+            ]
+        )
+        # One collection delete per namespace, no per-UAI job deletes
+        self.assertEqual(
+            batch_v1.delete_collection_namespaced_job.call_count, 2
+        )
+        batch_v1.delete_namespaced_job.assert_not_called()
+        _, kwargs = (
+            batch_v1.delete_collection_namespaced_job.call_args
+        )
+        self.assertEqual(
+            kwargs['label_selector'], "user=someone,uas=managed"
+        )
+        self.assertEqual(kwargs['field_selector'], "status.successful=0")
+        # The job that matched only at deletion time loses its service too
+        deleted_services = [
+            call[1]['name']
+            for call in api.delete_namespaced_service.call_args_list
+        ]
+        self.assertEqual(
+            sorted(deleted_services),
+            ["uai-a-ssh", "uai-b-ssh", "uai-c-ssh", "uai-late-ssh"]
+        )
+
+    # pylint: disable=missing-docstring
+    def test_remove_uais_concurrent(self):
+        uai_mgr, _, batch_v1 = mock_uai_mgr()
+        batch_v1.api_client.call_api.return_value.data = json.dumps(
+            {
+                'items': [
+                    {'metadata': {'name': "uai-a", 'namespace': "user"}},
+                    {'metadata': {'name': "uai-b", 'namespace': "user"}},
+                ]
+            }
+        ).encode('utf-8')
+        resp = uai_mgr.remove_uais(["uai-a", "uai-missing", "uai-b"])
+        self.assertEqual(
+            resp,
+            ["Successfully deleted uai-a", "Successfully deleted uai-b"]
+        )
+        # A single listing to find all of the namespaces
+        self.assertEqual(batch_v1.api_client.call_api.call_count, 1)
+        self.assertEqual(batch_v1.delete_namespaced_job.call_count, 2)
+
+    # pylint: disable=missing-docstring
+    def test_create_uai_objects(self):
+        uai_mgr, api, batch_v1 = mock_uai_mgr()
+        job = client.V1Job(metadata=client.V1ObjectMeta(name="uai-a"))
+        svc = client.V1Service(metadata=client.V1ObjectMeta(name="uai-a-ssh"))
+        # Already existing objects count as created, nothing is read
+        api.create_namespaced_service.side_effect = ApiException(
+            status=409, reason="AlreadyExists"
+        )
+        uai_mgr.create_uai_objects(job, "uai-a-ssh", svc, "user")
+        batch_v1.create_namespaced_job.assert_called_once_with(
+            body=job, namespace="user"
+        )
+        batch_v1.read_namespaced_job.assert_not_called()
+        api.read_namespaced_service.assert_not_called()
+        batch_v1.delete_namespaced_job.assert_not_called()
+        # A failure to create either removes what was created by this
+        # call, and nothing else
+        api.create_namespaced_service.side_effect = ApiException(
+            status=403, reason="Forbidden"
+        )
+        with self.assertRaises(werkzeug.exceptions.Forbidden) as ctx:
+            uai_mgr.create_uai_objects(job, "uai-a-ssh", svc, "user")
+        self.assertIn("service uai-a-ssh", ctx.exception.description)
+        self.assertEqual(
+            batch_v1.delete_namespaced_job.call_args[1]['name'],
+            "uai-a"
+        )
+        api.delete_namespaced_service.assert_not_called()
+        # An object that already existed is left alone
+        batch_v1.reset_mock()
+        batch_v1.create_namespaced_job.side_effect = ApiException(
+            status=409, reason="AlreadyExists"
+        )
+        with self.assertRaises(werkzeug.exceptions.Forbidden):
+            uai_mgr.create_uai_objects(job, "uai-a-ssh", svc, "user")
+        batch_v1.delete_namespaced_job.assert_not_called()
+        api.delete_namespaced_service.assert_not_called()
+
+    # pylint: disable=missing-docstring
+    def test_cache_writes(self):
+        uai_mgr, api, batch_v1 = mock_uai_mgr()
+        uai_mgr.uai_cache = UaiCache(api, batch_v1)
+        job = make_job("uai-a", "user", "alice")
+        svc = make_uai_service("uai-a")
+        batch_v1.create_namespaced_job.return_value = job
+        api.create_namespaced_service.return_value = svc
+        uai_mgr.create_uai_objects(job, "uai-a-ssh", svc, "user")
+        # Seen right away, without waiting for the watch
+        self.assertEqual(uai_mgr.uai_cache.get_uai_jobs("uai-a"), [job])
+        self.assertIs(
+            uai_mgr.uai_cache.get_service("user", "uai-a-ssh"), svc
+        )
+        uai_mgr.delete_service("uai-a-ssh", "user")
+        uai_mgr.delete_job("uai-a", "user")
+        self.assertEqual(uai_mgr.uai_cache.get_uai_jobs("uai-a"), [])
+        self.assertIsNone(uai_mgr.uai_cache.get_service("user", "uai-a-ssh"))
+
+    # pylint: disable=missing-docstring
+    def test_parallel_map(self):
+        self.assertEqual(
+            parallel_map(lambda item: item * 2, range(20), max_workers=4),
+            [item * 2 for item in range(20)]
+        )
+        self.assertEqual(parallel_map(lambda item: item, []), [])
+
+        def fail_on_odd(item):
+            if item % 2:
+                raise ValueError(item)
+            return item
+
+        with self.assertRaises(ValueError) as ctx:
+            parallel_map(fail_on_odd, range(6))
+        self.assertEqual(ctx.exception.args, (1,))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,16 +25,24 @@
 
 import os
 import json
+import copy
+import tempfile
+import time
 import unittest
+from unittest import mock
 import yaml
 import requests_mock
 from kubernetes import client
 import werkzeug
-from swagger_server.uas_lib.uas_cfg import UasCfg
+from swagger_server.uas_lib.uas_cfg import UasCfg, thaw
+from swagger_server.uas_lib.sls_networks import SlsNetworks
+from swagger_server.uas_lib import uas_metrics
 from swagger_server.uas_lib.uai_instance import UAIInstance
 from swagger_server.uas_data_model.uai_volume import UAIVolume
 from swagger_server.uas_data_model.uai_image import UAIImage
 from swagger_server.uas_data_model.populated_config import PopulatedConfig
+from swagger_server.uas_data_model.config_replica import ConfigReplica
+from swagger_server.test.test_config_replica import PREFIX, FakeEtcd
 from swagger_server.uas_data_model.uas_data_model import ExpandableStub
 
 
@@ -91,6 +99,75 @@ class TestUasCfg(unittest.TestCase):
         _ = self.uas_cfg_svc.get_config()
         self.__reset_runtime_config()
 
+    # pylint: disable=missing-docstring,unused-argument
+    def test_get_config_cached(self, mocker):
+        self.__reset_runtime_config()
+        cfg = self.uas_cfg.get_config()
+        self.assertIs(self.uas_cfg.get_config(), cfg)
+        with self.assertRaises(TypeError):
+            cfg['uas_ports'] = [22]
+        with self.assertRaises(TypeError):
+            cfg.update({'uas_ports': [22]})
+        self.assertIsInstance(cfg['uas_ports'], tuple)
+        # Copies can be modified
+        cfg_copy = copy.deepcopy(cfg)
+        cfg_copy['uas_ports'].append(22)
+        self.assertEqual(thaw(cfg), json.loads(json.dumps(cfg)))
+        self.assertNotEqual(thaw(cfg), cfg_copy)
+        self.__reset_runtime_config()
+
+    # pylint: disable=missing-docstring,unused-argument
+    def test_get_config_reload(self, mocker):
+        self.__reset_runtime_config()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # Imitate a Kubernetes ConfigMap volume, which is updated by
+            # swapping the '..data' symlink to a new directory.
+            path = os.path.join(tmpdir, "cray-uas-mgr.yaml")
+            os.symlink(os.path.join("..data", "cray-uas-mgr.yaml"), path)
+
+            def update(version, namespace):
+                target = os.path.join(tmpdir, "..%d" % version)
+                os.mkdir(target)
+                with open(
+                        os.path.join(target, "cray-uas-mgr.yaml"),
+                        "w",
+                        encoding='utf-8'
+                ) as cfg_file:
+                    yaml.dump({'uai_namespace': namespace}, cfg_file)
+                link = os.path.join(tmpdir, "..data_tmp")
+                os.symlink(target, link)
+                os.replace(link, os.path.join(tmpdir, "..data"))
+
+            uas_cfg = UasCfg(uas_cfg=path)
+            update(1, "first")
+            self.assertEqual(uas_cfg.get_uai_namespace(), "first")
+            cfg = uas_cfg.get_config()
+            self.assertIs(uas_cfg.get_config(), cfg)
+            update(2, "second")
+            self.assertEqual(uas_cfg.get_uai_namespace(), "second")
+            self.assertIsNot(uas_cfg.get_config(), cfg)
+        self.__reset_runtime_config()
+
+    # pylint: disable=missing-docstring,unused-argument
+    def test_get_config_bootstrap_registered(self, mocker):
+        self.__reset_runtime_config(self.uas_cfg)
+        vols = UAIVolume.get_all()
+        self.assertTrue(vols)
+        # Tables that are still registered are not seeded again, even
+        # if their contents have been removed.
+        for vol in vols:
+            vol.remove()
+        self.uas_cfg.get_config()
+        self.assertEqual(UAIVolume.get_all(), [])
+        # Removing the table registrations (as a factory reset in any
+        # UAS Manager replica does) makes the next lookup seed the
+        # tables again.
+        for cfg in PopulatedConfig.get_all():
+            cfg.remove()
+        self.uas_cfg.get_config()
+        self.assertEqual(len(UAIVolume.get_all()), len(vols))
+        self.__reset_runtime_config()
+
     # pylint: disable=missing-docstring,unused-argument
     def test_get_images(self, mocker):
         self.__reset_runtime_config(self.uas_cfg)
@@ -245,6 +322,14 @@ class TestUasCfg(unittest.TestCase):
             service=True
         )
         self.assertEqual(1, len(self.uas_cfg.gen_port_list()))
+        # Optional ports must not stick to the (shared) configuration
+        for _ in range(2):
+            port_list = self.uas_cfg.gen_port_list(
+                service_type="ssh",
+                service=False,
+                opt_ports=[80]
+            )
+            self.assertEqual(2, len(port_list))
         self.__reset_runtime_config()
 
     # pylint: disable=missing-docstring,unused-argument
@@ -344,6 +429,7 @@ class TestUasCfg(unittest.TestCase):
                 text=json.dumps(networks),
                 status_code=200
             )
+            SlsNetworks.get_instance().reset()
             if expected_pool is None:
                 with self.assertRaises(werkzeug.exceptions.BadRequest):
                     svc_type = self.uas_cfg_svc_customer_access.get_svc_type(
@@ -374,6 +460,39 @@ class TestUasCfg(unittest.TestCase):
         os.environ['REQUIRE_BICAN'] = "True" # use weird case to test lower
         self.__get_service_types_bican(mocker)
 
+    # pylint: disable=missing-docstring
+    def test_sls_networks_cache(self, mocker):
+        networks = [{'Name': "BICAN"}]
+        mocker.get(
+            "http://cray-sls/v1/networks",
+            text=json.dumps(networks),
+            status_code=200
+        )
+        sls = SlsNetworks()
+        self.assertEqual(sls.get(), networks)
+        self.assertEqual(sls.get(), networks)
+        self.assertEqual(mocker.call_count, 1)
+        # Once expired, the cached list is still used while SLS is
+        # asked again in the background, and if that fails the cached
+        # list continues to be used.
+        mocker.get("http://cray-sls/v1/networks", status_code=503)
+        failures = uas_metrics.get_metrics().get('sls_refresh_failures', 0)
+        sls.expires = 0
+        self.assertEqual(sls.get(), networks)
+        for _ in range(100):
+            if not sls.refreshing:
+                break
+            time.sleep(0.05)
+        self.assertEqual(mocker.call_count, 2)
+        self.assertEqual(
+            uas_metrics.get_metrics()['sls_refresh_failures'],
+            failures + 1
+        )
+        self.assertEqual(sls.get(), networks)
+        # Never retrieved successfully
+        sls.reset()
+        self.assertEqual(sls.get(), [])
+
     # pylint: disable=missing-docstring,unused-argument
     def test_is_valid_host_path_mount_type(self, mocker):
         self.assertTrue(UAIVolume.is_valid_host_path_mount_type('FileOrCreate'))
@@ -578,6 +697,34 @@ class TestUasCfg(unittest.TestCase):
         self.assertEqual(self.uas_cfg_svc.get_uai_namespace(), "default")
         self.__reset_runtime_config()
 
+    # pylint: disable=missing-docstring,unused-argument
+    def test_populated_config_replica(self, mocker):
+        etcd = FakeEtcd()
+        replica = ConfigReplica(etcd=etcd, prefix=PREFIX)
+        key = "%s/UAIImage" % PopulatedConfig.model_prefix
+        with mock.patch(
+                "swagger_server.uas_data_model.config_snapshot.ConfigReplica."
+                "get_instance",
+                return_value=replica
+        ), mock.patch.object(
+            PopulatedConfig, 'get', wraps=PopulatedConfig.get
+        ) as get:
+            self.assertFalse(PopulatedConfig.is_populated("UAIImage"))
+            # Registration by someone else shows up through the
+            # replica's watch
+            etcd.put(
+                key,
+                json.dumps({'config_name': "UAIImage"}).encode('utf-8')
+            )
+            etcd.deliver()
+            for _ in range(3):
+                self.assertTrue(PopulatedConfig.is_populated("UAIImage"))
+            etcd.delete(key)
+            etcd.deliver()
+            self.assertFalse(PopulatedConfig.is_populated("UAIImage"))
+            get.assert_not_called()
+        self.assertEqual(etcd.reads, 1)
+
     # pylint: disable=missing-docstring,unused-argument
     def test_data_model_expandable_get(self, mocker):
         bad_id = 'invalid-object-id'
@@ -542,6 +542,15 @@ class TestUasController(unittest.TestCase):
             with self.assertRaises(werkzeug.exceptions.NotFound):
                 _ = uas_ctl.delete_uas_class_admin(class_id=str(uuid4()))
 
+    # pylint: disable=missing-docstring
+    def test_get_vault_cleanup_admin(self):
+        with app.test_request_context('/'):
+            resp = uas_ctl.get_vault_cleanup_admin()
+            self.assertIsInstance(resp, list)
+            for cleanup in resp:
+                self.assertIn('class_id', cleanup)
+                self.assertIn('attempts', cleanup)
+
     # There is currently no kubernetes API mocking available to allow me
     # to run this test.  Add this back if we ever get kubernetes API mocking
     # that permits mock jobs to be found in a mock Kubernetes cluster.
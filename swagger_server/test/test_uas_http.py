@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# pylint: disable=missing-docstring,too-few-public-methods
+
+import unittest
+from unittest import mock
+import requests
+import requests_mock
+from swagger_server.uas_lib import uas_metrics
+from swagger_server.uas_lib.uas_http import (
+    HttpUpstream,
+    http_pool_size,
+    http_timeouts
+)
+
+URL = "http://upstream.local/v1/thing"
+
+
+class TestHttpUpstream(unittest.TestCase):
+    """Tester for the pooled HTTP sessions
+
+    """
+    def test_settings(self):
+        with mock.patch.dict('os.environ', {
+                'UAS_HTTP_POOL_SIZE': "4",
+                'UAS_HTTP_TIMEOUTS': "sls=1:2, vault=bad,keycloak=3.5:7"
+        }):
+            self.assertEqual(http_pool_size(), 4)
+            self.assertEqual(http_timeouts('sls'), (1.0, 2.0))
+            self.assertEqual(http_timeouts('keycloak'), (3.5, 7.0))
+            self.assertEqual(http_timeouts('vault'), (5.0, 10.0))
+        with mock.patch.dict('os.environ', {'UAS_HTTP_POOL_SIZE': "x"}):
+            self.assertEqual(http_pool_size(), 10)
+
+    def test_shared_session(self):
+        upstream = HttpUpstream('test_shared')
+        session = upstream.get_session()
+        self.assertIs(upstream.get_session(), session)
+        self.assertEqual(
+            session.get_adapter("https://x")._pool_maxsize,  # pylint: disable=protected-access
+            http_pool_size()
+        )
+        upstream.reset()
+        self.assertIsNot(upstream.get_session(), session)
+
+    def test_request(self):
+        upstream = HttpUpstream('test_request')
+        with mock.patch.dict('os.environ', {
+                'UAS_HTTP_TIMEOUTS': "test_request=1:2"
+        }):
+            with requests_mock.Mocker() as mocker:
+                mocker.get(URL, json={'a': 1}, cookies={'session': "x"})
+                mocker.delete(URL, exc=requests.exceptions.ConnectTimeout)
+                self.assertEqual(upstream.get(URL).json(), {'a': 1})
+                self.assertEqual(mocker.last_request.timeout, (1.0, 2.0))
+                upstream.get(URL, timeout=3)
+                self.assertEqual(mocker.last_request.timeout, 3)
+                # Nothing is carried from one request to the next
+                self.assertNotIn('Cookie', mocker.last_request.headers)
+                with self.assertRaises(requests.exceptions.ConnectTimeout):
+                    upstream.delete(URL)
+        metrics = uas_metrics.get_metrics()
+        self.assertEqual(metrics['test_request_request_count'], 3)
+        self.assertEqual(metrics['test_request_request_errors'], 1)
+        self.assertGreaterEqual(
+            metrics['test_request_request_seconds'],
+            metrics['test_request_request_max_seconds']
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,6 +25,7 @@
 # pylint: disable=missing-docstring
 
 import unittest
+from unittest import mock
 import os
 import io
 from datetime import datetime, timezone, timedelta
@@ -35,6 +36,7 @@ import flask
 from swagger_server.uas_lib.uai_mgr import UaiManager
 from swagger_server.uas_lib.uas_mgr import UasManager
 from swagger_server.uas_lib.uai_instance import UAIInstance
+from swagger_server.uas_lib.uai_template import UAITemplate, reset_templates
 from swagger_server.uas_lib.vault import get_vault_path
 from swagger_server.uas_data_model.uai_class import UAIClass
 from swagger_server.uas_data_model.uai_image import UAIImage
@@ -43,6 +45,7 @@ from swagger_server.uas_data_model.uai_image import UAIImage
 app = flask.Flask(__name__)  # pylint: disable=invalid-name
 
 
+# pylint: disable=too-many-public-methods
 class TestUasMgr(unittest.TestCase):
     """Tester for the UasMgr Class
 
@@ -288,6 +291,50 @@ class TestUasMgr(unittest.TestCase):
             template.metadata.labels
         )
 
+    #pylint: disable=missing-docstring
+    def test_uai_template(self):
+        reset_templates()
+        uas_cfg = self.uai_mgr.uas_cfg
+        image = UAIImage(imagename="template-image", default=False)
+        image.put()
+        uai_class = UAIClass(
+            image_id=image.image_id,
+            tolerations=json.dumps([{'key': "gpu", 'operator': "Exists"}]),
+            volume_list=[]
+        )
+        template = UAITemplate.get(uai_class, uas_cfg)
+        self.assertEqual(template.imagename, "template-image")
+        self.assertEqual(len(template.tolerations), 2)
+        self.assertIs(UAITemplate.get(uai_class, uas_cfg), template)
+        jobs = [
+            UAIInstance(owner=owner, public_key="").create_job_object(
+                uai_class, uas_cfg
+            )
+            for owner in ["user-a", "user-b"]
+        ]
+        self.assertEqual(
+            [job.spec.template.spec.containers[0].name for job in jobs],
+            [job.metadata.name for job in jobs]
+        )
+        self.assertNotEqual(jobs[0].metadata.name, jobs[1].metadata.name)
+        self.assertIs(
+            jobs[0].spec.template.spec.affinity,
+            jobs[1].spec.template.spec.affinity
+        )
+        # Changing something the class refers to makes a new template
+        image.imagename = "template-image-2"
+        image.put()
+        template = UAITemplate.get(uai_class, uas_cfg)
+        self.assertEqual(template.imagename, "template-image-2")
+        # So does changing the class itself
+        uai_class.priority_class_name = "other-priority"
+        self.assertEqual(
+            UAITemplate.get(uai_class, uas_cfg).priority_class_name,
+            "other-priority"
+        )
+        image.remove()
+        reset_templates()
+
     #pylint: disable=missing-docstring
     def test_create_service_object(self):
         self.public_key.seek(0)
@@ -553,6 +600,31 @@ class TestUasMgr(unittest.TestCase):
             secret_desc_2
         )
 
+    # pylint: disable=missing-docstring,protected-access
+    def test_expanded_uai_classes(self):
+        img = self.uas_mgr.create_image(imagename="expandimage", default=None)
+        vol_id = str(uuid.uuid4())
+        uai_classes = [
+            UAIClass(image_id=img['image_id'], volume_list=[vol_id]),
+            UAIClass(image_id=img['image_id'], volume_list=[]),
+        ]
+        with mock.patch.object(
+                UAIImage, "get_many", wraps=UAIImage.get_many
+        ) as get_many, mock.patch.object(UAIImage, "get") as get:
+            ret = self.uas_mgr._expanded_uai_classes(uai_classes)
+        get_many.assert_called_once()
+        get.assert_not_called()
+        self.assertEqual([exp['uai_image'] for exp in ret], [img, img])
+        self.assertEqual(
+            ret[0]['volume_mounts'],
+            ["<unknown UAIVolume instance, ID = '%s'>" % vol_id]
+        )
+        self.assertEqual(ret[1]['volume_mounts'], [])
+        self.assertIsNone(ret[1]['resource_config'])
+        with self.assertRaises(werkzeug.exceptions.BadRequest):
+            self.uas_mgr._validate_volume_list([vol_id])
+        self.uas_mgr.delete_image(img['image_id'])
+
     # pylint: disable=missing-docstring
     def test_get_pod_age(self):
         self.assertEqual(self.uas_mgr.get_pod_age(None), None)
@@ -28,8 +28,11 @@ import json
 from unittest import mock
 from unittest.mock import mock_open
 import requests
+from swagger_server.uas_lib.uas_http import VAULT
 from swagger_server.uas_lib.vault import (
+    VaultToken,
     get_vault_path,
+    remove_vault_classes,
     remove_vault_data,
 )
 
@@ -61,7 +64,7 @@ class MockResponse:  # pylint: disable=too-few-public-methods
             raise requests.exceptions.RequestException(msg)
 
 
-# This will be used by the mock to replace requests.get
+# This will be used by the mock to replace VAULT.get
 def mocked_requests_get(*args, **kwargs):
     url = args[0]
     nodata = {"errors": []}
@@ -77,7 +80,7 @@ def mocked_requests_get(*args, **kwargs):
     return MockResponse(response, 200, url)
 
 
-# This will be used by the mock to replace requests.post
+# This will be used by the mock to replace VAULT.post
 def mocked_requests_post(*args, **kwargs):
     url = args[0]
     match = vault_url_map['post'].get(url, None)
@@ -88,7 +91,7 @@ def mocked_requests_post(*args, **kwargs):
     return MockResponse(match["response"], 200, url)
 
 
-# This will be used by the mock to replace requests.delete
+# This will be used by the mock to replace VAULT.delete
 #
 #  pylint: disable=unused-argument,unused-private-member
 def mocked_requests_delete(*args, **kwargs):
@@ -99,6 +102,10 @@ class TestVault(unittest.TestCase):
     """Tester for the Vault Package
 
     """
+    def setUp(self):
+        VaultToken.get_instance().reset()
+        self.addCleanup(VaultToken.get_instance().reset)
+
     def test_get_vault_path(self):
         """Verify that the getVaultPath() function returns the correct
         path for the specified class ID.
@@ -107,9 +114,9 @@ class TestVault(unittest.TestCase):
         test_path = get_vault_path("my-class-id")
         self.assertEqual(test_path, "secret/broker-uai/my-class-id")
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
-    @mock.patch('requests.post', side_effect=mocked_requests_post)
-    @mock.patch('requests.delete', side_effect=mocked_requests_delete)
+    @mock.patch.object(VAULT, 'get', side_effect=mocked_requests_get)
+    @mock.patch.object(VAULT, 'post', side_effect=mocked_requests_post)
+    @mock.patch.object(VAULT, 'delete', side_effect=mocked_requests_delete)
     @mock.patch('builtins.open', mock_open(read_data="VALID SA TOKEN"))
     #pylint: disable=unused-argument
     def test_remove_vault_data(self, m_get, m_post, m_delete):
@@ -120,9 +127,9 @@ class TestVault(unittest.TestCase):
         """
         remove_vault_data("90328aa4-7628-40d9-8a98-6589d794b782")
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
-    @mock.patch('requests.post', side_effect=mocked_requests_post)
-    @mock.patch('requests.delete', side_effect=mocked_requests_delete)
+    @mock.patch.object(VAULT, 'get', side_effect=mocked_requests_get)
+    @mock.patch.object(VAULT, 'post', side_effect=mocked_requests_post)
+    @mock.patch.object(VAULT, 'delete', side_effect=mocked_requests_delete)
     @mock.patch('builtins.open', mock_open(read_data="VALID SA TOKEN"))
     #pylint: disable=unused-argument
     def test_remove_vault_data_bad_path(self, m_get, m_post, m_delete):
@@ -134,9 +141,9 @@ class TestVault(unittest.TestCase):
         """
         remove_vault_data("90328aa4-7628-40d9-8a98-6589d794b782")
 
-    @mock.patch('requests.get', side_effect=mocked_requests_get)
-    @mock.patch('requests.post', side_effect=mocked_requests_post)
-    @mock.patch('requests.delete', side_effect=mocked_requests_delete)
+    @mock.patch.object(VAULT, 'get', side_effect=mocked_requests_get)
+    @mock.patch.object(VAULT, 'post', side_effect=mocked_requests_post)
+    @mock.patch.object(VAULT, 'delete', side_effect=mocked_requests_delete)
     @mock.patch('builtins.open', mock_open(read_data="INVALID SA TOKEN"))
     # pylint: disable=unused-argument
     def test_remove_vault_data_bad_sa_token(self, m_get, m_post, m_delete):
@@ -147,3 +154,108 @@ class TestVault(unittest.TestCase):
 
         """
         remove_vault_data("90328aa4-7628-40d9-8a98-6589d794b782")
+
+CLASS_ID = "90328aa4-7628-40d9-8a98-6589d794b782"
+CLASS_URL = "http://cray-vault.vault:8200/v1/secret/broker-uai/" + CLASS_ID
+
+
+class TestVaultCleanup(unittest.TestCase):
+    """Tester for Vault token reuse and subtree removal
+
+    """
+    def setUp(self):
+        VaultToken.get_instance().reset()
+        self.addCleanup(VaultToken.get_instance().reset)
+        self.get = self.patch('get', mocked_requests_get)
+        self.post = self.patch('post', mocked_requests_post)
+        self.delete = self.patch('delete', mocked_requests_delete)
+        patcher = mock.patch(
+            'builtins.open', mock_open(read_data="VALID SA TOKEN")
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def patch(self, method, side_effect):
+        patcher = mock.patch.object(VAULT, method, side_effect=side_effect)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_subtree_removal(self):
+        self.assertTrue(remove_vault_data(CLASS_ID))
+        # Only the class and its sub-trees are listed
+        self.assertEqual(
+            sorted(call.args[0] for call in self.get.call_args_list),
+            [CLASS_URL, CLASS_URL + "/internal/"]
+        )
+        # Every node is removed, deepest first
+        deleted = [call.args[0] for call in self.delete.call_args_list]
+        self.assertEqual(deleted[0], CLASS_URL + "/internal/vshasta")
+        self.assertEqual(deleted[-1], CLASS_URL)
+        self.assertEqual(
+            sorted(deleted[1:3]),
+            [CLASS_URL + "/host", CLASS_URL + "/internal/"]
+        )
+
+    def test_incomplete_removal(self):
+        self.delete.side_effect = lambda *args, **kwargs: MockResponse(
+            None, 500, args[0]
+        )
+        self.assertFalse(remove_vault_data(CLASS_ID))
+        self.post.side_effect = lambda *args, **kwargs: MockResponse(
+            None, 500, args[0]
+        )
+        VaultToken.get_instance().reset()
+        self.assertFalse(remove_vault_data(CLASS_ID))
+
+    def test_token_reuse(self):
+        remove_vault_classes([CLASS_ID, "other-class"])
+        remove_vault_data(CLASS_ID)
+        self.assertEqual(self.post.call_count, 1)
+        self.assertIn(CLASS_URL, [
+            call.args[0] for call in self.get.call_args_list
+        ])
+        for call in self.delete.call_args_list:
+            self.assertEqual(
+                call.kwargs['headers'],
+                {"X-Vault-Token": "VALID VAULT TOKEN"}
+            )
+
+    def test_token_expired(self):
+        with mock.patch(
+                "swagger_server.uas_lib.vault.time.monotonic",
+                return_value=0
+        ):
+            remove_vault_data(CLASS_ID)
+        # The token is reused until shortly before its lease runs out
+        with mock.patch(
+                "swagger_server.uas_lib.vault.time.monotonic",
+                return_value=259200 - 61
+        ):
+            remove_vault_data(CLASS_ID)
+        self.assertEqual(self.post.call_count, 1)
+        with mock.patch(
+                "swagger_server.uas_lib.vault.time.monotonic",
+                return_value=259200 - 60
+        ):
+            remove_vault_data(CLASS_ID)
+        self.assertEqual(self.post.call_count, 2)
+
+    def test_token_refused(self):
+        remove_vault_data(CLASS_ID)
+        refused = [True]
+
+        def get(*args, **kwargs):
+            if refused[0]:
+                refused[0] = False
+                return MockResponse(None, 403, args[0])
+            return mocked_requests_get(*args, **kwargs)
+        self.get.side_effect = get
+        self.delete.reset_mock()
+        remove_vault_data(CLASS_ID)
+        # Logged in again and then removed everything
+        self.assertEqual(self.post.call_count, 2)
+        self.assertEqual(self.delete.call_count, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+#
+# pylint: disable=missing-docstring,too-few-public-methods
+
+import unittest
+from unittest import mock
+from swagger_server.uas_lib.vault_cleanup import (
+    VaultCleanupQueue,
+    cleanup_backoff
+)
+from swagger_server.uas_data_model.vault_cleanup import VaultCleanup
+from swagger_server.test.test_config_transaction import FakeEtcd
+
+
+class Cleanup:
+    """Stands in for a VaultCleanup stored in ETCD.
+
+    """
+    def __init__(self, store, class_id, next_attempt=0):
+        self.store = store
+        self.class_id = class_id
+        self.queued = len(store)
+        self.attempts = 0
+        self.next_attempt = next_attempt
+        self.last_error = None
+        self.stored_revision = 1
+        store[class_id] = self
+
+    def revision(self):
+        stored = self.store.get(self.class_id, None)
+        return None if stored is None else stored.stored_revision
+
+    def update(self, revision):
+        if self.revision() != revision:
+            return False
+        self.stored_revision += 1
+        self.store[self.class_id] = self
+        return True
+
+    def remove(self):
+        del self.store[self.class_id]
+
+    def expand(self):
+        return {'class_id': self.class_id}
+
+
+class TestVaultCleanupQueue(unittest.TestCase):
+    """Tester for the queue of pending Vault cleanups
+
+    """
+    def setUp(self):
+        self.store = {}
+        patcher = mock.patch(
+            "swagger_server.uas_lib.vault_cleanup.VaultCleanup.get_all",
+            side_effect=lambda: list(self.store.values())
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch(
+            "swagger_server.uas_lib.vault_cleanup.remove_vault_data",
+            return_value=True
+        )
+        self.remove = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.queue = VaultCleanupQueue()
+
+    def test_backoff(self):
+        self.assertEqual(cleanup_backoff(1), 10)
+        self.assertEqual(cleanup_backoff(3), 40)
+        self.assertEqual(cleanup_backoff(20), 900)
+
+    def test_work(self):
+        Cleanup(self.store, "class-1")
+        Cleanup(self.store, "class-2")
+        Cleanup(self.store, "class-3", next_attempt=float('inf'))
+        self.remove.side_effect = lambda class_id: class_id != "class-2"
+        with mock.patch(
+                "swagger_server.uas_lib.vault_cleanup.time.time",
+                return_value=1000
+        ):
+            delay = self.queue.work()
+        self.assertEqual(
+            [call.args[0] for call in self.remove.call_args_list],
+            ["class-1", "class-2"]
+        )
+        # The successful one is done, the failed one backs off, the
+        # one that is not due yet is left alone.
+        self.assertEqual(sorted(self.store), ["class-2", "class-3"])
+        failed = self.store["class-2"]
+        self.assertEqual(failed.attempts, 1)
+        self.assertEqual(failed.next_attempt, 1010)
+        self.assertIsNotNone(failed.last_error)
+        self.assertEqual(self.store["class-3"].attempts, 0)
+        self.assertEqual(delay, 10)
+
+    def test_work_exception(self):
+        Cleanup(self.store, "class-1")
+        self.remove.side_effect = RuntimeError("vault is down")
+        self.queue.work()
+        self.assertEqual(self.store["class-1"].attempts, 1)
+        self.assertIn("vault is down", self.store["class-1"].last_error)
+
+    def test_removed_meanwhile(self):
+        cleanup = Cleanup(self.store, "class-1")
+
+        def finished_elsewhere(class_id):
+            # Another UAS Manager finishes the cleanup in the meantime
+            del self.store[class_id]
+            return False
+
+        self.remove.side_effect = finished_elsewhere
+        self.queue.attempt(cleanup)
+        self.assertEqual(self.store, {})
+        # Nothing is attempted for a cleanup that is already gone
+        self.remove.reset_mock()
+        self.queue.attempt(cleanup)
+        self.remove.assert_not_called()
+
+    def test_empty(self):
+        self.assertIsNone(self.queue.work())
+        self.assertEqual(self.queue.pending(), [])
+
+    def test_pending(self):
+        Cleanup(self.store, "class-2")
+        Cleanup(self.store, "class-1")
+        self.store["class-1"].queued = -1
+        self.assertEqual(
+            self.queue.pending(),
+            [{'class_id': "class-1"}, {'class_id': "class-2"}]
+        )
+
+    def test_wake(self):
+        Cleanup(self.store, "class-1")
+        self.queue.wake()
+        worker = self.queue.worker
+        if worker is not None:
+            worker.join(timeout=5)
+        self.assertEqual(self.store, {})
+        self.assertIsNone(self.queue.worker)
+        # Left over cleanups are only looked for now and then
+        Cleanup(self.store, "class-2")
+        self.queue.resume()
+        self.assertIsNone(self.queue.worker)
+        self.assertIn("class-2", self.store)
+
+
+
+class TestVaultCleanup(unittest.TestCase):
+    """Tester for conditional updates of pending Vault cleanups
+
+    """
+    def test_update(self):
+        etcd = FakeEtcd()
+        cleanup = VaultCleanup(class_id="class-1", queued=0)
+        key = "%s/class-1" % VaultCleanup.model_prefix
+        with mock.patch.object(VaultCleanup, 'etcd_instance', etcd):
+            self.assertIsNone(cleanup.revision())
+            etcd.bump(key)
+            revision = cleanup.revision()
+            cleanup.attempts = 1
+            self.assertTrue(cleanup.update(revision))
+            # Someone else changed it in the meantime
+            self.assertFalse(cleanup.update(revision))
+
+
+if __name__ == '__main__':
+    unittest.main()
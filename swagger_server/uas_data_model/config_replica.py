@@ -0,0 +1,492 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+"""In-process Replica of the UAS Configuration in ETCD
+
+The UAS configuration in ETCD (everything under ETCD_PREFIX) is small
+and changes rarely, but it is read many times by every request.  The
+ConfigReplica loads all of it once, with a single range read, and keeps
+it current by watching the prefix, so data model reads can be served
+from memory.  Other UAS Manager replicas' changes show up as soon as
+the watch delivers them.  Changes made by this process are re-read from
+ETCD before they are next looked at, so this process always sees its
+own changes right away.
+
+Every key in the replica carries the ETCD revision at which it was last
+modified (or deleted), and nothing is ever replaced by something from
+an older revision, so watch events and range reads can be applied in
+whatever order they arrive.
+
+The replica also keeps indexes of data model instances by attribute
+value (for example images by name, or classes by the volumes they use)
+so lookups by something other than the object ID do not have to go
+through every instance.  Indexes are built when first used and rebuilt
+after instances of their model change.  The replica counts the changes
+it sees to each model (the model revision), and indexes are kept by
+model revision, so a change to one model does not throw away the
+indexes of the others, and a request snapshot taken from the replica
+can use the replica's indexes as long as the model has not changed
+since.
+
+"""
+from __future__ import absolute_import
+import os
+import json
+import threading
+from etcd3_model import Etcd3Attr
+from swagger_server import ETCD_INSTANCE, ETCD_PREFIX
+from swagger_server.uas_lib.uas_logging import logger
+
+
+def etcd_replica_enabled():
+    """Determine whether UAS configuration should be served from the
+    in-process replica.  UAS_ETCD_REPLICA comes from config in the Helm
+    chart.
+
+    """
+    return os.environ.get('UAS_ETCD_REPLICA', 'true').lower() == 'true'
+
+
+def response_revision(meta, default):
+    """Get the ETCD revision a range read was done at from the metadata of
+    one of the values it returned, or 'default' if that is not
+    available.
+
+    """
+    header = getattr(meta, 'response_header', None)
+    revision = getattr(header, 'revision', None)
+    return revision if isinstance(revision, int) else default
+
+
+def decode_model(model, key, value):
+    """Make an instance of 'model' (a data model class) from its stored
+    value in ETCD (None if there is none).  Return a tuple of a flag
+    indicating whether that worked, and the instance (None if there is
+    no value).
+
+    """
+    if value is None:
+        return True, None
+    try:
+        return True, model(**json.loads(value))
+    except (TypeError, ValueError) as err:
+        logger.warning("unable to decode %s '%s': %r", model.__name__, key, err)
+        return False, None
+
+
+def encode_model(obj):
+    """Get the ETCD key and stored value of 'obj' (a data model instance),
+    the inverse of decode_model(): the value is the JSON encoded
+    dictionary of the data model attributes of 'obj', and the key is
+    the model prefix followed by the object ID.
+
+    """
+    attrs = {}
+    object_id = None
+    for klass in reversed(type(obj).__mro__):
+        for name, attr in vars(klass).items():
+            if isinstance(attr, Etcd3Attr):
+                attrs[name] = getattr(obj, name)
+                if getattr(attr, 'is_object_id', False):
+                    object_id = attrs[name]
+    if object_id is None:
+        raise ValueError(
+            "%s instance has no object ID" % type(obj).__name__
+        )
+    return "%s/%s" % (obj.model_prefix, object_id), json.dumps(attrs)
+
+
+def decode_models(model, values):
+    """Make a list of instances of 'model' (a data model class) from a
+    dictionary of stored values in ETCD, in key order.  Return a tuple
+    of a flag indicating whether that worked, and the list.
+
+    """
+    ret = []
+    for key, value in sorted(values.items()):
+        usable, obj = decode_model(model, key, value)
+        if not usable:
+            return False, None
+        ret.append(obj)
+    return True, ret
+
+
+def key_model_prefix(key):
+    """Get the model prefix (with a trailing '/') of a key in ETCD.
+
+    """
+    return key.rsplit('/', 1)[0] + "/"
+
+
+def index_values(obj, attr):
+    """Get the values under which 'obj' (a data model instance) is indexed
+    by 'attr': the elements of the value of 'attr' if it is a list,
+    otherwise the value itself.
+
+    """
+    value = getattr(obj, attr, None)
+    return value if isinstance(value, list) else [value]
+
+
+def build_index(model, attr, values):
+    """Build an index of instances of 'model' (a data model class) from a
+    dictionary of stored values in ETCD.  The index maps each value of
+    'attr' (see index_values()) to a tuple of the object IDs of the
+    instances that have it.  Return a tuple of a flag indicating
+    whether that worked, and the index.
+
+    """
+    prefix = model.model_prefix + "/"
+    index = {}
+    for key, value in sorted(values.items()):
+        usable, obj = decode_model(model, key, value)
+        if not usable:
+            return False, None
+        for indexed in index_values(obj, attr):
+            try:
+                index.setdefault(indexed, []).append(key[len(prefix):])
+            except TypeError:
+                # Not something that can be looked up by, skip it.
+                continue
+    return True, {
+        indexed: tuple(object_ids) for indexed, object_ids in index.items()
+    }
+
+
+class ConfigReplica:
+    """Process-wide replica of the UAS configuration in ETCD.
+
+    """
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(self, etcd=None, prefix=None):
+        """Constructor
+
+        """
+        self.etcd = etcd if etcd is not None else ETCD_INSTANCE
+        self.prefix = (prefix if prefix is not None else ETCD_PREFIX) + "/"
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.revisions = {}
+        self.indexes = {}
+        self.dirty = set()
+        self.reads = []
+        self.watch_id = None
+        self.ready = False
+        self.supported = True
+
+    @classmethod
+    def get_instance(cls):
+        """Get the process-wide replica if replicating is turned on,
+        otherwise None.
+
+        """
+        if not etcd_replica_enabled():
+            return None
+        with cls.__instance_lock:
+            if cls.__instance is None:
+                cls.__instance = ConfigReplica()
+            return cls.__instance
+
+    def __apply(self, key, value, revision):
+        """Apply a value (None if deleted) for a key seen at a given
+        revision unless the replica already has something newer.  Called
+        with the lock held.
+
+        """
+        current = self.entries.get(key)
+        if current is None or current[1] < revision:
+            self.entries[key] = (value, revision)
+            self.__changed(key)
+
+    def __changed(self, key):
+        """Note a change to a key by counting it against the model revision
+        of its model.  Called with the lock held.
+
+        """
+        prefix = key_model_prefix(key)
+        self.revisions[prefix] = self.revisions.get(prefix, 0) + 1
+
+    def __watch_callback(self, response):
+        """Handle a response from the watch on the UAS configuration, which
+        is either a set of events or an exception if the watch failed.
+
+        """
+        with self.lock:
+            if isinstance(response, Exception):
+                logger.warning(
+                    "UAS configuration watch failed, reloading: %r",
+                    response
+                )
+                self.ready = False
+                self.watch_id = None
+                return
+            for event in getattr(response, 'events', [response]):
+                deleted = type(event).__name__ == "DeleteEvent"
+                key = event.key.decode('utf-8')
+                self.__apply(
+                    key,
+                    None if deleted else event.value,
+                    event.mod_revision
+                )
+                for changed in self.reads:
+                    changed.add(key)
+
+    def __read(self, prefix):
+        """Read everything under 'prefix' from ETCD into the replica, and
+        drop anything under 'prefix' that is not there any more.  The
+        range read is done without the lock held, and its results are
+        applied under the lock afterwards, leaving alone any key the
+        watch has changed since the read started (which is at least as
+        new as what the read found).
+
+        """
+        changed = set()
+        with self.lock:
+            self.reads.append(changed)
+        try:
+            values = {}
+            revision = 0
+            for value, meta in self.etcd.get_prefix(prefix):
+                values[meta.key.decode('utf-8')] = (value, meta.mod_revision)
+                revision = response_revision(
+                    meta, max(revision, meta.mod_revision)
+                )
+        finally:
+            with self.lock:
+                self.reads.remove(changed)
+        with self.lock:
+            for key, (value, mod_revision) in values.items():
+                self.__apply(key, value, mod_revision)
+            # Anything the replica has that was not found and has not
+            # been changed by the watch since the read started is gone
+            # as of the read.
+            for key, (value, key_revision) in list(self.entries.items()):
+                if (
+                        key.startswith(prefix) and
+                        key not in values and
+                        key not in changed and
+                        value is not None
+                ):
+                    self.entries[key] = (None, max(revision, key_revision))
+                    self.__changed(key)
+
+    def __watch(self):
+        """Start watching the UAS configuration unless that is already
+        being done, and return the ID of the watch.
+
+        """
+        with self.lock:
+            if self.watch_id is None:
+                self.watch_id = self.etcd.add_watch_prefix_callback(
+                    self.prefix,
+                    self.__watch_callback
+                )
+            return self.watch_id
+
+    def __sync(self, prefix):
+        """Make sure the replica is loaded and that anything under 'prefix'
+        changed by this process has been re-read.  Return False if the
+        replica cannot be used.  Called without the lock held, so that
+        ETCD is not read while holding it.
+
+        """
+        with self.lock:
+            if not self.supported:
+                return False
+            if self.ready:
+                read_prefix = prefix
+                pending = {
+                    dirty for dirty in self.dirty
+                    if dirty.startswith(prefix) or prefix.startswith(dirty)
+                }
+                if not pending:
+                    return True
+                # Changes noted from here on are read again next time.
+                self.dirty -= pending
+            else:
+                read_prefix = self.prefix
+                pending = set(self.dirty)
+                self.dirty = set()
+        try:
+            # Start watching first, so nothing changed while loading is
+            # missed.
+            watch_id = self.__watch()
+            self.__read(read_prefix)
+        except AttributeError as err:
+            logger.info("ETCD client cannot replicate UAS configuration: %r",
+                        err)
+            with self.lock:
+                self.supported = False
+            return False
+        except Exception as err:  # pylint: disable=broad-except
+            logger.warning("unable to load UAS configuration replica: %r", err)
+            with self.lock:
+                self.dirty |= pending
+                self.ready = False
+            return False
+        with self.lock:
+            # If the watch failed while loading, load again next time.
+            if (
+                    read_prefix == self.prefix and
+                    not self.ready and
+                    self.watch_id == watch_id
+            ):
+                self.ready = True
+                logger.info(
+                    "loaded UAS configuration replica (%d keys)",
+                    len(self.entries)
+                )
+        return True
+
+    def invalidate(self, prefix):
+        """Note that this process has changed something under 'prefix', so
+        that it is re-read before it is next looked at here.
+
+        """
+        with self.lock:
+            self.dirty.add(prefix)
+
+    def values(self, prefix=None):
+        """Get a dictionary of all keys and values currently under 'prefix'
+        (the whole UAS configuration by default), or None if the
+        replica cannot be used.
+
+        """
+        prefix = prefix if prefix is not None else self.prefix
+        if not self.__sync(prefix):
+            return None
+        with self.lock:
+            return {
+                key: value
+                for key, (value, _) in self.entries.items()
+                if value is not None and key.startswith(prefix)
+            }
+
+    def copy(self):
+        """Get a copy of the whole UAS configuration for a request
+        snapshot.  Return a tuple of a dictionary of all keys and values
+        and a dictionary of the model revisions they are at (see
+        get_index()), or (None, None) if the replica cannot be used.
+
+        """
+        if not self.__sync(self.prefix):
+            return None, None
+        with self.lock:
+            return {
+                key: value
+                for key, (value, _) in self.entries.items()
+                if value is not None
+            }, dict(self.revisions)
+
+    def get_value(self, key):
+        """Get the current value of a single key (None if there is no such
+        key).  Return a tuple of a flag indicating whether the replica
+        could be used, and the value.
+
+        """
+        prefix = key_model_prefix(key)
+        if not self.__sync(prefix):
+            return False, None
+        with self.lock:
+            return True, self.entries.get(key, (None, 0))[0]
+
+    def get(self, model, object_id):
+        """Get the instance of 'model' (a data model class) with the
+        specified object ID.  Return a tuple of a flag indicating
+        whether the replica could be used, and the instance (None if it
+        is not found).
+
+        """
+        key = "%s/%s" % (model.model_prefix, object_id)
+        usable, value = self.get_value(key)
+        if not usable:
+            return False, None
+        return decode_model(model, key, value)
+
+    def get_many(self, model, object_ids):
+        """Get the instances of 'model' (a data model class) with the
+        listed object IDs as a dictionary of object ID to instance (None
+        if it is not found).  Return a tuple of a flag indicating
+        whether the replica could be used, and the dictionary.
+
+        """
+        prefix = model.model_prefix + "/"
+        if not self.__sync(prefix):
+            return False, None
+        with self.lock:
+            values = {
+                object_id: self.entries.get(
+                    "%s%s" % (prefix, object_id), (None, 0)
+                )[0]
+                for object_id in object_ids
+            }
+        ret = {}
+        for object_id, value in values.items():
+            usable, ret[object_id] = decode_model(
+                model, "%s%s" % (prefix, object_id), value
+            )
+            if not usable:
+                return False, None
+        return True, ret
+
+    def get_all(self, model):
+        """Get all instances of 'model' (a data model class).  Return a
+        tuple of a flag indicating whether the replica could be used,
+        and the list of instances.
+
+        """
+        values = self.values(model.model_prefix + "/")
+        if values is None:
+            return False, None
+        return decode_models(model, values)
+
+    def get_index(self, model, attr, revision=None):
+        """Get the index of instances of 'model' (a data model class) by
+        'attr' (see build_index()).  If 'revision' is given the index is
+        only returned if 'model' is still at that model revision (see
+        copy()).  Return a tuple of a flag indicating whether the
+        replica could be used, and the index, which must not be
+        modified.
+
+        """
+        prefix = model.model_prefix + "/"
+        if not self.__sync(prefix):
+            return False, None
+        with self.lock:
+            current = self.revisions.get(prefix, 0)
+            if revision is not None and revision != current:
+                return False, None
+            cached = self.indexes.get((prefix, attr))
+            if cached is not None and cached[0] == current:
+                return True, cached[1]
+            values = {
+                key: value
+                for key, (value, _) in self.entries.items()
+                if value is not None and key.startswith(prefix)
+            }
+        usable, index = build_index(model, attr, values)
+        if not usable:
+            return False, None
+        with self.lock:
+            self.indexes[(prefix, attr)] = (current, index)
+        return True, index
@@ -0,0 +1,311 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+"""Request Scoped Snapshot of UAS Configuration
+
+A single UAS request looks at the UAS configmap and at the UAS data
+model tables in ETCD many times over.  A ConfigSnapshot, started by the
+controller at the beginning of a request, reads all of the UAS
+configuration in ETCD with a single range read the first time any of it
+is needed (or copies it from the in-process ConfigReplica when that is
+in use) and serves every later read in the request from that, so the
+whole request sees one consistent configuration.  Anything the request
+stores or removes through the data model invalidates the part of the
+snapshot holding that model, which is read again the next time that
+model is looked at, so the request always sees its own changes.
+
+A snapshot copied from the replica remembers the model revision each
+model was at, and uses the replica's already built indexes of a model
+for as long as the replica has that model at the same revision.
+
+"""
+from __future__ import absolute_import
+import functools
+from flask import g, has_app_context
+from swagger_server import ETCD_INSTANCE, ETCD_PREFIX
+from swagger_server.uas_lib.uas_logging import logger
+from swagger_server.uas_data_model.config_replica import (
+    ConfigReplica,
+    build_index,
+    decode_model,
+    decode_models
+)
+
+
+class ConfigSnapshot:
+    """A request scoped snapshot of the UAS configmap and of the UAS
+    configuration stored in ETCD.
+
+    """
+    def __init__(self):
+        """Constructor
+
+        """
+        self.configmaps = {}
+        self.values = None
+        self.revisions = {}
+        self.stale = set()
+        self.indexes = {}
+        self.usable = True
+
+    @staticmethod
+    def current():
+        """Get the snapshot for the current request, or None if there is
+        none (outside of a request or in a request that did not start
+        one).
+
+        """
+        if not has_app_context():
+            return None
+        return g.get('uas_config_snapshot', None)
+
+    @staticmethod
+    def start():
+        """Start a new snapshot for the current request and return it.
+
+        """
+        snapshot = ConfigSnapshot()
+        g.uas_config_snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def invalidate(prefix=None):
+        """Note that the UAS configuration in ETCD under 'prefix' (a model
+        prefix with a trailing '/', or all of it if None) has been
+        changed, so that part of the snapshot for the current request
+        (if any) needs to be read again.
+
+        """
+        snapshot = ConfigSnapshot.current()
+        if snapshot is None:
+            return
+        if prefix is None:
+            snapshot.values = None
+            snapshot.revisions = {}
+            snapshot.stale = set()
+            snapshot.indexes = {}
+            return
+        snapshot.stale.add(prefix)
+        snapshot.revisions.pop(prefix, None)
+        snapshot.indexes = {
+            key: index for key, index in snapshot.indexes.items()
+            if key[0] != prefix
+        }
+
+    def get_configmap(self, path):
+        """Get the configmap contents from 'path' seen so far in this
+        request, or None if it has not been loaded yet.
+
+        """
+        return self.configmaps.get(path, None)
+
+    def set_configmap(self, path, cfg):
+        """Set the configmap contents from 'path' seen in this request.
+
+        """
+        self.configmaps[path] = cfg
+
+    def __load(self, model):
+        """Read all of the UAS configuration in ETCD (in one range read) if
+        it has not been read since the snapshot was started, or read
+        just the instances of 'model' (a data model class) again if
+        they have been invalidated.  Return False if that cannot be
+        done, in which case the snapshot is not used from then on.
+
+        """
+        if not self.usable:
+            return False
+        prefix = model.model_prefix + "/"
+        if self.values is not None and prefix not in self.stale:
+            return True
+        replica = ConfigReplica.get_instance()
+        if replica is not None:
+            if self.values is None:
+                self.values, self.revisions = replica.copy()
+                if self.values is not None:
+                    return True
+            else:
+                values = replica.values(prefix)
+                if values is not None:
+                    self.__replace(prefix, values)
+                    return True
+        try:
+            values = {
+                meta.key.decode('utf-8'): value
+                for value, meta in ETCD_INSTANCE.get_prefix(
+                    prefix if self.values is not None else ETCD_PREFIX + "/"
+                )
+            }
+        except (AttributeError, TypeError) as err:
+            # The ETCD client does not support range reads the way we
+            # need, so just go to ETCD for everything.
+            logger.warning("unable to snapshot UAS configuration: %r", err)
+            self.usable = False
+            return False
+        if self.values is None:
+            self.values = values
+            self.revisions = {}
+        else:
+            self.__replace(prefix, values)
+        return True
+
+    def __replace(self, prefix, values):
+        """Replace the instances of the model with prefix 'prefix' in the
+        snapshot with the ones just read.
+
+        """
+        self.values = {
+            key: value for key, value in self.values.items()
+            if not key.startswith(prefix)
+        }
+        self.values.update(values)
+        self.stale.discard(prefix)
+
+    def get(self, model, object_id):
+        """Get the instance of 'model' (a data model class) with the
+        specified object ID from the snapshot.  Return a tuple of a
+        flag indicating whether the snapshot could be used, and the
+        instance (None if it is not found).
+
+        """
+        if not self.__load(model):
+            return False, None
+        key = "%s/%s" % (model.model_prefix, object_id)
+        return decode_model(model, key, self.values.get(key))
+
+    def get_many(self, model, object_ids):
+        """Get the instances of 'model' (a data model class) with the
+        listed object IDs from the snapshot as a dictionary of object ID
+        to instance (None if it is not found).  Return a tuple of a
+        flag indicating whether the snapshot could be used, and the
+        dictionary.
+
+        """
+        if not self.__load(model):
+            return False, None
+        ret = {}
+        for object_id in object_ids:
+            key = "%s/%s" % (model.model_prefix, object_id)
+            usable, ret[object_id] = decode_model(
+                model, key, self.values.get(key)
+            )
+            if not usable:
+                return False, None
+        return True, ret
+
+    def __model_values(self, model):
+        """Get the stored values of all instances of 'model' (a data model
+        class) from the snapshot.
+
+        """
+        prefix = model.model_prefix + "/"
+        return {
+            key: value
+            for key, value in self.values.items()
+            if key.startswith(prefix)
+        }
+
+    def get_all(self, model):
+        """Get all instances of 'model' (a data model class) from the
+        snapshot.  Return a tuple of a flag indicating whether the
+        snapshot could be used, and the list of instances.
+
+        """
+        if not self.__load(model):
+            return False, None
+        return decode_models(model, self.__model_values(model))
+
+    def get_index(self, model, attr):
+        """Get the index of instances of 'model' (a data model class) by
+        'attr' (see build_index()), building it the first time it is
+        used in the snapshot.  Return a tuple of a flag indicating
+        whether the snapshot could be used, and the index.
+
+        """
+        if not self.__load(model):
+            return False, None
+        prefix = model.model_prefix + "/"
+        key = (prefix, attr)
+        if key not in self.indexes:
+            usable, index = False, None
+            if prefix in self.revisions:
+                # Copied from the replica and not changed since, so the
+                # replica's index will do if the model has not changed
+                # there either.
+                replica = ConfigReplica.get_instance()
+                if replica is not None:
+                    usable, index = replica.get_index(
+                        model, attr, self.revisions[prefix]
+                    )
+            if not usable:
+                usable, index = build_index(
+                    model, attr, self.__model_values(model)
+                )
+            if not usable:
+                return False, None
+            self.indexes[key] = index
+        return True, self.indexes[key]
+
+
+def config_source():
+    """Get the place to read UAS configuration from instead of ETCD: the
+    snapshot for the current request if there is one, otherwise the
+    in-process replica if that is turned on, otherwise None.  Both
+    have get(), get_many(), get_all() and get_index() methods that take
+    a data model class and return a tuple of a flag indicating whether
+    they could be used and the result.
+
+    """
+    snapshot = ConfigSnapshot.current()
+    if snapshot is not None:
+        return snapshot
+    return ConfigReplica.get_instance()
+
+
+def config_changed(model):
+    """Note that this process has stored or removed an instance of
+    'model' (a data model class), so that the change is seen by later
+    reads from the request snapshot and the in-process replica.
+
+    """
+    prefix = model.model_prefix + "/"
+    ConfigSnapshot.invalidate(prefix)
+    replica = ConfigReplica.get_instance()
+    if replica is not None:
+        replica.invalidate(prefix)
+
+
+def config_snapshot(func):
+    """Decorator for controller functions that makes the decorated
+    function run with a new request scoped snapshot of the UAS
+    configuration.
+
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if has_app_context():
+            ConfigSnapshot.start()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if has_app_context():
+                g.pop('uas_config_snapshot', None)
+    return wrapper
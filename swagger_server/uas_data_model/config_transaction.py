@@ -0,0 +1,243 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+"""Multi-object Transactions on the UAS Configuration in ETCD
+
+Some changes to the UAS configuration involve several objects that
+have to change together, for example making an image the default
+image means making whatever image was the default before no longer
+the default.  Done as separate writes, two such changes made at the
+same time can interleave and leave two default images behind.  A
+ConfigTransaction collects the puts and removes making up a change and
+commits them to ETCD in a single transaction.
+
+Each data model class involved in a transaction has a version key in
+ETCD (outside of the configuration itself) that every transaction on
+that class updates.  A transaction reads the version keys before
+looking at the objects it is going to change, and only commits if none
+of them has changed since, so a transaction never commits changes
+worked out from data that another transaction has changed in the
+meantime.  When that happens, the change is worked out again from the
+current data and retried.
+
+The values stored are encoded the same way the data model stores them
+(see encode_model()), and storing an instance of a data model class
+that is not registered yet registers it in the same transaction.
+Whether the ETCD client can do transactions is decided once for each
+client type; if it cannot, the changes are simply made one at a time
+as before.
+
+"""
+from __future__ import absolute_import
+import functools
+import uuid
+from swagger_server import ETCD_INSTANCE, ETCD_PREFIX
+from swagger_server.uas_lib.uas_logging import logger
+from swagger_server.uas_data_model.config_replica import encode_model
+from swagger_server.uas_data_model.config_snapshot import config_changed
+
+# Where the version keys of data model classes are kept.
+VERSION_PREFIX = "%s/transactions" % ETCD_PREFIX.rsplit('/', 1)[0]
+
+# How many times a transaction is worked out and tried before giving up.
+TRANSACTION_ATTEMPTS = 5
+
+
+@functools.lru_cache(maxsize=None)
+def client_transactions(client_type):
+    """Determine whether ETCD clients of type 'client_type' can make
+    transactions.  This is only worked out once for each client type.
+
+    """
+    supported = callable(getattr(client_type, 'transaction', None))
+    if not supported:
+        logger.warning(
+            "ETCD client %s cannot make transactions, making changes one "
+            "at a time", client_type.__name__
+        )
+    return supported
+
+
+def version_key(model):
+    """Get the ETCD key of the transaction version of 'model' (a data model
+    class).
+
+    """
+    return "%s/%s" % (VERSION_PREFIX, model.__name__)
+
+
+def prefix_range_end(prefix):
+    """Get the end of the ETCD key range covering every key that starts
+    with 'prefix'.
+
+    """
+    prefix = prefix.encode('utf-8')
+    return prefix[:-1] + bytes([prefix[-1] + 1])
+
+
+class ConfigTransaction:
+    """A set of data model changes to be committed together, guarded by
+    the versions of the data model classes involved.
+
+    """
+    def __init__(self, models, etcd=None):
+        """Constructor, reads the versions of 'models' (data model classes)
+        as of now.
+
+        """
+        self.etcd = etcd if etcd is not None else ETCD_INSTANCE
+        self.versions = {}
+        self.supported = client_transactions(type(self.etcd))
+        if self.supported:
+            for model in models:
+                _, meta = self.etcd.get(version_key(model))
+                self.versions[version_key(model)] = (
+                    meta.mod_revision if meta is not None else 0
+                )
+        self.changes = {}
+        self.cleared = []
+
+    def put(self, obj):
+        """Store 'obj' (a data model object) as part of the transaction.
+
+        """
+        self.changes[id(obj)] = (obj, False)
+
+    def remove(self, obj):
+        """Remove 'obj' (a data model object) as part of the transaction.
+
+        """
+        self.changes[id(obj)] = (obj, True)
+
+    def remove_all(self, model):
+        """Remove every instance of 'model' (a data model class) as part of
+        the transaction.
+
+        """
+        self.cleared.append(model)
+
+    def __ops(self):
+        """Compose the ETCD transaction operations that make the changes.
+
+        """
+        # Register the classes of stored instances that are not
+        # registered yet along with the rest of the changes.
+        registrations = {}
+        for obj, removed in self.changes.values():
+            registration = getattr(type(obj), 'registration', None)
+            if registration is not None and not removed:
+                registrations[type(obj)] = registration()
+        for registration in registrations.values():
+            if registration is not None:
+                self.put(registration)
+        writes = {}
+        for obj, removed in self.changes.values():
+            key, value = encode_model(obj)
+            # Only the last write of any key counts (ETCD does not allow
+            # more than one in a transaction).
+            writes.pop(key, None)
+            writes[key] = None if removed else value
+        transactions = self.etcd.transactions
+        ops = [
+            transactions.delete(
+                model.model_prefix + "/",
+                range_end=prefix_range_end(model.model_prefix + "/")
+            )
+            for model in self.cleared
+        ]
+        ops += [
+            transactions.delete(key) if value is None
+            else transactions.put(key, value)
+            for key, value in writes.items()
+        ]
+        ops += [
+            transactions.put(key, str(uuid.uuid4()))
+            for key in self.versions
+        ]
+        return ops
+
+    def __changed(self):
+        """Let the data model know about the changes that were made.
+
+        """
+        for model in self.cleared:
+            model.note_all_removed()
+        for obj, removed in self.changes.values():
+            obj.note_changed(removed)
+
+    def __commit_one_by_one(self):
+        """Make the changes as separate writes.
+
+        """
+        for model in self.cleared:
+            for obj in model.get_all() or []:
+                obj.remove()
+        for obj, removed in self.changes.values():
+            if removed:
+                obj.remove()
+            else:
+                obj.put()
+
+    def commit(self):
+        """Commit the changes to ETCD unless any of the versions the
+        transaction is guarded by has changed.  Return True if the
+        changes were made.
+
+        """
+        if not self.supported:
+            self.__commit_one_by_one()
+            return True
+        transactions = self.etcd.transactions
+        compare = [
+            transactions.mod(key) == revision
+            for key, revision in self.versions.items()
+        ]
+        succeeded, _ = self.etcd.transaction(
+            compare=compare,
+            success=self.__ops(),
+            failure=[]
+        )
+        if succeeded:
+            self.__changed()
+        return succeeded
+
+
+def run_transaction(build, models):
+    """Work out a change to the UAS configuration by calling 'build' with
+    a new ConfigTransaction and commit it, working it out again if
+    anything in 'models' (data model classes) changed in the meantime.
+    Return True if the change was made, False if it could not be made
+    after several attempts.
+
+    """
+    for attempt in range(TRANSACTION_ATTEMPTS):
+        txn = ConfigTransaction(models)
+        # Make sure 'build' sees everything up to the versions just read.
+        for model in models:
+            config_changed(model)
+        build(txn)
+        if txn.commit():
+            return True
+        logger.info(
+            "UAS configuration changed during transaction, retrying "
+            "(attempt %d)", attempt + 1
+        )
+    return False
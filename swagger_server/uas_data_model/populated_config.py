@@ -27,6 +27,10 @@ from etcd3_model import (
     Etcd3Attr
 )
 from swagger_server import ETCD_PREFIX, ETCD_INSTANCE, version
+from swagger_server.uas_data_model.config_snapshot import (
+    config_changed,
+    config_source
+)
 
 
 #pylint: disable=too-few-public-methods
@@ -54,3 +58,56 @@ class PopulatedConfig(Etcd3Model):
 
     # The configuration object name stored in etcd
     config_name = Etcd3Attr(is_object_id=True)  # Read-only
+
+    def put(self):
+        """Wrap the Etcd3Model().put() method to keep the request's
+        configuration snapshot and the in-process replica up to date.
+
+        """
+        super().put()
+        self.note_changed()
+
+    def remove(self):
+        """Wrap the Etcd3Model().remove() method to keep the request's
+        configuration snapshot and the in-process replica up to date.
+
+        """
+        super().remove()
+        self.note_changed(removed=True)
+
+    def note_changed(self, removed=False):  # pylint: disable=unused-argument
+        """Note that this instance has been stored (or removed) in ETCD,
+        so that the change is seen by the request's configuration
+        snapshot and the in-process replica.
+
+        """
+        config_changed(type(self))
+
+    @classmethod
+    def note_all_removed(cls):
+        """Note that all instances of the class have been removed from
+        ETCD, so no configuration table is populated any more.
+
+        """
+        config_changed(cls)
+
+    @classmethod
+    def is_populated(cls, config_name):
+        """Determine whether the configuration table called 'config_name'
+        is populated (registered).  This is answered from the request's
+        configuration snapshot or the in-process replica (which keeps
+        up with changes made anywhere by watching ETCD) when they can
+        be used, so it normally does not go to ETCD.  There is no other
+        memo of registrations: with the replica turned off (see
+        etcd_replica_enabled()), lookups made outside of an API request
+        go to ETCD every time.
+
+        """
+        source = config_source()
+        usable, ret = (
+            source.get(cls, config_name) if source is not None
+            else (False, None)
+        )
+        if not usable:
+            ret = cls.get(config_name)
+        return ret is not None
@@ -127,12 +127,8 @@ class UAIClass(UASDataModel):
         """ Retrieve the current default UAI / Broker Class, if any.
 
         """
-        uai_classes = UAIClass.get_all()
-        if uai_classes is not None:
-            for uai_class in uai_classes:
-                if uai_class.default:  # pylint: disable=no-member
-                    return uai_class
-        return None
+        uai_classes = UAIClass.get_by_index('default', True)
+        return uai_classes[0] if uai_classes else None
 
     def expand(self):
         """Produce a dictionary of the publicly viewable elements of the
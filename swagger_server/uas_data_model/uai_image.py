@@ -68,11 +68,16 @@ class UAIImage(UASDataModel):
         return it, otherwise return None.
 
         """
-        imgs = cls.get_all()
-        imgs = [] if imgs is None else imgs
-        #pylint: disable=no-member
-        img_dict = {img.imagename: img for img in imgs}
-        return img_dict.get(imagename, None)
+        imgs = cls.get_by_index('imagename', imagename)
+        return imgs[-1] if imgs else None
+
+    @classmethod
+    def get_default(cls):
+        """Retrieve the current default image, if any.
+
+        """
+        imgs = cls.get_by_index('default', True)
+        return imgs[0] if imgs else None
 
     def expand(self):
         """Produce a dictionary of the publicly viewable elements of the
@@ -421,11 +421,8 @@ class UAIVolume(UASDataModel):
         return it, if not return None.
 
         """
-        vols = cls.get_all()
-        vols = [] if vols is None else vols
-        # pylint: disable=no-member
-        vol_dict = {vol.volumename: vol for vol in vols}
-        return vol_dict.get(volumename, None)
+        vols = cls.get_by_index('volumename', volumename)
+        return vols[-1] if vols else None
 
     def expand(self):
         """Produce a dictionary of the publicly viewable elements of the
@@ -24,6 +24,12 @@
 from __future__ import absolute_import
 from etcd3_model import Etcd3Model
 from swagger_server.uas_data_model.populated_config import PopulatedConfig
+from swagger_server.uas_data_model.config_replica import index_values
+from swagger_server.uas_data_model.config_transaction import run_transaction
+from swagger_server.uas_data_model.config_snapshot import (
+    config_changed,
+    config_source
+)
 
 
 # pylint: disable=too-few-public-methods
@@ -86,6 +92,16 @@ class UASDataModel(Etcd3Model):
     - A call to other class methods will be passed through to the
       Etcd3Model parent as presented.
 
+    get() and get_all() are served from the request's ConfigSnapshot
+    if there is one, otherwise from the in-process ConfigReplica if it
+    is turned on, and only go to ETCD if neither can be used.  put(),
+    remove() and delete() make sure the change is seen by both.
+    get_by_index() uses the indexes kept by those to find instances by
+    attribute value without looking through all of them.
+
+    transaction() makes changes to several instances (of any data model
+    classes) in a single ETCD transaction.
+
     """
     # Each data model has a 'kind' that describes it.  Make a default 'kind'
     # here to set the tone.
@@ -98,15 +114,27 @@ class UASDataModel(Etcd3Model):
         known class yet or not.
 
         """
-        return PopulatedConfig.get(cls.__name__)
+        return PopulatedConfig.is_populated(cls.__name__)
 
     @classmethod
     def register(cls):
         """Register a given UASDataModel class as a known class.
 
         """
-        if not cls._is_registered():
-            PopulatedConfig(config_name=cls.__name__).put()
+        registration = cls.registration()
+        if registration is not None:
+            registration.put()
+
+    @classmethod
+    def registration(cls):
+        """Get the PopulatedConfig instance that needs to be stored to
+        register a given UASDataModel class, or None if it is already
+        registered.
+
+        """
+        if cls._is_registered():
+            return None
+        return PopulatedConfig(config_name=cls.__name__)
 
     # Wrapper methods for Etcd3Model classmethods that work with
     # classes to handle registration and cases where classes are not
@@ -128,8 +156,41 @@ class UASDataModel(Etcd3Model):
         """
         if not cls._is_registered():
             return None
+        source = config_source()
+        if source is not None:
+            usable, ret = source.get_all(cls)
+            if usable:
+                return ret
         return super().get_all()
 
+    @classmethod
+    def get_by_index(cls, attr, value):
+        """Get the list of instances of the class whose 'attr' is 'value'
+        (or, if 'attr' is a list, contains 'value'), in object ID order.
+        The empty list is returned if there are none or the class is
+        not registered yet.
+
+        """
+        if not cls._is_registered():
+            return []
+        source = config_source()
+        usable, index = (
+            source.get_index(cls, attr) if source is not None
+            else (False, None)
+        )
+        if not usable:
+            return [
+                obj for obj in super().get_all() or []
+                if value in index_values(obj, attr)
+            ]
+        # The index may be a little behind the instances themselves, so
+        # make sure each one still matches.
+        objs = [cls.get(object_id) for object_id in index.get(value, ())]
+        return [
+            obj for obj in objs
+            if obj is not None and value in index_values(obj, attr)
+        ]
+
     @classmethod
     def watch(cls):
         """Wrap Etcd3Model.watch() and bypass it if the class is not
@@ -156,6 +217,55 @@ class UASDataModel(Etcd3Model):
         if not self._is_registered():
             self.register()
         super().put()
+        self.note_changed()
+
+    def remove(self):
+        """Wrap the Etcd3Model().remove() method to keep the request's
+        configuration snapshot and the in-process replica up to date.
+
+        """
+        super().remove()
+        self.note_changed(removed=True)
+
+    def delete(self):
+        """Wrap the Etcd3Model().delete() method to keep the request's
+        configuration snapshot and the in-process replica up to date.
+
+        """
+        super().delete()
+        self.note_changed(removed=True)
+
+    # pylint: disable=unused-argument
+    def note_changed(self, removed=False):
+        """Note that this instance has been stored (or removed) in ETCD,
+        so that the change is seen by the request's configuration
+        snapshot and the in-process replica.
+
+        """
+        config_changed(type(self))
+
+    @classmethod
+    def note_all_removed(cls):
+        """Note that all instances of the class have been removed from
+        ETCD (see note_changed()).
+
+        """
+        config_changed(cls)
+
+    @staticmethod
+    def transaction(build, *models):
+        """Make a change to the UAS configuration atomically.  'build' is
+        called with a ConfigTransaction, looks at the current data and
+        calls the transaction's put(), remove() and remove_all()
+        methods with the changes to be made, which are then committed
+        in one ETCD transaction.  If anything in the data model
+        classes listed in 'models' was changed by another transaction
+        in the meantime, the change is worked out again by calling
+        'build' again.  Return True if the change was made, False if
+        it could not be made because of repeated conflicts.
+
+        """
+        return run_transaction(build, models)
 
     # pylint: disable=arguments-differ
     @classmethod
@@ -169,7 +279,42 @@ class UASDataModel(Etcd3Model):
         exception for calling expand() on a NoneType.
 
         """
-        ret = super().get(object_id)
+        source = config_source()
+        usable, ret = (
+            source.get(cls, object_id) if source is not None
+            else (False, None)
+        )
+        if not usable:
+            ret = super().get(object_id)
         if ret is None and expandable:
             ret = ExpandableStub(cls.kind, object_id)
         return ret
+
+    @classmethod
+    def get_many(cls, object_ids, expandable=False):
+        """Get the instances of the class with the listed object IDs, all
+        at once, as a dictionary of object ID to instance.  IDs that
+        are not found are left out, or, if 'expandable' is requested,
+        map to an expandable object as with get().
+
+        """
+        object_ids = set(object_ids)
+        if not object_ids:
+            return {}
+        source = config_source()
+        usable, ret = (
+            source.get_many(cls, object_ids) if source is not None
+            else (False, None)
+        )
+        if not usable:
+            ret = {}
+            for object_id in object_ids:
+                ret[object_id] = super().get(object_id)
+        for object_id, obj in list(ret.items()):
+            if obj is not None:
+                continue
+            if expandable:
+                ret[object_id] = ExpandableStub(cls.kind, object_id)
+            else:
+                del ret[object_id]
+        return ret
@@ -0,0 +1,136 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+"""Data Model for Pending Vault Cleanups
+"""
+from __future__ import absolute_import
+from etcd3_model import (
+    Etcd3Model,
+    Etcd3Attr
+)
+from swagger_server import ETCD_INSTANCE, version
+from swagger_server.uas_data_model.config_replica import encode_model
+from swagger_server.uas_data_model.config_transaction import (
+    client_transactions
+)
+
+# Pending Vault cleanups are work, not configuration, so they are kept
+# outside of the UAS configuration and survive a factory reset.
+VAULT_CLEANUP_PREFIX = "/cray/uas_mgr/work"
+
+
+#pylint: disable=too-few-public-methods
+class VaultCleanup(Etcd3Model):
+    """
+    A Pending Removal of the Broker UAI Data in Vault of a Deleted UAI
+    Class
+
+        Fields:
+            class_id: the class identifier of the deleted UAI class
+            kind: "VaultCleanup"
+            api_version: the data model version for this instance
+            queued: when the cleanup was queued (seconds since the epoch)
+            attempts: the number of failed attempts so far
+            next_attempt: when the cleanup is next due (seconds since
+                          the epoch)
+            last_error: why the last attempt failed
+    """
+    etcd_instance = ETCD_INSTANCE
+    model_prefix = "%s/%s" % (VAULT_CLEANUP_PREFIX, "VaultCleanup")
+
+    # The class identifier of the deleted UAI class, which is also the
+    # Object ID, so a class is never queued for cleanup twice.
+    class_id = Etcd3Attr(is_object_id=True)  # Read-only after creation
+
+    # The kind of object that the data here represent.  Should always
+    # contain "VaultCleanup".  Protects against stray data types.
+    kind = Etcd3Attr(default="VaultCleanup")  # Read only
+
+    # The Data Model version corresponding to this Vault Cleanup's data.
+    # Will always be equal to the UAS Manager service version under
+    # which the data were stored in ETCD.  Protects against
+    # incompatible data.
+    api_version = Etcd3Attr(default=version)  # Read only
+
+    # When the cleanup was queued.
+    queued = Etcd3Attr(default=None)
+
+    # The number of failed attempts to clean up so far.
+    attempts = Etcd3Attr(default=0)
+
+    # When the cleanup is next due, 0 means right away.
+    next_attempt = Etcd3Attr(default=0)
+
+    # Why the last attempt failed, if it did.
+    last_error = Etcd3Attr(default=None)
+
+    def revision(self):
+        """Get the ETCD mod revision of this cleanup as stored right now, or
+        None if it is not stored (any more).
+
+        """
+        _, meta = self.etcd_instance.get(
+            "%s/%s" % (self.model_prefix, self.class_id)
+        )
+        return None if meta is None else meta.mod_revision
+
+    def update(self, revision):
+        """Store this cleanup only if what is stored is still at 'revision'
+        (see revision()), so that a cleanup another UAS Manager has
+        finished (and removed) or worked on in the meantime is left
+        alone.  Return True if the cleanup was stored.
+
+        """
+        etcd = self.etcd_instance
+        if not client_transactions(type(etcd)):
+            # Without transactions, at least never bring back a cleanup
+            # that has been removed.
+            if self.revision() is None:
+                return False
+            self.put()
+            return True
+        key, value = encode_model(self)
+        succeeded, _ = etcd.transaction(
+            compare=[etcd.transactions.mod(key) == revision],
+            success=[etcd.transactions.put(key, value)],
+            failure=[]
+        )
+        return succeeded
+
+    def note_changed(self, removed=False):
+        """Called when this instance has been stored (or removed) as part of
+        a UAS configuration transaction.  Nothing is kept in process
+        about pending cleanups, so there is nothing to do.
+
+        """
+
+    def expand(self):
+        """Produce a dictionary of the publicly viewable elements of the
+        object.
+
+        """
+        return {
+            'class_id': self.class_id,
+            'queued': self.queued,
+            'attempts': self.attempts,
+            'next_attempt': self.next_attempt,
+            'last_error': self.last_error
+        }
@@ -0,0 +1,168 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+""" Process-wide Kubernetes API client.
+
+Loading the in-cluster configuration and building a Kubernetes API
+client (with its own urllib3 connection pool) for every UAS request
+means a new TLS handshake with the API server on almost every request.
+Instead, one API client is built the first time it is needed and shared
+by every UasBase instance (and thread) in the process.
+
+"""
+import os
+import socket
+import threading
+from urllib3.connection import HTTPConnection
+from kubernetes import config
+from kubernetes.client import ApiClient, Configuration
+from kubernetes.config.incluster_config import SERVICE_TOKEN_FILENAME
+from swagger_server.uas_lib.uas_logging import logger
+
+# Default number of connections to the Kubernetes API server kept in
+# the connection pool.  Watches each hold a connection for their
+# duration, so leave room for those on top of request concurrency.
+K8S_POOL_MAXSIZE = 16
+
+# TCP keepalive probing on pooled API server connections, so idle
+# connections that are dropped by something in the middle are detected
+# and not handed out to a request.
+K8S_KEEPALIVE_OPTIONS = [
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+for _opt, _val in (
+        ('TCP_KEEPIDLE', 60),
+        ('TCP_KEEPINTVL', 15),
+        ('TCP_KEEPCNT', 4),
+):
+    if hasattr(socket, _opt):
+        K8S_KEEPALIVE_OPTIONS.append(
+            (socket.IPPROTO_TCP, getattr(socket, _opt), _val)
+        )
+
+_API_CLIENT = None
+_API_CLIENT_LOCK = threading.Lock()
+
+
+def k8s_pool_maxsize():
+    """Get the maximum number of pooled connections to the Kubernetes API
+    server.  UAS_K8S_POOL_MAXSIZE comes from config in the Helm chart.
+
+    """
+    try:
+        return max(1, int(os.environ.get('UAS_K8S_POOL_MAXSIZE', K8S_POOL_MAXSIZE)))
+    except ValueError:
+        return K8S_POOL_MAXSIZE
+
+
+class ServiceAccountToken:
+    """Keep the bearer token in a Kubernetes client configuration current
+    with the service account token file, re-reading the file whenever
+    it changes (token rotation replaces the file, so its inode and/or
+    modification time change).
+
+    """
+    def __init__(self, path=SERVICE_TOKEN_FILENAME):
+        """Constructor
+
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.stamp = None
+        self.token = None
+
+    def __deepcopy__(self, memo):
+        """Kubernetes client configurations get deep copied (including their
+        refresh hook), and all copies should share one token tracker.
+
+        """
+        return self
+
+    def refresh(self, configuration):
+        """Refresh hook for the Kubernetes client configuration, called
+        before each API request needing the token.
+
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError as err:
+            # Keep using the token we have, it may still be good.
+            logger.warning(
+                "unable to check service account token %s: %s",
+                self.path,
+                err
+            )
+            return
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            if stamp != self.stamp:
+                self.__reload(stamp)
+            if self.token is not None:
+                configuration.api_key['authorization'] = self.token
+
+    def __reload(self, stamp):
+        """Re-read the token file, called with the lock held.
+
+        """
+        with open(self.path, encoding='utf-8') as token_file:
+            token = token_file.read().strip()
+        if not token:
+            # Caught mid-rotation, try again next time.
+            return
+        if self.stamp is not None:
+            logger.info("service account token changed, reloading")
+        self.token = "bearer " + token
+        self.stamp = stamp
+
+
+def get_api_client():
+    """Get the process-wide Kubernetes API client, creating it the first
+    time this is called.
+
+    """
+    global _API_CLIENT  # pylint: disable=global-statement
+    with _API_CLIENT_LOCK:
+        if _API_CLIENT is not None:
+            return _API_CLIENT
+        k8s_config = Configuration()
+        # The token is managed by ServiceAccountToken below instead of
+        # being re-read every minute by the in-cluster config loader.
+        config.load_incluster_config(
+            client_configuration=k8s_config,
+            try_refresh_token=False
+        )
+        k8s_config.connection_pool_maxsize = k8s_pool_maxsize()
+        k8s_config.refresh_api_key_hook = ServiceAccountToken().refresh
+        # Anything else that builds a client from the default
+        # configuration should get the same settings.
+        Configuration.set_default(k8s_config)
+        api_client = ApiClient(configuration=k8s_config)
+        # Only affects connection pools created from here on, which is
+        # all of them since nothing has been sent yet.
+        api_client.rest_client.pool_manager.connection_pool_kw[
+            'socket_options'
+        ] = HTTPConnection.default_socket_options + K8S_KEEPALIVE_OPTIONS
+        logger.info(
+            "created Kubernetes API client (pool size %d)",
+            k8s_config.connection_pool_maxsize
+        )
+        _API_CLIENT = api_client
+        return _API_CLIENT
@@ -0,0 +1,183 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+""" Cached network configuration from SLS.
+
+The network list from SLS is used to pick the Bifurcated CAN address
+pool for UAI services, which is looked up several times in every UAI
+creation.  The network configuration almost never changes, so the list
+is kept for a configurable time and then refreshed in the background,
+while the list already in hand continues to be used.  If SLS cannot be
+reached, the last list successfully retrieved keeps being used
+(stale-if-error) and the failure is counted in the UAS Manager metrics.
+
+"""
+import os
+import json
+import threading
+import time
+import requests
+from swagger_server.uas_lib.uas_logging import logger
+from swagger_server.uas_lib import uas_metrics
+from swagger_server.uas_lib.uas_http import SLS
+
+SLS_NETWORKS_URL = "http://cray-sls/v1/networks"
+
+# Default number of seconds a network list from SLS is used before it
+# is refreshed.
+SLS_CACHE_TTL = 300
+
+# Number of seconds to wait before trying SLS again after a failure
+# (unless the TTL is shorter).
+SLS_RETRY_INTERVAL = 10
+
+
+def sls_cache_ttl():
+    """Get the number of seconds a network list from SLS is used before
+    it is refreshed.  UAS_SLS_CACHE_TTL comes from config in the Helm
+    chart.
+
+    """
+    try:
+        return max(0, int(os.environ.get('UAS_SLS_CACHE_TTL', SLS_CACHE_TTL)))
+    except ValueError:
+        return SLS_CACHE_TTL
+
+
+class SlsNetworks:
+    """Process-wide cache of the network list from SLS.
+
+    """
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(self):
+        """Constructor
+
+        """
+        self.lock = threading.Lock()
+        self.networks = None
+        self.expires = None
+        self.refreshing = False
+        self.loaded = threading.Event()
+
+    @classmethod
+    def get_instance(cls):
+        """Get the process-wide SLS network cache.
+
+        """
+        with cls.__instance_lock:
+            if cls.__instance is None:
+                cls.__instance = SlsNetworks()
+            return cls.__instance
+
+    def reset(self):
+        """Forget the cached network list, so the next get() retrieves it
+        from SLS.
+
+        """
+        with self.lock:
+            self.networks = None
+            self.expires = None
+            self.refreshing = False
+            self.loaded.clear()
+
+    @staticmethod
+    def fetch():
+        """Call into the SLS to get the list of configured networks.
+        Return None if that fails.
+
+        """
+        logger.debug("retrieving SLS network data")
+        try:
+            response = SLS.get(SLS_NETWORKS_URL)
+            # raise exception for 4XX and 5XX errors
+            response.raise_for_status()
+        except requests.exceptions.RequestException as err:
+            logger.warning(
+                "retrieving BICAN information %r %r", type(err), err
+            )
+            return None
+        except Exception as err:  # pylint: disable=broad-except
+            logger.warning(
+                "retrieving BICAN information %r %r", type(err), err
+            )
+            return None
+        try:
+            ret = response.json() or []
+        except json.decoder.JSONDecodeError as err:
+            logger.warning(
+                "decoding BICAN information %r %r", type(err), err
+            )
+            return None
+        logger.debug("retrieved SLS network data: %s", ret)
+        return ret
+
+    def refresh(self):
+        """Retrieve the network list from SLS and update the cache with it,
+        or, if that fails, keep the list we have and try again later.
+
+        """
+        networks = self.fetch()
+        uas_metrics.increment('sls_refreshes')
+        ttl = sls_cache_ttl()
+        with self.lock:
+            self.refreshing = False
+            if networks is None:
+                uas_metrics.increment('sls_refresh_failures')
+                if self.networks is not None:
+                    logger.warning(
+                        "unable to refresh SLS network data, using data "
+                        "from before"
+                    )
+                self.expires = time.monotonic() + min(ttl, SLS_RETRY_INTERVAL)
+                return
+            self.networks = networks
+            self.expires = time.monotonic() + ttl
+
+    def get(self):
+        """Get the list of configured networks from SLS, retrieving it the
+        first time this is called and refreshing it in the background
+        once it is older than the TTL.  Returns an empty list if the
+        network list has never been successfully retrieved.
+
+        """
+        with self.lock:
+            first = self.expires is None
+            if first:
+                self.refreshing = True
+                self.expires = float('inf')
+            elif time.monotonic() >= self.expires and not self.refreshing:
+                self.refreshing = True
+                threading.Thread(
+                    target=self.refresh,
+                    name="uas-sls-refresh",
+                    daemon=True
+                ).start()
+        if first:
+            self.refresh()
+            self.loaded.set()
+        else:
+            # Only waits while the first retrieval is in progress.
+            self.loaded.wait(timeout=SLS_RETRY_INTERVAL + 5)
+        with self.lock:
+            networks = self.networks
+        return networks if networks is not None else []
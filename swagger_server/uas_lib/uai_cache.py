@@ -0,0 +1,488 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+""" Watch-backed in-memory cache of UAI Jobs, Pods and Services.
+
+The cache lists and then watches all 'uas=managed' Jobs, Pods and
+Services once per process and keeps them current using resource
+version based watches.  UasBase uses it, when it is enabled and in
+sync, to answer UAI queries without going to the Kubernetes API
+server.
+
+Objects this process creates or deletes are put into (or taken out of)
+the cache as soon as the Kubernetes API call succeeds, so a request
+that follows a change made by this process sees that change without
+waiting for the watch to deliver it.  Watch events for an object this
+process has deleted are ignored until the watch reports the deletion
+(or the cache stops trusting itself), so a late update cannot bring the
+object back.
+
+"""
+import os
+import time
+import threading
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from swagger_server.uas_lib.uas_logging import logger
+
+# All UAI Jobs, Pods and Services carry this label.
+UAI_LABEL_SELECTOR = "uas=managed"
+
+# Server side timeout (in seconds) on each watch request.  When a
+# watch times out it is simply re-established from the last known
+# resource version, so this mainly bounds how long a silently broken
+# connection can go unnoticed.
+UAI_CACHE_WATCH_TIMEOUT = 60
+
+# How long (in seconds) to wait before retrying after a failed list or
+# watch.
+UAI_CACHE_RETRY_DELAY = 5
+
+# HTTP status returned when a watch resource version is too old.
+HTTP_GONE = 410
+
+
+def uai_cache_enabled():
+    """Determine whether the UAI cache is turned on.  UAS_K8S_CACHE comes
+    from config in the Helm chart.
+
+    """
+    return os.environ.get('UAS_K8S_CACHE', 'false').lower() == 'true'
+
+
+def uai_cache_max_staleness():
+    """Get the number of seconds the cache may go without confirming that
+    it is in sync before UAS stops trusting it and goes back to the
+    Kubernetes API server.
+
+    """
+    try:
+        return float(os.environ.get('UAS_K8S_CACHE_MAX_STALENESS', '120'))
+    except ValueError:
+        return 120.0
+
+
+def parse_selectors(selectors):
+    """Parse a list of equality based label or field selector strings
+    (each of which may itself be a comma separated list) into a list
+    of (key, operator, value) tuples.  Return None if any of the
+    selectors is not an equality based selector, since those cannot be
+    evaluated locally.
+
+    """
+    ret = []
+    for selector in selectors or []:
+        for term in selector.split(','):
+            term = term.strip()
+            if not term:
+                continue
+            for operator in ('!=', '==', '='):
+                if operator in term:
+                    key, value = term.split(operator, 1)
+                    break
+            else:
+                # Existence selector (e.g. 'app' or '!app'), not handled
+                return None
+            key = key.strip()
+            value = value.strip()
+            if not key or any(char in key + value for char in '() !'):
+                # Set based selector (e.g. 'app in (a,b)'), not handled
+                return None
+            ret.append((key, '!=' if operator == '!=' else '=', value))
+    return ret
+
+
+def _match(actual, operator, value):
+    """Compare an actual value to a selector value using the specified
+    operator using Kubernetes selector semantics (a missing value
+    never equals anything).
+
+    """
+    if operator == '=':
+        return actual is not None and actual == value
+    return actual is None or actual != value
+
+
+def _job_field(job, field):
+    """Retrieve the value of a Job field as a string suitable for
+    comparison against a field selector.  Return None if the field is
+    not one that can be evaluated locally.
+
+    """
+    if field == "metadata.name":
+        return job.metadata.name
+    if field == "metadata.namespace":
+        return job.metadata.namespace
+    if field == "status.successful":
+        # The 'status.successful' field selector maps onto the Job's
+        # 'status.succeeded' count.
+        return str((job.status.succeeded or 0) if job.status else 0)
+    return None
+
+
+def _supported_job_fields(fields):
+    """Check that a parsed list of field selectors only refers to fields
+    that can be evaluated locally.
+
+    """
+    supported = ["metadata.name", "metadata.namespace", "status.successful"]
+    return all(field[0] in supported for field in fields)
+
+
+class Reflector:
+    """Keep an in-memory copy of one kind of UAI object (Jobs, Pods or
+    Services) in sync with Kubernetes using a list followed by a
+    resource version based watch.
+
+    """
+    def __init__(self, kind, list_func):
+        """Constructor
+
+        """
+        self.kind = kind
+        self.list_func = list_func
+        self.lock = threading.RLock()
+        self.objects = {}
+        self.by_app = {}
+        self.deleted = {}
+        self.synced = threading.Event()
+        self.last_sync = None
+        self.thread = None
+
+    def start(self):
+        """Start the background thread that maintains the cache.
+
+        """
+        self.thread = threading.Thread(
+            target=self.run,
+            name="uai-cache-%s" % self.kind,
+            daemon=True
+        )
+        self.thread.start()
+
+    @staticmethod
+    def __key(obj):
+        """Compute the cache key of an object.
+
+        """
+        return (obj.metadata.namespace, obj.metadata.name)
+
+    @staticmethod
+    def __app(obj):
+        """Get the 'app' label (the UAI name) of an object.
+
+        """
+        labels = obj.metadata.labels or {}
+        return labels.get('app', None)
+
+    def __store(self, obj):
+        """Add or replace an object in the cache.
+
+        """
+        key = self.__key(obj)
+        self.__discard(key)
+        self.objects[key] = obj
+        app = self.__app(obj)
+        if app is not None:
+            self.by_app.setdefault(app, set()).add(key)
+
+    def __discard(self, key):
+        """Remove an object from the cache by its key if it is present.
+
+        """
+        old = self.objects.pop(key, None)
+        if old is None:
+            return
+        app = self.__app(old)
+        keys = self.by_app.get(app, set())
+        keys.discard(key)
+        if not keys:
+            self.by_app.pop(app, None)
+
+    def __was_deleted(self, key):
+        """Determine whether an object has been deleted by this process and
+        the deletion is not yet known to the watch.
+
+        """
+        deleted = self.deleted.get(key, None)
+        if deleted is None:
+            return False
+        if time.monotonic() - deleted > uai_cache_max_staleness():
+            del self.deleted[key]
+            return False
+        return True
+
+    def __mark_synced(self):
+        """Record that the cache is known to be in sync right now.
+
+        """
+        self.last_sync = time.monotonic()
+
+    def relist(self):
+        """Replace the cache contents with a fresh listing and return the
+        resource version to watch from.
+
+        """
+        logger.debug("UAI cache listing %s", self.kind)
+        resp = self.list_func(label_selector=UAI_LABEL_SELECTOR)
+        with self.lock:
+            self.objects = {}
+            self.by_app = {}
+            for obj in resp.items:
+                if not self.__was_deleted(self.__key(obj)):
+                    self.__store(obj)
+            self.__mark_synced()
+        self.synced.set()
+        return resp.metadata.resource_version
+
+    def watch(self, resource_version):
+        """Apply watch events to the cache starting at the specified resource
+        version until the watch times out.  Return the last resource
+        version seen.
+
+        """
+        watcher = watch.Watch()
+        for event in watcher.stream(
+                self.list_func,
+                label_selector=UAI_LABEL_SELECTOR,
+                resource_version=resource_version,
+                timeout_seconds=UAI_CACHE_WATCH_TIMEOUT,
+                allow_watch_bookmarks=True
+        ):
+            with self.lock:
+                key = self.__key(event['object'])
+                if event['type'] in ('ADDED', 'MODIFIED'):
+                    if not self.__was_deleted(key):
+                        self.__store(event['object'])
+                elif event['type'] == 'DELETED':
+                    self.__discard(key)
+                    self.deleted.pop(key, None)
+                self.__mark_synced()
+        with self.lock:
+            # The watch ended cleanly, so we were in sync up to now.
+            self.__mark_synced()
+        return watcher.resource_version or resource_version
+
+    def run(self):
+        """Background loop: list, then watch, re-listing whenever the watch
+        resource version expires or something goes wrong.
+
+        """
+        resource_version = None
+        while True:
+            try:
+                if resource_version is None:
+                    resource_version = self.relist()
+                resource_version = self.watch(resource_version)
+            except ApiException as err:
+                if err.status == HTTP_GONE:
+                    logger.info(
+                        "UAI cache %s watch expired, re-listing", self.kind
+                    )
+                else:
+                    logger.warning(
+                        "UAI cache %s watch failed: %s", self.kind, err.reason
+                    )
+                    time.sleep(UAI_CACHE_RETRY_DELAY)
+                resource_version = None
+            except Exception as err:  # pylint: disable=broad-except
+                logger.warning(
+                    "UAI cache %s watch failed: %r", self.kind, err
+                )
+                resource_version = None
+                time.sleep(UAI_CACHE_RETRY_DELAY)
+
+    def staleness(self):
+        """Return the number of seconds since the cache was last known to be
+        in sync, or None if it has never synced.
+
+        """
+        with self.lock:
+            if self.last_sync is None:
+                return None
+            return time.monotonic() - self.last_sync
+
+    def fresh(self):
+        """Determine whether the cache is in sync recently enough to be used.
+
+        """
+        staleness = self.staleness()
+        return (
+            staleness is not None and
+            staleness <= uai_cache_max_staleness()
+        )
+
+    def created(self, obj):
+        """Put an object this process has just created into the cache
+        without waiting for the watch to report it.
+
+        """
+        with self.lock:
+            key = self.__key(obj)
+            self.deleted.pop(key, None)
+            self.__store(obj)
+
+    def removed(self, namespace, name):
+        """Take an object this process has just deleted out of the cache
+        without waiting for the watch to report it.
+
+        """
+        with self.lock:
+            key = (namespace, name)
+            self.__discard(key)
+            self.deleted[key] = time.monotonic()
+
+    def get(self, namespace, name):
+        """Get an object by namespace and name, None if it is not found.
+
+        """
+        with self.lock:
+            return self.objects.get((namespace, name), None)
+
+    def get_by_app(self, app):
+        """Get the list of objects whose 'app' label is 'app'.
+
+        """
+        with self.lock:
+            return [
+                self.objects[key] for key in self.by_app.get(app, set())
+            ]
+
+    def list(self):
+        """Get a list of all of the objects in the cache.
+
+        """
+        with self.lock:
+            return list(self.objects.values())
+
+
+class UaiCache:
+    """Process-wide, watch-backed, in-memory cache of UAI Jobs, Pods and
+    Services.
+
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, core_v1, batch_v1):
+        """Constructor
+
+        """
+        self.jobs = Reflector("jobs", batch_v1.list_job_for_all_namespaces)
+        self.pods = Reflector("pods", core_v1.list_pod_for_all_namespaces)
+        self.services = Reflector(
+            "services", core_v1.list_service_for_all_namespaces
+        )
+
+    @classmethod
+    def get_instance(cls, core_v1, batch_v1):
+        """Get the process-wide UAI cache, starting it the first time this is
+        called.  Returns None if the cache is not enabled.
+
+        """
+        if not uai_cache_enabled():
+            return None
+        with cls._instance_lock:
+            if cls._instance is None:
+                logger.info("starting UAI cache")
+                cls._instance = cls(core_v1, batch_v1)
+                for reflector in cls._instance.reflectors():
+                    reflector.start()
+            return cls._instance
+
+    def reflector(self, kind):
+        """Get the reflector for 'kind' ('job', 'pod' or 'service').
+
+        """
+        return {
+            'job': self.jobs,
+            'pod': self.pods,
+            'service': self.services,
+        }[kind]
+
+    def reflectors(self):
+        """Get the list of reflectors that make up the cache.
+
+        """
+        return [self.jobs, self.pods, self.services]
+
+    def fresh(self):
+        """Determine whether all of the parts of the cache are in sync
+        recently enough to be used.
+
+        """
+        return all(reflector.fresh() for reflector in self.reflectors())
+
+    def staleness(self):
+        """Report how long it has been since each part of the cache was last
+        known to be in sync (in seconds, None if never synced).
+
+        """
+        return {
+            reflector.kind: reflector.staleness()
+            for reflector in self.reflectors()
+        }
+
+    def select_jobs(self, labels, fields):
+        """Get the names of the UAI Jobs that match the specified label and
+        field selectors.  Return None if the selectors cannot be
+        evaluated locally.
+
+        """
+        label_sels = parse_selectors(labels)
+        field_sels = parse_selectors(fields)
+        if label_sels is None or field_sels is None:
+            return None
+        if not _supported_job_fields(field_sels):
+            return None
+        ret = []
+        for job in self.jobs.list():
+            job_labels = job.metadata.labels or {}
+            if not all(
+                    _match(job_labels.get(key, None), operator, value)
+                    for key, operator, value in label_sels
+            ):
+                continue
+            if not all(
+                    _match(_job_field(job, key), operator, value)
+                    for key, operator, value in field_sels
+            ):
+                continue
+            ret.append(job.metadata.name)
+        return ret
+
+    def get_uai_pods(self, job_name):
+        """Get the list of pods belonging to the named UAI.
+
+        """
+        return self.pods.get_by_app(job_name)
+
+    def get_uai_jobs(self, job_name):
+        """Get the list of Jobs (normally only one) for the named UAI.
+
+        """
+        return self.jobs.get_by_app(job_name)
+
+    def get_service(self, namespace, service_name):
+        """Get a UAI service by namespace and name, None if not found.
+
+        """
+        return self.services.get(namespace, service_name)
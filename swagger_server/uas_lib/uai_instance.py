@@ -23,8 +23,6 @@
 Container class for UAI Instances
 
 """
-import os
-import json
 import uuid
 import re
 from flask import abort
@@ -34,13 +32,7 @@ from kubernetes import client
 from swagger_server.uas_lib.uas_logging import logger
 from swagger_server.uas_lib.uas_auth import UAS_AUTH_LOGGER
 from swagger_server.uas_lib.vault import get_vault_path
-from swagger_server.uas_data_model.uai_resource import UAIResource
-from swagger_server.uas_data_model.uai_image import UAIImage
-
-# All UAIs have the following toleration to allow them to run
-# on nodes that are tainted against non-UAI activity.  The list
-# can be extended using UAI Class toleration lists.
-BASE_UAI_TOLERATIONS = [client.V1Toleration(key="uai_only", operator="Exists")]
+from swagger_server.uas_lib.uai_template import UAITemplate
 
 
 class UAIInstance:
@@ -213,99 +205,49 @@ class UAIInstance:
             ret['uas-class-id'] = uai_class.class_id
         return ret
 
-    # pylint: disable=too-many-locals
     def create_pod_template(self, uai_class, uas_cfg):
-        """Construct a pod template specification for a UAI of the given class.
+        """Construct a pod template specification for a UAI of the given
+        class.  Everything but the name, labels and environment comes
+        from the compiled template for the class, which must not be
+        modified, so any lists taken from it are copied.
 
         """
-        # If we are using macvlan then set that up in an annotation in
-        # the metadata of the job, otherwise, the annotations will be
-        # None. USE_MACVLAN comes from config in the Helm chart.  We
-        # only set this up in UAIs also have the 'uai_compute_network'
-        # flag. Some UAIs aren't on that network.
-        meta_annotations = None
-        if os.environ.get('USE_MACVLAN', 'true').lower() == 'true' and \
-           uai_class.uai_compute_network:
-            meta_annotations = {
-                'k8s.v1.cni.cncf.io/networks': 'macvlan-uas-nmn-conf@nmn1'
-            }
-
+        template = UAITemplate.get(uai_class, uas_cfg)
         pod_metadata = client.V1ObjectMeta(
             labels=self.gen_labels(uai_class),
-            annotations=meta_annotations
-        )
-        volume_list = uai_class.volume_list
-        resources = {}
-        if uai_class.resource_id is not None:
-            limit_json = UAIResource.get(uai_class.resource_id).limit
-            request_json = UAIResource.get(uai_class.resource_id).request
-            if limit_json:
-                resources['limits'] = json.loads(limit_json)
-            if request_json:
-                resources['requests'] = json.loads(request_json)
-        container_ports = uas_cfg.gen_port_list(
-            service=False,
-            opt_ports=[
-                int(port) for port in uai_class.opt_ports
-            ] if uai_class.opt_ports is not None else None
+            annotations=(
+                dict(template.annotations) if template.annotations
+                else None
+            )
         )
         logger.info(
             "UAI Name: %s; Container ports: %s; Optional ports: %s",
             self.job_name,
-            container_ports,
+            template.container_ports,
             uai_class.opt_ports
         )
 
         # Configure Pod template container
         container = client.V1Container(
             name=self.job_name,
-            image=UAIImage.get(uai_class.image_id).imagename,
-            resources=resources or None,
+            image=template.imagename,
+            resources=dict(template.resources) or None,
             env=self.get_env(uai_class),
-            ports=container_ports,
-            volume_mounts=uas_cfg.gen_volume_mounts(volume_list),
-            readiness_probe=uas_cfg.create_readiness_probe()
+            ports=list(template.container_ports),
+            volume_mounts=list(template.volume_mounts),
+            readiness_probe=template.readiness_probe
         )
-
-        # Create and configure affinity
-        node_selector_terms = [
-            client.V1NodeSelectorTerm(
-                match_expressions=[
-                    client.V1NodeSelectorRequirement(
-                        key='node-role.kubernetes.io/master',
-                        operator='DoesNotExist'
-                    ),
-                    client.V1NodeSelectorRequirement(
-                        key='uas',
-                        operator='NotIn',
-                        values=['False', 'false', 'FALSE']
-                    )
-                ]
-            )
-        ]
-        node_selector = client.V1NodeSelector(node_selector_terms)
-        node_affinity = client.V1NodeAffinity(
-            required_during_scheduling_ignored_during_execution=node_selector
-        )
-        # pylint: disable=unnecessary-comprehension
-        tolerations = [toleration for toleration in BASE_UAI_TOLERATIONS]
-        if uai_class.tolerations is not None:
-            toleration_list = json.loads(uai_class.tolerations)
-            for toleration in toleration_list:
-                tolerations.append(client.V1Toleration(**toleration))
         return client.V1PodTemplateSpec(
             metadata=pod_metadata,
             spec=client.V1PodSpec(
-                affinity=client.V1Affinity(node_affinity=node_affinity),
+                affinity=template.affinity,
                 containers=[container],
-                priority_class_name=(
-                    uai_class.priority_class_name or 'uai-priority'
-                ),
+                priority_class_name=template.priority_class_name,
                 restart_policy='OnFailure',
-                service_account=uai_class.service_account or 'default',
-                service_account_name=uai_class.service_account or 'default',
-                tolerations=tolerations,
-                volumes=uas_cfg.gen_volumes(volume_list)
+                service_account=template.service_account,
+                service_account_name=template.service_account,
+                tolerations=list(template.tolerations),
+                volumes=list(template.volumes)
             )
         )
 
@@ -339,28 +281,17 @@ class UAIInstance:
         Create a service object for the deployment of the UAI.
 
         """
-        # Pick the service type based on the value of 'public_ip' in
-        # the UAI Class.  This is a lot simpler than it looks if you
-        # delve into it, but I am using the code that was here to do
-        # this. That code bases the service class (SSH point of
-        # access) on two strings: "service" (which basically means an
-        # internal ClusterIP) and "ssh" (which basically means a
-        # LoadBalncer IP or a NodePort).  Instead of reworking all
-        # that logic, I am picking one or the other here based on
-        # whether 'public_ip' is true or false.
-        service_type = "ssh" if uai_class.public_ip else "service"
+        # The service type ("ssh" or "service", picked from
+        # 'public_ip') and the ports come from the compiled template
+        # for the class.
+        template = UAITemplate.get(uai_class, uas_cfg)
+        service_type = template.service_type
 
         metadata = client.V1ObjectMeta(
             name=self.get_service_name(),
             labels=self.gen_labels(uai_class),
         )
-        ports = uas_cfg.gen_port_list(
-            service_type,
-            service=True,
-            opt_ports=[
-                int(port) for port in uai_class.opt_ports
-            ] if uai_class.opt_ports is not None else None
-        )
+        ports = list(template.service_ports)
 
         # svc_type is a dict with the following fields:
         #   'svc_type': (NodePort, ClusterIP, or LoadBalancer)
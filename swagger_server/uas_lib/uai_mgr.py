@@ -224,9 +224,8 @@ class UaiManager(UasBase):
             "deleting UAIs legacy mode job_list = %s",
             job_list
         )
-        uai_list = []
         if not job_list:
-            uai_list = self.select_jobs()
+            resp_list = self.remove_uais_by_selector()
         else:
             user_uais = self.select_jobs(
                 labels=["user=%s" % self.username]
@@ -235,7 +234,7 @@ class UaiManager(UasBase):
                 uai.strip() for uai in job_list
                 if uai.strip() in user_uais
             ]
-        resp_list = self.remove_uais(uai_list)
+            resp_list = self.remove_uais(uai_list)
         logger.debug("deleted UAIs legacy mode: %s", resp_list)
         return resp_list
 
@@ -0,0 +1,174 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+""" Namespaces that still have UAI Jobs in them.
+
+When UAI Jobs, Pods and Services are listed only in the namespaces UAIs
+can be created in, UAIs left behind in a namespace that no UAI class
+uses any more (because the class was changed or removed) would not be
+found, so they could neither be listed nor deleted.  The
+ManagedNamespaces tracker remembers every namespace found to hold
+'uas=managed' Jobs, using a cheap metadata-only listing of those Jobs
+across the whole cluster every so often, and every namespace a UAI is
+created in, so that such namespaces keep being looked at for as long as
+they have UAI Jobs.  Only the first check is made while a request
+waits, later ones are made in the background.
+
+"""
+import json
+import os
+import time
+import threading
+from swagger_server.uas_lib.uas_logging import logger
+
+# Default number of seconds between checks of which namespaces have UAI
+# Jobs in them.
+MANAGED_NAMESPACE_REFRESH = 300
+
+# Number of seconds to wait before checking again after a failed check
+# (unless the refresh interval is shorter).
+NAMESPACE_RETRY_INTERVAL = 10
+
+
+def managed_namespace_refresh():
+    """Get the number of seconds between checks of which namespaces have
+    UAI Jobs in them.  UAS_K8S_NAMESPACE_REFRESH comes from config in
+    the Helm chart.
+
+    """
+    try:
+        return float(
+            os.environ.get(
+                'UAS_K8S_NAMESPACE_REFRESH',
+                MANAGED_NAMESPACE_REFRESH
+            )
+        )
+    except ValueError:
+        return float(MANAGED_NAMESPACE_REFRESH)
+
+
+class ManagedNamespaces:
+    """Process-wide record of the namespaces that have UAI Jobs in them.
+
+    """
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(self, batch_v1, accept):
+        """Constructor
+
+        """
+        self.batch_v1 = batch_v1
+        self.accept = accept
+        self.lock = threading.Lock()
+        self.created = {}
+        self.found = set()
+        self.expires = None
+        self.refreshing = False
+        self.loaded = threading.Event()
+
+    @classmethod
+    def get_instance(cls, batch_v1, accept):
+        """Get the process-wide namespace tracker, using 'batch_v1' to list
+        UAI Jobs with the 'accept' header (which asks for metadata only).
+
+        """
+        with cls.__instance_lock:
+            if cls.__instance is None:
+                cls.__instance = ManagedNamespaces(batch_v1, accept)
+            return cls.__instance
+
+    def add(self, namespace):
+        """Note that a UAI has been created in 'namespace'.
+
+        """
+        with self.lock:
+            self.created[namespace] = time.monotonic()
+
+    def get(self):
+        """Get the set of namespaces known to have UAI Jobs in them.  The
+        first call checks which namespaces those are, after that the
+        check is repeated in the background once it is due while the
+        namespaces found last time continue to be used.
+
+        """
+        with self.lock:
+            first = self.expires is None
+            if first:
+                self.refreshing = True
+                self.expires = float('inf')
+            elif time.monotonic() >= self.expires and not self.refreshing:
+                self.refreshing = True
+                threading.Thread(
+                    target=self.refresh,
+                    name="uas-namespace-refresh",
+                    daemon=True
+                ).start()
+        if first:
+            self.refresh()
+            self.loaded.set()
+        else:
+            # Only waits while the first check is in progress.
+            self.loaded.wait(timeout=NAMESPACE_RETRY_INTERVAL)
+        with self.lock:
+            return self.found | set(self.created)
+
+    def refresh(self):
+        """List the UAI Jobs across the cluster (metadata only) and
+        remember the namespaces they are in, or, if that fails, keep
+        the namespaces found before and try again soon.
+
+        """
+        started = time.monotonic()
+        refresh = managed_namespace_refresh()
+        try:
+            resp = self.batch_v1.api_client.call_api(
+                '/apis/batch/v1/jobs', 'GET',
+                {},
+                [('labelSelector', "uas=managed")],
+                {'Accept': self.accept},
+                auth_settings=['BearerToken'],
+                _return_http_data_only=True,
+                _preload_content=False
+            )
+            found = {
+                item['metadata']['namespace']
+                for item in json.loads(resp.data).get('items', None) or []
+            }
+        except Exception as err:  # pylint: disable=broad-except
+            logger.warning("unable to find namespaces of UAI Jobs: %r", err)
+            with self.lock:
+                self.refreshing = False
+                self.expires = (
+                    time.monotonic() + min(refresh, NAMESPACE_RETRY_INTERVAL)
+                )
+            return
+        with self.lock:
+            self.refreshing = False
+            self.expires = time.monotonic() + refresh
+            self.found = found
+            # Namespaces UAIs were created in before the check are
+            # covered by it from now on.
+            self.created = {
+                namespace: created
+                for namespace, created in self.created.items()
+                if created >= started
+            }
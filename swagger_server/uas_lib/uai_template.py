@@ -0,0 +1,233 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+"""Compiled Pod and Service Templates for UAI Classes
+
+Everything in the pod and service of a UAI except the name, labels,
+environment and owner comes from the UAI Class, the image, resource
+and volumes it refers to and the UAS configmap.  Working all of that
+out means several data model lookups, JSON decoding and building a
+good many Kubernetes objects, which adds up when a broker creates UAIs
+in bursts.  A UAITemplate holds the result of that work for a UAI
+Class.  Templates are cached per class and are rebuilt whenever the
+class, anything it refers to, or the configmap has changed since the
+template was made.
+
+Templates are shared between requests, so nothing in them may be
+modified by the code that uses them.
+
+"""
+import os
+import json
+import threading
+from kubernetes import client
+from swagger_server.uas_lib.uas_logging import logger
+from swagger_server.uas_data_model.uai_resource import UAIResource
+from swagger_server.uas_data_model.uai_image import UAIImage
+from swagger_server.uas_data_model.uai_volume import UAIVolume
+
+# All UAIs have the following toleration to allow them to run
+# on nodes that are tainted against non-UAI activity.  The list
+# can be extended using UAI Class toleration lists.
+BASE_UAI_TOLERATIONS = [client.V1Toleration(key="uai_only", operator="Exists")]
+
+# The most templates kept at any one time (one per UAI Class).
+MAX_TEMPLATES = 256
+
+_TEMPLATES = {}
+_TEMPLATES_LOCK = threading.Lock()
+
+
+def template_cache_enabled():
+    """Determine whether compiled UAI templates should be cached.
+    UAS_TEMPLATE_CACHE comes from config in the Helm chart.
+
+    """
+    return os.environ.get('UAS_TEMPLATE_CACHE', 'true').lower() == 'true'
+
+
+def reset_templates():
+    """Forget all cached templates.
+
+    """
+    with _TEMPLATES_LOCK:
+        _TEMPLATES.clear()
+
+
+def use_macvlan(uai_class):
+    """Determine whether UAIs of a class are set up on the macvlan
+    network.  USE_MACVLAN comes from config in the Helm chart.  Only
+    UAIs that also have the 'uai_compute_network' flag are set up that
+    way, since some UAIs aren't on that network.
+
+    """
+    return (
+        os.environ.get('USE_MACVLAN', 'true').lower() == 'true' and
+        bool(uai_class.uai_compute_network)
+    )
+
+
+class UAITemplate:
+    """The parts of the pod and service of a UAI that are the same for
+    every UAI of a given UAI Class.
+
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, uai_class, uas_cfg, cfg=None, key=None):
+        """Constructor, compiles the template for 'uai_class'.  'cfg' is
+        the configmap contents the template is compiled from and 'key'
+        identifies the contents of the class and the objects it refers
+        to, they are used to tell whether the template is still
+        current.
+
+        """
+        self.cfg = cfg
+        self.key = key
+        self.annotations = (
+            {'k8s.v1.cni.cncf.io/networks': 'macvlan-uas-nmn-conf@nmn1'}
+            if use_macvlan(uai_class) else None
+        )
+        self.resources = {}
+        if uai_class.resource_id is not None:
+            resource = UAIResource.get(uai_class.resource_id)
+            if resource.limit:
+                self.resources['limits'] = json.loads(resource.limit)
+            if resource.request:
+                self.resources['requests'] = json.loads(resource.request)
+        opt_ports = (
+            [int(port) for port in uai_class.opt_ports]
+            if uai_class.opt_ports is not None else None
+        )
+        self.container_ports = uas_cfg.gen_port_list(
+            service=False,
+            opt_ports=opt_ports
+        )
+        # Pick the service type based on the value of 'public_ip' in
+        # the UAI Class.  This is a lot simpler than it looks if you
+        # delve into it, but I am using the code that was here to do
+        # this. That code bases the service class (SSH point of
+        # access) on two strings: "service" (which basically means an
+        # internal ClusterIP) and "ssh" (which basically means a
+        # LoadBalncer IP or a NodePort).  Instead of reworking all
+        # that logic, I am picking one or the other here based on
+        # whether 'public_ip' is true or false.
+        self.service_type = "ssh" if uai_class.public_ip else "service"
+        self.service_ports = uas_cfg.gen_port_list(
+            self.service_type,
+            service=True,
+            opt_ports=opt_ports
+        )
+        img = UAIImage.get(uai_class.image_id)
+        self.imagename = img.imagename if img is not None else None
+        volume_list = uai_class.volume_list or []
+        self.volume_mounts = uas_cfg.gen_volume_mounts(volume_list)
+        self.volumes = uas_cfg.gen_volumes(volume_list)
+        self.readiness_probe = uas_cfg.create_readiness_probe()
+        self.affinity = client.V1Affinity(
+            node_affinity=client.V1NodeAffinity(
+                required_during_scheduling_ignored_during_execution=(
+                    client.V1NodeSelector(
+                        [
+                            client.V1NodeSelectorTerm(
+                                match_expressions=[
+                                    client.V1NodeSelectorRequirement(
+                                        key='node-role.kubernetes.io/master',
+                                        operator='DoesNotExist'
+                                    ),
+                                    client.V1NodeSelectorRequirement(
+                                        key='uas',
+                                        operator='NotIn',
+                                        values=['False', 'false', 'FALSE']
+                                    )
+                                ]
+                            )
+                        ]
+                    )
+                )
+            )
+        )
+        self.tolerations = list(BASE_UAI_TOLERATIONS)
+        if uai_class.tolerations is not None:
+            self.tolerations += [
+                client.V1Toleration(**toleration)
+                for toleration in json.loads(uai_class.tolerations)
+            ]
+        self.priority_class_name = (
+            uai_class.priority_class_name or 'uai-priority'
+        )
+        self.service_account = uai_class.service_account or 'default'
+
+    @staticmethod
+    def template_key(uai_class):
+        """Compute a key that identifies the contents of 'uai_class' and of
+        the image, resource and volumes it refers to, so a template can
+        be reused exactly as long as none of them has changed.
+
+        """
+        # pylint: disable=no-member
+        img = UAIImage.get(uai_class.image_id)
+        resource = (
+            UAIResource.get(uai_class.resource_id)
+            if uai_class.resource_id is not None else None
+        )
+        vols = UAIVolume.get_many(uai_class.volume_list or [])
+        return json.dumps(
+            {
+                'class': uai_class.expand(),
+                'image': img.expand() if img is not None else None,
+                'resource': (
+                    resource.expand() if resource is not None else None
+                ),
+                'volumes': {
+                    volume_id: vol.expand() for volume_id, vol in vols.items()
+                },
+                'macvlan': use_macvlan(uai_class),
+            },
+            sort_keys=True,
+            default=str
+        )
+
+    @staticmethod
+    def get(uai_class, uas_cfg):
+        """Get the template for 'uai_class', compiling it if there is no
+        current one.
+
+        """
+        if not template_cache_enabled():
+            return UAITemplate(uai_class, uas_cfg)
+        cfg = uas_cfg.get_config()
+        key = UAITemplate.template_key(uai_class)
+        with _TEMPLATES_LOCK:
+            template = _TEMPLATES.get(uai_class.class_id)
+        if (
+                template is not None and
+                template.cfg is cfg and
+                template.key == key
+        ):
+            return template
+        logger.debug("compiling UAI template for class %s", uai_class.class_id)
+        template = UAITemplate(uai_class, uas_cfg, cfg=cfg, key=key)
+        with _TEMPLATES_LOCK:
+            _TEMPLATES.pop(uai_class.class_id, None)
+            while len(_TEMPLATES) >= MAX_TEMPLATES:
+                del _TEMPLATES[next(iter(_TEMPLATES))]
+            _TEMPLATES[uai_class.class_id] = template
+        return template
@@ -0,0 +1,257 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+""" Watch a newly created UAI while waiting for it to come up.
+
+A UaiWaiter watches the pod, SSH service and Job events of a single UAI
+in parallel and hands every change to the waiting request thread
+through a queue, so the request can react as soon as the UAI gets an IP
+or as soon as it is clear that the UAI will never come up.
+
+"""
+import os
+import math
+import queue
+import threading
+import time
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+from swagger_server.uas_lib.uas_logging import logger
+
+# Container waiting reasons meaning that the UAI image or container
+# configuration is bad, so the UAI is not going to start without
+# someone fixing the UAI class or image.
+DOOMED_WAITING_REASONS = [
+    "ErrImagePull",
+    "ImagePullBackOff",
+    "InvalidImageName",
+    "CreateContainerConfigError",
+    "CreateContainerError",
+]
+
+# Job event reasons meaning that the Job cannot create its pod (most
+# often because the namespace resource quota is exhausted).
+DOOMED_JOB_EVENT_REASONS = [
+    "FailedCreate",
+]
+
+
+def doomed_uai_cleanup():
+    """Determine whether a UAI that is found to be doomed while it is
+    being created should be removed.  UAS_DOOMED_UAI_CLEANUP comes from
+    config in the Helm chart.
+
+    """
+    return os.environ.get('UAS_DOOMED_UAI_CLEANUP', 'true').lower() == 'true'
+
+
+def pod_doomed(pod, uai_name):
+    """Check a UAI pod for signs that the UAI is never going to start.
+    Return a tuple of an HTTP status and an explanation if it is, or
+    None if it is not (yet).
+
+    """
+    status = pod.status
+    if status is None:
+        return None
+    for ctr_status in status.container_statuses or []:
+        if ctr_status.name != uai_name:
+            continue
+        waiting = ctr_status.state.waiting if ctr_status.state else None
+        if waiting is not None and waiting.reason in DOOMED_WAITING_REASONS:
+            return (
+                400,
+                "UAI container cannot start: %s: %s" % (
+                    waiting.reason,
+                    waiting.message
+                )
+            )
+    for cond in status.conditions or []:
+        if (
+                cond.type == 'PodScheduled' and
+                cond.status == 'False' and
+                cond.reason == 'Unschedulable'
+        ):
+            return (
+                503,
+                "UAI cannot be scheduled: %s" % cond.message
+            )
+    return None
+
+
+def job_event_doomed(event):
+    """Check an event about a UAI Job for signs that the UAI is never
+    going to start.  Return a tuple of an HTTP status and an
+    explanation if it is, or None if it is not.
+
+    """
+    if event.type == 'Warning' and event.reason in DOOMED_JOB_EVENT_REASONS:
+        return (
+            503,
+            "UAI cannot be created: %s: %s" % (event.reason, event.message)
+        )
+    return None
+
+
+class UaiWaiter:
+    """Watch the pod, SSH service and Job events of a UAI until a deadline
+    and deliver each added or modified object through next_update().
+
+    """
+    POD = "pod"
+    SERVICE = "service"
+    EVENT = "event"
+    ERROR = "error"
+
+    def __init__(self, core_v1, job_name, service_name, namespace, deadline):
+        """Constructor
+
+        """
+        self.deadline = deadline
+        self.updates = queue.Queue()
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.watchers = []
+        self.responses = []
+        self.sources = [
+            (
+                self.POD,
+                core_v1.list_namespaced_pod,
+                {'label_selector': "app=%s" % job_name}
+            ),
+            (
+                self.SERVICE,
+                core_v1.list_namespaced_service,
+                {'field_selector': "metadata.name=%s" % service_name}
+            ),
+            (
+                self.EVENT,
+                core_v1.list_namespaced_event,
+                {
+                    'field_selector': (
+                        "involvedObject.kind=Job,"
+                        "involvedObject.name=%s" % job_name
+                    )
+                }
+            ),
+        ]
+        self.namespace = namespace
+
+    def remaining(self):
+        """Return the number of seconds left until the deadline.
+
+        """
+        return self.deadline - time.monotonic()
+
+    def start(self):
+        """Start watching.
+
+        """
+        for kind, list_func, selectors in self.sources:
+            watcher = watch.Watch()
+            self.watchers.append(watcher)
+            threading.Thread(
+                target=self.__watch,
+                args=(watcher, kind, self.__tracked(list_func), selectors),
+                name="uai-wait-%s" % kind,
+                daemon=True
+            ).start()
+
+    def __tracked(self, list_func):
+        """Wrap a list function so that the streaming responses the watch
+        gets from it are kept, and can be closed by stop().
+
+        """
+        def call(*args, **kwargs):
+            resp = list_func(*args, **kwargs)
+            with self.lock:
+                self.responses.append(resp)
+            if self.stopped.is_set():
+                self.__close(resp)
+            return resp
+        # The watch finds the type of object streamed in the docstring
+        call.__doc__ = list_func.__doc__
+        return call
+
+    @staticmethod
+    def __close(resp):
+        """Close a streaming watch response and release its connection.
+
+        """
+        try:
+            resp.close()
+            resp.release_conn()
+        except Exception as err:  # pylint: disable=broad-except
+            logger.debug("closing UAI watch response failed: %r", err)
+
+    def stop(self):
+        """Stop watching.  The watch responses are closed, so the watch
+        threads finish right away instead of holding their connections
+        until the next event or the server-side timeout.
+
+        """
+        self.stopped.set()
+        for watcher in self.watchers:
+            watcher.stop()
+        with self.lock:
+            responses = self.responses
+            self.responses = []
+        for resp in responses:
+            self.__close(resp)
+
+    def __watch(self, watcher, kind, list_func, selectors):
+        """Watch thread: stream objects of one kind into the update queue.
+
+        """
+        try:
+            while not self.stopped.is_set():
+                timeout = int(math.ceil(self.remaining()))
+                if timeout <= 0:
+                    return
+                for event in watcher.stream(
+                        list_func,
+                        self.namespace,
+                        timeout_seconds=timeout,
+                        **selectors
+                ):
+                    if event['type'] in ('ADDED', 'MODIFIED'):
+                        self.updates.put((kind, event['object']))
+        except ApiException as err:
+            self.updates.put((self.ERROR, err))
+        except Exception as err:  # pylint: disable=broad-except
+            if self.stopped.is_set():
+                # Reading a response closed by stop()
+                return
+            logger.warning("UAI %s watch failed: %r", kind, err)
+            self.updates.put((self.ERROR, err))
+
+    def next_update(self):
+        """Wait for the next update and return it as a (kind, object) tuple,
+        or return None if the deadline passes first.
+
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            return None
+        try:
+            return self.updates.get(timeout=remaining)
+        except queue.Empty:
+            return None
@@ -23,12 +23,22 @@
 Authentication methods for cray-uas-mgr
 """
 
+import os
 import sys
+import base64
+import binascii
+import hashlib
 import logging
 import json
+import threading
+import time
+from collections import OrderedDict
 import requests
 
 from flask import abort
+from swagger_server.uas_lib import uas_metrics
+from swagger_server.uas_lib.uas_jwt import verify_jwt
+from swagger_server.uas_lib.uas_http import KEYCLOAK
 
 UAS_AUTH_LOGGER = logging.getLogger('uas_auth')
 UAS_AUTH_LOGGER.setLevel(logging.INFO)
@@ -43,6 +53,196 @@ handler.setFormatter(formatter)
 UAS_AUTH_LOGGER.addHandler(handler)
 
 
+# Default number of seconds user information from Keycloak is reused
+# for the same token (never longer than the token is valid).
+USERINFO_CACHE_TTL = 60
+
+# Default largest number of tokens user information is kept for.
+USERINFO_CACHE_SIZE = 1024
+
+
+def _env_int(name, default):
+    """Get a non-negative integer setting from the environment variable
+    'name', or 'default' if it is not set or not an integer.
+
+    """
+    try:
+        return max(0, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+def auth_mode():
+    """Get the way user information is found from the auth token:
+    'userinfo' to look it up in Keycloak, or 'jwt' to take it from the
+    token itself when the token can be verified locally and has it
+    all, and look it up in Keycloak otherwise.  UAS_AUTH_MODE comes
+    from config in the Helm chart.
+
+    """
+    return os.environ.get('UAS_AUTH_MODE', 'userinfo').lower()
+
+
+def userinfo_cache_ttl():
+    """Get the number of seconds user information from Keycloak is reused
+    for the same token (0 turns caching off).  UAS_USERINFO_CACHE_TTL
+    comes from config in the Helm chart.
+
+    """
+    return _env_int('UAS_USERINFO_CACHE_TTL', USERINFO_CACHE_TTL)
+
+
+def userinfo_cache_size():
+    """Get the largest number of tokens user information is kept for.
+    UAS_USERINFO_CACHE_SIZE comes from config in the Helm chart.
+
+    """
+    return _env_int('UAS_USERINFO_CACHE_SIZE', USERINFO_CACHE_SIZE)
+
+
+def token_expiry(token):
+    """Get the expiry time (seconds since the epoch) from the 'exp' claim
+    of a (possibly 'Bearer ' prefixed) JWT without verifying it, or
+    None if there is none.
+
+    """
+    try:
+        payload = token.split()[-1].split('.')[1]
+        claims = json.loads(
+            base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4))
+        )
+        return float(claims['exp'])
+    except (
+            AttributeError, IndexError, KeyError, TypeError, ValueError,
+            binascii.Error
+    ):
+        return None
+
+
+# pylint: disable=too-few-public-methods
+class _Lookup:
+    """A user information lookup in progress, which other requests for
+    the same token wait for instead of making their own.
+
+    """
+    def __init__(self):
+        """Constructor
+
+        """
+        self.done = threading.Event()
+        self.userinfo = None
+        self.error = None
+
+
+class UserinfoCache:
+    """Process-wide cache of user information from Keycloak, by a digest
+    of the token it was looked up with, so a user making several
+    requests in a row (for example polling a list of UAIs) does not
+    cause a Keycloak lookup each time.  Entries are kept for the
+    configured time, but never beyond the expiry of the token, and the
+    least recently used are dropped when the cache is full.  Failed
+    lookups are not kept.
+
+    """
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(self):
+        """Constructor
+
+        """
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.lookups = {}
+
+    @classmethod
+    def get_instance(cls):
+        """Get the process-wide user information cache.
+
+        """
+        with cls.__instance_lock:
+            if cls.__instance is None:
+                cls.__instance = UserinfoCache()
+            return cls.__instance
+
+    def reset(self):
+        """Forget all cached user information.
+
+        """
+        with self.lock:
+            self.entries.clear()
+
+    @staticmethod
+    def digest(*parts):
+        """Compute the cache key for a token (and where it is used) so
+        tokens themselves are not kept.
+
+        """
+        return hashlib.sha256(
+            "\0".join([str(part) for part in parts]).encode('utf-8')
+        ).hexdigest()
+
+    def __cached(self, key):
+        """Get unexpired cached user information for 'key' or None.  Called
+        with the lock held.
+
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires, userinfo = entry
+        if time.time() >= expires:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return userinfo
+
+    def get(self, key, token, fetch):
+        """Get user information for 'token' (cached under 'key'), calling
+        'fetch' to look it up if it is not cached.  Only one lookup is
+        made at a time for the same key, anyone else asking for it in
+        the meantime gets the result of that lookup.
+
+        """
+        ttl = userinfo_cache_ttl()
+        if not token or ttl == 0:
+            return fetch()
+        with self.lock:
+            userinfo = self.__cached(key)
+            if userinfo is not None:
+                uas_metrics.increment('userinfo_cache_hits')
+                return dict(userinfo)
+            uas_metrics.increment('userinfo_cache_misses')
+            lookup = self.lookups.get(key)
+            leader = lookup is None
+            if leader:
+                lookup = self.lookups[key] = _Lookup()
+        if not leader:
+            lookup.done.wait()
+            if lookup.error is not None:
+                raise lookup.error
+            return dict(lookup.userinfo)
+        try:
+            lookup.userinfo = fetch()
+        except Exception as err:
+            lookup.error = err
+            raise
+        finally:
+            with self.lock:
+                del self.lookups[key]
+                if lookup.error is None and lookup.userinfo is not None:
+                    expires = time.time() + ttl
+                    token_expires = token_expiry(token)
+                    if token_expires is not None:
+                        expires = min(expires, token_expires)
+                    self.entries[key] = (expires, lookup.userinfo)
+                    self.entries.move_to_end(key)
+                    while len(self.entries) > userinfo_cache_size():
+                        self.entries.popitem(last=False)
+            lookup.done.set()
+        return dict(lookup.userinfo)
+
+
 class UasAuth:
     """
     The UasAuth class makes requests to Keycloak with a user's
@@ -101,16 +301,50 @@ class UasAuth:
         """
         return list(set(self.attributes).difference(userinfo))
 
+    def token_userinfo(self, token):
+        """Get user information from the claims of the specified auth token
+        if it can be verified against the signing keys of the configured
+        realm and has all of the needed attributes, otherwise return
+        None.
+
+        """
+        claims = verify_jwt(token, self.cacert)
+        if claims is None or not self.validUserinfo(claims):
+            uas_metrics.increment('jwt_fallbacks')
+            return None
+        uas_metrics.increment('jwt_verified')
+        UAS_AUTH_LOGGER.info(
+            "UasAuth token verified for user %s", claims[self.username]
+        )
+        return claims
+
     def userinfo(self, host, token):
         """Get user information from the specified host using the specified
-        auth token.
+        auth token, reusing what was found for the same token recently.
+        In 'jwt' auth mode, the user information is taken from the
+        token if possible.
+
+        """
+        if auth_mode() == 'jwt':
+            userinfo = self.token_userinfo(token)
+            if userinfo is not None:
+                return userinfo
+        return UserinfoCache.get_instance().get(
+            UserinfoCache.digest(host, self.endpoint, token),
+            token,
+            lambda: self.fetch_userinfo(host, token)
+        )
+
+    def fetch_userinfo(self, host, token):
+        """Look up user information on the specified host using the
+        specified auth token.
 
         """
         headers = {'Authorization': token}
         url = 'https://' + host + self.endpoint
         try:
-            response = requests.post(url, verify=self.cacert,
-                                     headers=headers, timeout=10)
+            response = KEYCLOAK.post(url, verify=self.cacert,
+                                     headers=headers)
             # raise exception for 4XX and 5XX errors
             response.raise_for_status()
         except requests.exceptions.RequestException as e:
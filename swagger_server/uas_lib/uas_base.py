@@ -26,23 +26,96 @@ Base Class for User Access Service Operations
 
 Copyright 2020 Hewlett Packard Enterprise Development LP
 """
+#pylint: disable=too-many-lines
 
+import json
+import os
 import time
 import uuid
 from datetime import datetime, timezone
 from flask import abort
-from kubernetes import config, client
+from kubernetes import client
 from kubernetes.client.rest import ApiException
-from kubernetes.client import Configuration
 from kubernetes.client.api import core_v1_api
 from swagger_server.uas_lib.uas_logging import logger
 from swagger_server.models import UAI
 from swagger_server.uas_lib.uas_cfg import UasCfg
+from swagger_server.uas_lib.uai_cache import UaiCache
+from swagger_server.uas_lib.uai_namespaces import ManagedNamespaces
+from swagger_server.uas_lib.k8s_client import get_api_client
+from swagger_server.uas_lib.uas_parallel import parallel_map
+from swagger_server.uas_lib.uai_wait import (
+    UaiWaiter,
+    doomed_uai_cleanup,
+    job_event_doomed,
+    pod_doomed
+)
 
 # picking 40 seconds so that it's under the gateway timeout
 UAI_IP_TIMEOUT = 40
 
+# Ask the API server for object metadata only (a PartialObjectMetadataList)
+# when listing objects just to get their names.  The plain JSON fallback
+# keeps this working against API servers that do not support it.
+METADATA_ONLY_ACCEPT = (
+    "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1,"
+    "application/json"
+)
 
+
+def raw_decode_enabled():
+    """Determine whether UAI list calls should decode Kubernetes responses
+    directly from JSON instead of building Kubernetes client model
+    objects.  UAS_K8S_RAW_DECODE comes from config in the Helm chart.
+
+    """
+    return os.environ.get('UAS_K8S_RAW_DECODE', 'false').lower() == 'true'
+
+
+def namespaced_queries_enabled():
+    """Determine whether UAI related objects should be listed only in the
+    namespaces UAIs can be in (the default) rather than across the
+    whole cluster.  UAS_K8S_NAMESPACED_QUERIES comes from config in the
+    Helm chart.
+
+    """
+    return os.environ.get(
+        'UAS_K8S_NAMESPACED_QUERIES', 'true'
+    ).lower() == 'true'
+
+
+def object_meta(obj):
+    """Get the namespace, name and labels of a Kubernetes object that is
+    either a Kubernetes client model object or a raw (decoded JSON)
+    object.
+
+    """
+    if isinstance(obj, dict):
+        metadata = obj.get('metadata', {})
+        return (
+            metadata.get('namespace', None),
+            metadata.get('name', None),
+            metadata.get('labels', None) or {}
+        )
+    return (
+        obj.metadata.namespace,
+        obj.metadata.name,
+        obj.metadata.labels or {}
+    )
+
+
+def parse_k8s_time(timestamp):
+    """Convert an RFC3339 timestamp string as found in raw Kubernetes
+    objects (e.g. '2020-01-01T00:00:00Z') to a timezone aware datetime.
+    Returns None if there is no timestamp.
+
+    """
+    if not timestamp:
+        return None
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+
+# pylint: disable=too-many-public-methods
 class UasBase:
     """Base class used for any class implementing UAS API functionality.
     Takes care of common activities like K8s client setup, loading UAS
@@ -51,16 +124,52 @@ class UasBase:
     """
     def __init__(self):
         """ Constructor """
-        config.load_incluster_config()
-        try:
-            k8s_config = Configuration().get_default_copy()
-        except AttributeError:
-            k8s_config = Configuration()
-            k8s_config.assert_hostname = False
-        Configuration.set_default(k8s_config)
-        self.api = core_v1_api.CoreV1Api()
-        self.batch_v1 = client.BatchV1Api()
+        api_client = get_api_client()
+        self.api = core_v1_api.CoreV1Api(api_client)
+        self.batch_v1 = client.BatchV1Api(api_client)
         self.uas_cfg = UasCfg()
+        self.uai_cache = UaiCache.get_instance(self.api, self.batch_v1)
+        self.managed_namespaces = ManagedNamespaces.get_instance(
+            self.batch_v1,
+            METADATA_ONLY_ACCEPT
+        )
+
+    def fresh_cache(self):
+        """Return the UAI cache if it is enabled and in sync recently enough
+        to be used, otherwise None.
+
+        """
+        if self.uai_cache is None or not self.uai_cache.fresh():
+            return None
+        return self.uai_cache
+
+    def cache_created(self, kind, obj):
+        """Put a UAI object of 'kind' ('job' or 'service') that was just
+        created into the UAI cache (if enabled) so later lookups see it.
+
+        """
+        if self.uai_cache is not None and obj is not None:
+            self.uai_cache.reflector(kind).created(obj)
+
+    def cache_removed(self, kind, namespace, name):
+        """Take a UAI object of 'kind' ('job' or 'service') that was just
+        deleted out of the UAI cache (if enabled) so later lookups do
+        not see it.
+
+        """
+        if self.uai_cache is not None:
+            self.uai_cache.reflector(kind).removed(namespace, name)
+
+    def uai_namespaces(self):
+        """Get the sorted list of namespaces to look for UAIs in: the
+        namespaces UAIs can be created in and any other namespaces that
+        still have UAI Jobs in them (see ManagedNamespaces).
+
+        """
+        namespaces = set(self.uas_cfg.get_uai_namespaces())
+        if self.managed_namespaces is not None:
+            namespaces.update(self.managed_namespaces.get())
+        return sorted(namespaces)
 
     @staticmethod
     def get_pod_age(start_time):
@@ -100,58 +209,6 @@ class UasBase:
             retstr += "{:d}m".format(int(minutes))
         return retstr
 
-    def create_service(self, service_name, service_body, namespace):
-        """Create the service
-
-        """
-        resp = None
-        try:
-            logger.info(
-                "getting service %s in namespace %s",
-                service_name,
-                namespace
-            )
-            resp = self.api.read_namespaced_service(
-                name=service_name,
-                namespace=namespace
-            )
-        except ApiException as err:
-            if err.status != 404:
-                logger.error(
-                    "Failed to get service info while "
-                    "creating UAI: %s",
-                    err.reason
-                )
-                abort(
-                    err.status,
-                    "Failed to get service info while creating "
-                    "UAI: %s" % err.reason
-                )
-        if not resp:
-            try:
-                logger.info(
-                    "creating service %s in namespace %s",
-                    service_name,
-                    namespace
-                )
-                resp = self.api.create_namespaced_service(
-                    body=service_body,
-                    namespace=namespace
-                )
-            except ApiException as err:
-                logger.info(
-                    "Failed to create service\n %s",
-                    (str(service_body))
-                )
-
-                logger.error(
-                    "Failed to create service %s: %s",
-                    service_name,
-                    err.reason
-                )
-                resp = None
-        return resp
-
     def delete_service(self, service_name, namespace):
         """Delete the service
 
@@ -186,36 +243,8 @@ class UasBase:
                         err.reason
                     )
                 )
-        return resp
-
-    def create_job(self, job, namespace):
-        """Create a UAI job
-
-        """
-        resp = None
-        try:
-            logger.info(
-                "creating job %s in namespace %s",
-                job.metadata.name,
-                namespace
-            )
-            resp = self.batch_v1.create_namespaced_job(
-                body=job,
-                namespace=namespace
-            )
-        except ApiException as err:
-            logger.error(
-                "Failed to create job %s: %s",
-                job.metadata.name,
-                err.reason
-            )
-            logger.debug("namespace = %s, job = \n%s", namespace, job)
-            abort(
-                err.status,
-                "Failed to create job %s: %s" % (
-                    job.metadata.name, err.reason
-                )
-            )
+        # Deleted or already gone
+        self.cache_removed('service', namespace, service_name)
         return resp
 
     def delete_job(self, job_name, namespace):
@@ -253,6 +282,8 @@ class UasBase:
                 )
             # if we get 404 we don't want to abort because it's possible that
             # other parts are still laying around (services for example)
+        # Deleted or already gone
+        self.cache_removed('job', namespace, job_name)
         return resp
 
     @staticmethod
@@ -297,6 +328,7 @@ class UasBase:
             for ctr in pod.spec.containers
             if ctr.name == uai_name
         ][0]
+        uai_status = None
         if pod.status.phase == 'Pending':
             uai_status = 'Pending'
         status_list = (
@@ -341,17 +373,124 @@ class UasBase:
             uai_msg=uai_msg
         )
 
+    # pylint: disable=too-many-locals
+    def compose_uai_from_pod_dict(self, pod):
+        """Compose a UAI Model object from a pod in its raw (decoded JSON)
+        form as returned by the Kubernetes API server.  This produces the
+        same result as compose_uai_from_pod() without the cost of
+        building Kubernetes client model objects, and needs to be kept
+        consistent with it.
+
+        """
+        metadata = pod.get('metadata', {})
+        spec = pod.get('spec', {})
+        status = pod.get('status', {})
+        labels = metadata.get('labels', None) or {}
+        username = labels.get("user", None)
+        uai_name = labels.get(
+            "app",
+            "<internal error getting UAI name>"
+        )
+        opt_ports = labels.get(
+            "uas-uai-opt-ports",
+            ""
+        )
+        uai_portmap = {
+            int(port): int(port) for port in opt_ports.split('-')
+        } if opt_ports else {}
+        uai_host = spec.get('nodeName', None)
+        uai_age = self.get_pod_age(parse_k8s_time(status.get('startTime', None)))
+        uai_img = [
+            ctr.get('image', None)
+            for ctr in spec.get('containers', [])
+            if ctr.get('name', None) == uai_name
+        ][0]
+        uai_status = None
+        if status.get('phase', None) == 'Pending':
+            uai_status = 'Pending'
+        status_list = [
+            ctr_status
+            for ctr_status in status.get('containerStatuses', None) or []
+            if ctr_status.get('name', None) == uai_name
+        ]
+        uai_msg = ""
+        for ctr_status in status_list:
+            state = ctr_status.get('state', None) or {}
+            if state.get('running', None) is not None:
+                ready_list = [
+                    cond
+                    for cond in status.get('conditions', None) or []
+                    if cond.get('type', None) == 'Ready'
+                ]
+                for cond in ready_list:
+                    if metadata.get('deletionTimestamp', None):
+                        uai_status = 'Terminating'
+                    elif cond.get('status', None) == 'True':
+                        uai_status = 'Running: Ready'
+                    else:
+                        uai_status = 'Running: Not Ready'
+                        uai_msg = cond.get('message', None)
+            if state.get('terminated', None) is not None:
+                uai_status = 'Terminated'
+            if state.get('waiting', None) is not None:
+                uai_status = 'Waiting'
+                uai_msg = state['waiting'].get('reason', None)
+        return UAI(
+            username=username,
+            uai_name=uai_name,
+            uai_portmap=uai_portmap,
+            uai_host=uai_host,
+            uai_age=uai_age,
+            uai_img=uai_img,
+            uai_status=uai_status,
+            uai_msg=uai_msg
+        )
+
     def get_pod_info(self, job_name):
         """Retrieve pod information for a UAI pod from configuration.
 
         """
-        pod_resp = None
+        cache = self.fresh_cache()
+        if cache is not None:
+            pods = cache.get_uai_pods(job_name)
+        else:
+            pods = self.__list_uai_pods(job_name)
+        # Handle the case where we got no results gracefully.  It
+        # should not happen but it is better to fail cleanly.
+        if not pods:
+            return None
+        if len(pods) > 1:
+            logger.warning(
+                "Oddly found more than one pod in "
+                "job %s",
+                job_name
+            )
+        # Only take the first one (there should only ever be one)
+        pod = pods[0]
+        if cache is not None:
+            srv_resp = cache.get_service(
+                pod.metadata.namespace,
+                job_name + "-ssh"
+            )
+        else:
+            srv_resp = self.__read_uai_service(
+                job_name,
+                pod.metadata.namespace
+            )
+        return self.compose_uai(pod, srv_resp)
+
+    def __list_uai_pods(self, job_name):
+        """List the pods belonging to a UAI from Kubernetes.
+
+        """
+        pods = []
         try:
             logger.info(
                 "getting pod info %s",
                 job_name
             )
-            pod_resp = self.api.list_pod_for_all_namespaces(
+            pods = self.list_uai_objects(
+                "pod",
                 label_selector="app=%s" % job_name,
             )
         except ApiException as err:
@@ -367,30 +506,24 @@ class UasBase:
                     err.reason
                 )
             )
-        # Handle the case where we got no results gracefully.  It
-        # should not happen but it is better to fail cleanly.
-        if not pod_resp.items:
-            return None
-        if len(pod_resp.items) > 1:
-            logger.warning(
-                "Oddly found more than one pod in "
-                "job %s",
-                job_name
-            )
-        # Only take the first one (there should only ever be one)
-        pod = pod_resp.items[0]
-        uai = self.compose_uai_from_pod(pod)
+        return pods
+
+    def __read_uai_service(self, job_name, namespace):
+        """Read the SSH service of a UAI from Kubernetes.  Return None if it
+        does not exist.
+
+        """
         srv_resp = None
         try:
             logger.info(
                 "getting service info for %s-ssh in "
                 "namespace %s",
                 job_name,
-                pod.metadata.namespace
+                namespace
             )
             srv_resp = self.api.read_namespaced_service(
                 name=job_name + "-ssh",
-                namespace=pod.metadata.namespace
+                namespace=namespace
             )
         except ApiException as err:
             if err.status != 404:
@@ -407,33 +540,101 @@ class UasBase:
                         err.reason
                     )
                 )
+        return srv_resp
+
+    def compose_uai(self, pod, srv_resp, svc_type=None):
+        """Compose a UAI Model object from a UAI pod and its SSH service (if
+        any).  The SSH service type from the configuration may be passed
+        in as 'svc_type' to avoid looking it up for every UAI.
+
+        """
+        uai = self.compose_uai_from_pod(pod)
+        srv_info = None
+        if srv_resp:
+            ingress = (
+                srv_resp.status.load_balancer.ingress
+                if srv_resp.status and srv_resp.status.load_balancer
+                else None
+            )
+            srv_info = {
+                'public_ip': srv_resp.metadata.labels.get(
+                    'uas-public-ip', "True"
+                ) == "True",
+                'ingress_ip': ingress[0].ip if ingress else None,
+                'cluster_ip': srv_resp.spec.cluster_ip,
+                'ports': [
+                    srv_port.port
+                    for srv_port in srv_resp.spec.ports or []
+                ],
+            }
+        return self.__add_service_info(uai, srv_info, svc_type)
+
+    def compose_uai_dict(self, pod, srv, svc_type=None):
+        """Compose a UAI Model object from a UAI pod and its SSH service (if
+        any) in their raw (decoded JSON) form as returned by the
+        Kubernetes API server.  This is the counterpart of compose_uai()
+        for the raw decode path.
+
+        """
+        uai = self.compose_uai_from_pod_dict(pod)
+        srv_info = None
+        if srv:
+            metadata = srv.get('metadata', {})
+            spec = srv.get('spec', {})
+            ingress = (
+                srv.get('status', {})
+                .get('loadBalancer', {})
+                .get('ingress', None)
+            )
+            srv_info = {
+                'public_ip': (metadata.get('labels', None) or {}).get(
+                    'uas-public-ip', "True"
+                ) == "True",
+                'ingress_ip': ingress[0].get('ip', None) if ingress else None,
+                'cluster_ip': spec.get('clusterIP', None),
+                'ports': [
+                    srv_port.get('port', None)
+                    for srv_port in spec.get('ports', None) or []
+                ],
+            }
+        return self.__add_service_info(uai, srv_info, svc_type)
+
+    def __add_service_info(self, uai, srv_info, svc_type):
+        """Fill in the IP, port and connection string of a UAI from the
+        relevant settings of its SSH service, which have been collected
+        into 'srv_info' (None if there is no service).
+
+        """
         # Might not have gotten service information.  If we did,
         # fill out the rest of the UAI information.  If not, then
         # return back an incomplete UAI, since there is something
         # out there.
         uai.uai_port = None
-        if srv_resp:
-            ports = srv_resp.spec.ports if srv_resp.spec.ports else []
-            svc_type = self.uas_cfg.get_svc_type('ssh')
-            public_ip = srv_resp.metadata.labels.get('uas-public-ip', "True") == "True"
+        if srv_info:
+            svc_type = (
+                self.uas_cfg.get_svc_type('ssh')
+                if svc_type is None
+                else svc_type
+            )
+            public_ip = srv_info['public_ip']
             if svc_type['svc_type'] == "LoadBalancer" and public_ip:
                 # There is a race condition that can lead 'ingress' to be
                 # None at this point, in which case we crash when we try to
                 # get the UAI info.  If ingress is None or empty, skip this
                 # for now.
-                if srv_resp.status.load_balancer.ingress:
-                    uai.uai_ip = srv_resp.status.load_balancer.ingress[0].ip
+                if srv_info['ingress_ip'] is not None:
+                    uai.uai_ip = srv_info['ingress_ip']
                     uai.uai_port = 22
             elif public_ip:
                 uai.uai_ip = self.uas_cfg.get_external_ip()
             else:
                 uai.uai_ip = (
-                    srv_resp.spec.cluster_ip
-                    if srv_resp.spec.cluster_ip
+                    srv_info['cluster_ip']
+                    if srv_info['cluster_ip']
                     else None
                 )
             # Skip the loop below if we already know the UAI port
-            ports = ports if uai.uai_port is None else []
+            ports = srv_info['ports'] if uai.uai_port is None else []
             for srv_port in ports:
                 # There should be one port that is not in the
                 # optional ports, which is the port that K8s
@@ -443,8 +644,8 @@ class UasBase:
                 # That is the SSH port and should go in
                 # uai.uai_port.
                 uai.uai_port = (
-                    srv_port.port
-                    if srv_port.port not in uai.uai_portmap
+                    srv_port
+                    if srv_port not in uai.uai_portmap
                     else uai.uai_port
                 )
         uai.uai_connect_string = self.gen_connection_string(
@@ -469,64 +670,243 @@ class UasBase:
             uai_class,
             uas_cfg
         )
-        # Make sure the UAI job is created
-        job_resp = None
-        try:
-            logger.info(
-                "getting job %s in namespace %s",
-                uai_instance.job_name,
-                uai_class.namespace
-            )
-            job_resp = self.batch_v1.read_namespaced_job(
-                uai_instance.job_name,
-                uai_class.namespace
-            )
-        except ApiException as err:
-            if err.status != 404:
+        # Create the UAI job and service together
+        self.create_uai_objects(
+            job,
+            service_name,
+            uas_ssh_svc,
+            uai_class.namespace
+        )
+
+        # Wait for the UAI IP to be set
+        return self.wait_for_uai_ip(
+            job.metadata.name,
+            service_name,
+            uai_class.namespace
+        )
+
+    def create_uai_objects(self, job, service_name, service_body, namespace):
+        """Create the Job and SSH Service of a new UAI concurrently.  Either
+        object already existing (e.g. from a retried request) counts as
+        success.  If either creation fails, whichever object this call
+        did create is removed again (an object that already existed is
+        left alone) and the request is aborted with the error from
+        Kubernetes.
+
+        """
+        create_funcs = {
+            'job': self.batch_v1.create_namespaced_job,
+            'service': self.api.create_namespaced_service,
+        }
+
+        def create(item):
+            kind, name, body = item
+            try:
+                logger.info(
+                    "creating %s %s in namespace %s",
+                    kind,
+                    name,
+                    namespace
+                )
+                self.cache_created(
+                    kind,
+                    create_funcs[kind](body=body, namespace=namespace)
+                )
+            except ApiException as err:
+                if err.status == 409:
+                    # Not created here, so never rolled back here.
+                    logger.info("%s %s already exists", kind, name)
+                    return (kind, name, False, None)
                 logger.error(
-                    "Failed to read job %s: %s",
-                    uai_instance.job_name,
+                    "Failed to create %s %s: %s",
+                    kind,
+                    name,
                     err.reason
                 )
-                abort(
-                    err.status,
-                    "Failed to read job %s: %s" % (
-                        uai_instance.job_name,
+                logger.debug(
+                    "namespace = %s, %s = \n%s",
+                    namespace,
+                    kind,
+                    body
+                )
+                return (kind, name, False, err)
+            return (kind, name, True, None)
+
+        results = parallel_map(
+            create,
+            [
+                ('job', job.metadata.name, job),
+                ('service', service_name, service_body),
+            ]
+        )
+        failures = [result for result in results if result[3] is not None]
+        if not failures:
+            if self.managed_namespaces is not None:
+                self.managed_namespaces.add(namespace)
+            return
+        created = {kind: name for kind, name, made, _ in results if made}
+        self.__rollback_uai(
+            created.get('job'),
+            created.get('service'),
+            namespace
+        )
+        kind, name, _, err = failures[0]
+        abort(
+            err.status,
+            "Failed to create %s %s: %s" % (kind, name, err.reason)
+        )
+
+    def __rollback_uai(self, job_name, service_name, namespace):
+        """Remove the Job and SSH Service of a UAI whose creation failed
+        (either name may be None if that object is to be left alone).
+        Errors are logged but otherwise ignored so that the original
+        failure is what gets reported.
+
+        """
+        logger.info(
+            "rolling back creation of UAI objects %s",
+            [name for name in (job_name, service_name) if name is not None]
+        )
+        self.__delete_uai_objects(
+            job_name,
+            service_name,
+            namespace,
+            "after failed UAI creation"
+        )
+
+    def __delete_uai_objects(self, job_name, service_name, namespace, why):
+        """Remove the Job and SSH Service of a UAI directly by name in the
+        namespace it was created in, skipping either one whose name is
+        None.  Errors are logged ('why' saying what the removal was
+        for) but otherwise ignored.  Return True if the objects are
+        gone (an object that is already gone counts as removed),
+        otherwise False.
+
+        """
+        delete_options = client.V1DeleteOptions(
+            propagation_policy='Background',
+            grace_period_seconds=5
+        )
+        removed = True
+        for kind, delete_func, name in (
+                ('service', self.api.delete_namespaced_service, service_name),
+                ('job', self.batch_v1.delete_namespaced_job, job_name),
+        ):
+            if name is None:
+                continue
+            try:
+                delete_func(
+                    name=name,
+                    namespace=namespace,
+                    body=delete_options
+                )
+            except ApiException as err:
+                if err.status != 404:
+                    logger.warning(
+                        "Failed to remove %s %s %s: %s",
+                        kind,
+                        name,
+                        why,
                         err.reason
                     )
-                )
-        if not job_resp:
-            job_resp = self.create_job(job, uai_class.namespace)
+                    removed = False
+                    continue
+            self.cache_removed(kind, namespace, name)
+        return removed
+
+    def wait_for_uai_ip(self, job_name, service_name, namespace):
+        """Wait for a newly created UAI to have a pod and for its SSH service
+        to have an IP, and return the UAI.  This watches the UAI's
+        pod, service and Job events, so it returns as soon as the IP is
+        set without polling.  Aborts with 504 if that takes longer than
+        UAI_IP_TIMEOUT seconds, or early with a specific error if the
+        UAI is clearly never going to start (in which case the UAI is
+        also removed unless UAS_DOOMED_UAI_CLEANUP is turned off).
 
-        # Start the UAI services
-        logger.info("creating the UAI service %s", service_name)
-        svc_resp = self.create_service(
+        """
+        deadline = time.monotonic() + UAI_IP_TIMEOUT
+        svc_type = self.uas_cfg.get_svc_type('ssh')
+        waiter = UaiWaiter(
+            self.api,
+            job_name,
             service_name,
-            uas_ssh_svc,
-            uai_class.namespace
+            namespace,
+            deadline
         )
-        if not svc_resp:
-            # Clean up the UAI
-            logger.error(
-                "failed to create service, deleting UAI %s",
-                uai_instance.job_name
-            )
-            self.remove_uais([uai_instance.job_name])
-            abort(
-                404,
-                "Failed to create service: %s" % service_name
-            )
+        logger.info("waiting for UAI %s", job_name)
+        waiter.start()
+        pod = None
+        srv = None
+        doomed = None
+        try:
+            while True:
+                update = waiter.next_update()
+                if update is None:
+                    abort(
+                        504,
+                        "Failed to get IP for service: %s" % service_name
+                    )
+                kind, obj = update
+                if kind == UaiWaiter.ERROR:
+                    break
+                if kind == UaiWaiter.EVENT:
+                    doomed = job_event_doomed(obj)
+                elif kind == UaiWaiter.POD:
+                    pod = obj
+                    doomed = pod_doomed(pod, job_name)
+                else:
+                    srv = obj
+                if doomed is not None:
+                    self.__doomed_uai(
+                        job_name,
+                        service_name,
+                        namespace,
+                        *doomed
+                    )
+                if pod is not None and srv is not None:
+                    uai_info = self.compose_uai(pod, srv, svc_type)
+                    if uai_info.uai_ip:
+                        return uai_info
+        finally:
+            waiter.stop()
+        logger.warning(
+            "unable to watch UAI %s, polling instead: %s",
+            job_name,
+            obj
+        )
+        return self.__poll_uai_ip(job_name, service_name, deadline)
 
-        # Wait for the UAI IP to be set
+    # pylint: disable=too-many-arguments
+    def __doomed_uai(self, job_name, service_name, namespace, status, message):
+        """Handle a UAI that has been found to be unable to start while it was
+        being created.  Remove its Job and SSH Service (if configured
+        to) and fail the request.
+
+        """
+        logger.error("UAI %s will not start: %s", job_name, message)
+        if doomed_uai_cleanup():
+            logger.info("removing UAI %s", job_name)
+            if self.__delete_uai_objects(
+                    job_name,
+                    service_name,
+                    namespace,
+                    "of UAI that will not start"
+            ):
+                message += " (UAI %s removed)" % job_name
+        abort(status, message)
+
+    def __poll_uai_ip(self, job_name, service_name, deadline):
+        """Fallback for wait_for_uai_ip() that polls the UAI every half second
+        instead of watching it.
+
+        """
         total_wait = 0.0
         delay = 0.5
         while True:
-            uai_info = self.get_pod_info(
-                job_resp.metadata.name
-            )
+            uai_info = self.get_pod_info(job_name)
             if uai_info and uai_info.uai_ip:
                 break
-            if total_wait >= UAI_IP_TIMEOUT:
+            if time.monotonic() >= deadline:
                 abort(
                     504,
                     "Failed to get IP for service: %s" % service_name
@@ -590,66 +970,378 @@ class UasBase:
         # Has to be a UAI (uas=managed) at least, along with any other
         # labels specified.
         labels.append("uas=managed")
-        jobs = self.retrieve_jobs(labels=labels, fields=fields)
-        return [job.metadata.name for job in jobs]
+        cache = self.fresh_cache()
+        if cache is not None:
+            job_names = cache.select_jobs(labels=labels, fields=fields)
+            if job_names is not None:
+                return job_names
+        return self.retrieve_job_names(labels=labels, fields=fields)
+
+    def retrieve_job_names(self, labels=None, fields=None):
+        """Get the list of names of jobs that meet the criteria specified in
+        labels (if any) and fields (if any).  Only job metadata is
+        requested from the API server and the response is not
+        deserialized into Kubernetes client models, which makes this much
+        cheaper than retrieve_jobs() when only names are needed.
+
+        """
+        return [
+            metadata['name']
+            for metadata in self.retrieve_job_metadata(labels, fields)
+        ]
+
+    def retrieve_job_metadata(self, labels=None, fields=None):
+        """Get the list of metadata (as decoded JSON) of jobs that meet the
+        criteria specified in labels (if any) and fields (if any) using
+        a metadata-only listing.
+
+        """
+        field_selector = ','.join(fields or []) or None
+        label_selector = ','.join(labels or []) or None
+        query_params = []
+        if field_selector is not None:
+            query_params.append(('fieldSelector', field_selector))
+        if label_selector is not None:
+            query_params.append(('labelSelector', label_selector))
+        items = []
+        try:
+            logger.info(
+                "listing job names matching: labels %s, fields %s",
+                label_selector,
+                field_selector
+            )
+            paths = [
+                '/apis/batch/v1/namespaces/%s/jobs' % namespace
+                for namespace in self.uai_namespaces()
+            ] if namespaced_queries_enabled() else ['/apis/batch/v1/jobs']
+            for resp in parallel_map(
+                    lambda path: self.batch_v1.api_client.call_api(
+                        path, 'GET',
+                        {},
+                        query_params,
+                        {'Accept': METADATA_ONLY_ACCEPT},
+                        auth_settings=['BearerToken'],
+                        _return_http_data_only=True,
+                        _preload_content=False
+                    ),
+                    paths
+            ):
+                items += json.loads(resp.data).get('items', None) or []
+        except ApiException as err:
+            if err.status != 404:
+                logger.error(
+                    "Failed to get job list: %s",
+                    err.reason
+                )
+                abort(err.status, "Failed to get job list")
+        return [item['metadata'] for item in items]
+
+    def list_uai_objects(self, kind, raw=False, **kwargs):
+        """List UAI related objects of the specified kind ('job', 'pod' or
+        'service') with the specified selectors and return the list of
+        objects.  Unless namespaced queries are turned off, this lists
+        each of the namespaces UAIs may be in (in parallel) instead of
+        the whole cluster.  If 'raw' is True, the objects are returned
+        as decoded JSON instead of Kubernetes client model objects.
+        ApiExceptions are left to the caller.
+
+        """
+        list_funcs = {
+            'job': (
+                self.batch_v1.list_namespaced_job,
+                self.batch_v1.list_job_for_all_namespaces
+            ),
+            'pod': (
+                self.api.list_namespaced_pod,
+                self.api.list_pod_for_all_namespaces
+            ),
+            'service': (
+                self.api.list_namespaced_service,
+                self.api.list_service_for_all_namespaces
+            ),
+        }
+        namespaced_func, cluster_func = list_funcs[kind]
+        if raw:
+            kwargs['_preload_content'] = False
+
+        def items(resp):
+            if raw:
+                return json.loads(resp.data).get('items', None) or []
+            return resp.items
+
+        if not namespaced_queries_enabled():
+            return items(cluster_func(**kwargs))
+        ret = []
+        for resp in parallel_map(
+                lambda namespace: namespaced_func(namespace, **kwargs),
+                self.uai_namespaces()
+        ):
+            ret += items(resp)
+        return ret
 
     def get_uai_namespace(self, job_name):
         """Determine the namespace a named UAI is deployed in.
 
         """
-        resp = self.batch_v1.list_job_for_all_namespaces(
-            label_selector="app=%s" % job_name
-        )
-        if resp is None or not resp.items:
+        cache = self.fresh_cache()
+        if cache is not None:
+            jobs = cache.get_uai_jobs(job_name)
+        else:
+            jobs = self.list_uai_objects(
+                "job",
+                label_selector="app=%s" % job_name
+            )
+        if not jobs:
             return None
-        if len(resp.items) > 1:
+        if len(jobs) > 1:
             logger.warning(
                 "Oddly found more than one job named %s",
                 job_name
             )
-        return resp.items[0].metadata.namespace
+        return jobs[0].metadata.namespace
 
+    # pylint: disable=too-many-locals
     def get_uai_list(self, job_names):
         """Get a list of UAIs from the specified host (if any)
         that meet the criteria in the specified label (if any).
 
         """
+        if len(job_names) == 1:
+            # A single UAI is cheaper to look up directly.
+            uai = self.get_pod_info(job_names[0])
+            return [] if uai is None else [uai]
+        if not job_names:
+            return []
+        cache = self.fresh_cache()
+        raw = cache is None and raw_decode_enabled()
+        if cache is not None:
+            pods = cache.pods.list()
+            services = cache.services.list()
+        else:
+            pods = self.__list_managed("pod", raw)
+            services = self.__list_managed("service", raw)
+        compose = self.compose_uai_dict if raw else self.compose_uai
+        pods_by_app = {}
+        for pod in pods:
+            _, _, labels = object_meta(pod)
+            pods_by_app.setdefault(labels.get('app', None), []).append(pod)
+        services_by_key = {}
+        for srv in services:
+            namespace, name, _ = object_meta(srv)
+            services_by_key[(namespace, name)] = srv
+        svc_type = self.uas_cfg.get_svc_type('ssh')
         uai_list = []
         for job_name in job_names:
-            uai = self.get_pod_info(job_name)
-            if uai is not None:
-                uai_list.append(uai)
+            uai_pods = pods_by_app.get(job_name, [])
+            if not uai_pods:
+                continue
+            if len(uai_pods) > 1:
+                logger.warning(
+                    "Oddly found more than one pod in "
+                    "job %s",
+                    job_name
+                )
+            pod = uai_pods[0]
+            namespace, _, _ = object_meta(pod)
+            srv_resp = services_by_key.get(
+                (namespace, job_name + "-ssh"),
+                None
+            )
+            uai_list.append(compose(pod, srv_resp, svc_type))
         return uai_list
 
+    def __list_managed(self, kind, raw=False):
+        """List all UAS managed ('uas=managed') pods or services (depending
+        on 'kind').  If 'raw' is True, the objects are returned as
+        decoded JSON (dictionaries) instead of Kubernetes client model
+        objects.
+
+        """
+        items = []
+        try:
+            logger.info("listing all UAI %ss", kind)
+            items = self.list_uai_objects(
+                kind,
+                raw=raw,
+                label_selector="uas=managed"
+            )
+        except ApiException as err:
+            logger.error(
+                "Failed to list UAI %ss: %s",
+                kind,
+                err.reason
+            )
+            abort(
+                err.status,
+                "Failed to list UAI %ss: %s" % (kind, err.reason)
+            )
+        return items
+
     def remove_uais(self, job_names):
         """Remove a list of UAIs by their names from the specified
+        namespace.  The UAIs are removed concurrently.
+
+        """
+        namespaces = self.__uai_namespaces(job_names)
+        resp_list = parallel_map(
+            lambda job_name: self.__remove_uai(
+                job_name,
+                namespaces.get(job_name, None)
+            ),
+            job_names
+        )
+        # UAIs that don't exist or don't have a namespace (I dont think
+        # the latter is possible) are skipped.
+        return [message for message in resp_list if message is not None]
+
+    def __uai_namespaces(self, job_names):
+        """Find the namespaces of a list of UAIs by name, returning a map of
+        UAI names to namespaces.  UAIs that are not found are left out.
+
+        """
+        if len(job_names) <= 1 or self.fresh_cache() is not None:
+            namespaces = {
+                job_name: self.get_uai_namespace(job_name)
+                for job_name in job_names
+            }
+        else:
+            # One listing is cheaper than a listing per UAI.
+            namespaces = {
+                metadata['name']: metadata.get('namespace', None)
+                for metadata in self.retrieve_job_metadata(
+                    labels=["uas=managed"]
+                )
+            }
+        return {
+            job_name: namespace
+            for job_name, namespace in namespaces.items()
+            if namespace is not None
+        }
+
+    def __remove_uai(self, job_name, namespace):
+        """Remove a single UAI by name from its namespace and return a
+        message describing the result, or None if there is no
         namespace.
 
         """
-        resp_list = []
-        for job_name in job_names:
-            namespace = self.get_uai_namespace(job_name)
-            if namespace is None:
-                # This job doesn't exist or doesn't have a namespace
-                # (I dont think the latter is possible).  Skip it.
-                continue
+        if namespace is None:
+            return None
+        # Do services first so that we don't orphan one if they abort
+        service_resp = self.delete_service(
+            job_name + "-ssh",
+            namespace
+        )
+        job_resp = self.delete_job(
+            job_name,
+            namespace
+        )
+        if job_resp is None and service_resp is None:
+            return "Failed to delete %s - Not found" % job_name
+        return "Successfully deleted %s" % job_name
 
-            # Do services first so that we don't orphan one if they abort
-            service_resp = self.delete_service(
-                job_name + "-ssh",
-                namespace
-            )
-            job_resp = self.delete_job(
-                job_name,
-                namespace
-            )
-            if job_resp is None and service_resp is None:
-                message = "Failed to delete %s - Not found" % job_name
+    def remove_uais_by_selector(self, labels=None, fields=None):
+        """Remove all of the UAIs selected by a list of label selectors (if
+        any) and field selectors (if any).  If 'fields' is None only
+        running UAIs (as with select_jobs()) are removed.  Jobs are
+        deleted using one collection delete per namespace instead of one
+        delete per UAI.  Returns the same per-UAI messages as
+        remove_uais().
+
+        """
+        fields = ["status.successful=0"] if fields is None else fields
+        labels = list(labels or []) + ["uas=managed"]
+        uais = [
+            (metadata['name'], metadata['namespace'])
+            for metadata in self.retrieve_job_metadata(labels, fields)
+        ]
+        if not uais:
+            return []
+        # Do services first so that we don't orphan one if job
+        # deletion aborts.
+        services = parallel_map(
+            lambda uai: self.delete_service(uai[0] + "-ssh", uai[1]),
+            uais
+        )
+        namespaces = sorted({namespace for _, namespace in uais})
+        deleted = parallel_map(
+            lambda namespace: self.__delete_job_collection(
+                namespace,
+                labels,
+                fields
+            ),
+            namespaces
+        )
+        deleted_jobs = {}
+        for namespace, job_names in zip(namespaces, deleted):
+            if job_names is None:
+                # No list of deleted jobs, assume the ones we saw went.
+                job_names = [name for name, ns in uais if ns == namespace]
+            for job_name in job_names:
+                deleted_jobs[job_name] = namespace
+                self.cache_removed('job', namespace, job_name)
+        # Jobs that matched the selectors by the time they were deleted
+        # but were not in our list need their services removed too.
+        listed = {name for name, _ in uais}
+        parallel_map(
+            lambda uai: self.delete_service(uai[0] + "-ssh", uai[1]),
+            [
+                (job_name, namespace)
+                for job_name, namespace in deleted_jobs.items()
+                if job_name not in listed
+            ]
+        )
+        resp_list = []
+        for (job_name, _), service_resp in zip(uais, services):
+            if job_name not in deleted_jobs and service_resp is None:
+                resp_list.append("Failed to delete %s - Not found" % job_name)
             else:
-                message = "Successfully deleted %s" % job_name
-            resp_list.append(message)
+                resp_list.append("Successfully deleted %s" % job_name)
         return resp_list
 
+    def __delete_job_collection(self, namespace, labels, fields):
+        """Delete all of the jobs in a namespace matching the label and field
+        selectors.  Return the list of names of the deleted jobs, or None
+        if the API server did not say which jobs it deleted.
+
+        """
+        label_selector = ','.join(labels) or None
+        field_selector = ','.join(fields) or None
+        try:
+            logger.info(
+                "deleting jobs in namespace %s matching: labels %s, "
+                "fields %s",
+                namespace,
+                label_selector,
+                field_selector
+            )
+            resp = self.batch_v1.delete_collection_namespaced_job(
+                namespace,
+                label_selector=label_selector,
+                field_selector=field_selector,
+                propagation_policy='Background',
+                grace_period_seconds=5,
+                _preload_content=False
+            )
+        except ApiException as err:
+            logger.error(
+                "Failed to delete jobs in namespace %s: %s",
+                namespace,
+                err.reason
+            )
+            abort(
+                err.status,
+                "Failed to delete jobs in namespace %s: %s" % (
+                    namespace,
+                    err.reason
+                )
+            )
+        try:
+            items = json.loads(resp.data).get('items', None)
+        except (ValueError, AttributeError):
+            items = None
+        if items is None:
+            return None
+        return [item['metadata']['name'] for item in items]
 
     @staticmethod
     def strip_job(job):
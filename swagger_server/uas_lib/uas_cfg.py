@@ -24,19 +24,129 @@
 """
 
 import os
-import json
+import threading
 import yaml
 from flask import abort
 from kubernetes import client
-import requests
 from swagger_server.uas_lib.uas_logging import logger
+from swagger_server.uas_lib.sls_networks import SlsNetworks
 from swagger_server.uas_data_model.uai_volume import UAIVolume
 from swagger_server.uas_data_model.uai_image import UAIImage
+from swagger_server.uas_data_model.uai_class import UAIClass
+from swagger_server.uas_data_model.populated_config import PopulatedConfig
+from swagger_server.uas_data_model.config_snapshot import ConfigSnapshot
 
 
 UAS_CFG_DEFAULT_PORT = 30123
 UAS_CFG_OPTIONAL_PORTS = [80, 443, 8888]
 UAS_CFG_DEFAULT_UAI_NAMESPACE = "default"
+UAS_CFG_DEFAULT_BROKER_NAMESPACE = "uas"
+
+# Parsed configmap contents by configmap path, each stored as a tuple of
+# the stamp of the file it was parsed from and its frozen contents.
+_CONFIG_CACHE = {}
+_CONFIG_CACHE_LOCK = threading.Lock()
+
+# Serializes seeding the ETCD configuration tables within this process.
+_BOOTSTRAP_LOCK = threading.Lock()
+
+
+class FrozenDict(dict):
+    """A dictionary that cannot be modified, used for configmap contents
+    shared between all callers of UasCfg.get_config().  It is still a
+    dict, so it can be passed to anything expecting one (json.dumps(),
+    for example) as long as that does not try to modify it.
+
+    """
+    def __readonly(self, *args, **kwargs):
+        """Refuse to modify the dictionary.
+
+        """
+        raise TypeError("configmap contents cannot be modified")
+
+    __setitem__ = __readonly
+    __delitem__ = __readonly
+    __ior__ = __readonly
+    clear = __readonly
+    pop = __readonly
+    popitem = __readonly
+    setdefault = __readonly
+    update = __readonly
+
+    def __copy__(self):
+        """Copies are ordinary (modifiable) dictionaries.
+
+        """
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        """Deep copies are ordinary (modifiable) dictionaries and lists.
+
+        """
+        return thaw(self)
+
+
+def freeze(value):
+    """Return an immutable copy of a parsed YAML value: dictionaries
+    become FrozenDicts and lists become tuples.
+
+    """
+    if isinstance(value, dict):
+        return FrozenDict(
+            (key, freeze(item)) for key, item in value.items()
+        )
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value):
+    """Return a modifiable copy of a value returned by freeze().
+
+    """
+    if isinstance(value, dict):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(item) for item in value]
+    return value
+
+
+def tables_registered():
+    """Determine whether the ETCD configuration tables seeded by
+    UasCfg.get_config() are all registered.
+
+    """
+    return all(
+        PopulatedConfig.is_populated(model.__name__)
+        for model in (UAIImage, UAIVolume)
+    )
+
+
+def load_configmap(path):
+    """Load and parse the configmap file at 'path' unless it is unchanged
+    since it was last loaded, and return its frozen contents.  The
+    configmap is mounted from a Kubernetes ConfigMap volume, which is
+    updated by swapping a symbolic link ('..data') to a new directory,
+    so any change to the file shows up as a new inode (or at least a
+    new modification time or size) behind 'path'.  Raises IOError if
+    the file cannot be read.
+
+    """
+    stat = os.stat(path)
+    stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _CONFIG_CACHE_LOCK:
+        cached = _CONFIG_CACHE.get(path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        if cached is not None:
+            logger.info("configmap %s changed, reloading", path)
+        with open(path, encoding='utf-8') as uascfg:
+            # pylint: disable=no-member
+            cfg = yaml.load(uascfg, Loader=yaml.FullLoader)
+        # The empty case can be parsed as None, fix that...
+        cfg = freeze(cfg if cfg is not None else {})
+        _CONFIG_CACHE[path] = (stamp, cfg)
+        return cfg
 
 
 class UasCfg:
@@ -59,35 +169,62 @@ class UasCfg:
         UAS Manager runs on a new system to load the initial settings
         into ETCD and then ignored from then on.  For items that are
         only configured in the configmap, updates to the configmap
-        will be read in each time this is called.
+        are picked up the next time this is called after they appear.
+
+        The configmap is only parsed again when it changes, and the
+        contents returned are shared, so they are immutable (a
+        FrozenDict with tuples in place of lists).  Use thaw() to get a
+        copy that can be modified.  Within a request that has a
+        ConfigSnapshot, every call returns the same contents.
 
         """
-        cfg = {}
-        try:
-            with open(self.uas_cfg, encoding='utf-8') as uascfg:
-                # pylint: disable=no-member
-                cfg = yaml.load(uascfg, Loader=yaml.FullLoader)
-        except (TypeError, IOError):
-            abort(404, "configmap %s not found" % self.uas_cfg)
-        # The empty case can be parsed as None, fix that...
+        snapshot = ConfigSnapshot.current()
+        cfg = (
+            snapshot.get_configmap(self.uas_cfg) if snapshot is not None
+            else None
+        )
         if cfg is None:
-            cfg = {}
+            try:
+                cfg = load_configmap(self.uas_cfg)
+            except (TypeError, IOError):
+                abort(404, "configmap %s not found" % self.uas_cfg)
+            if snapshot is not None:
+                # The rest of the request sees this same configmap
+                # even if it changes in the meantime.
+                snapshot.set_configmap(self.uas_cfg, cfg)
 
         # We have the configmap contents, now, populate any ETCD
         # tables that need populating...
-        if UAIImage.get_all() is None:
-            # There are no UAI Image objects in ETCD.  Just register
-            # the empty table.  We no longer populate UAI images from
-            # a chart supplied configuration.
-            UAIImage.register()
-        if UAIVolume.get_all() is None:
-            # There are no UAI Volume objects in ETCD, populate that
-            # table now.
-            UAIVolume.register()
-            for vol in cfg.get('volume_mounts', []):
-                UAIVolume.add_etcd_volume(vol)
+        self.__bootstrap(cfg)
         return cfg
 
+    @staticmethod
+    def __bootstrap(cfg):
+        """Register (and seed from the configmap contents in 'cfg') any
+        ETCD configuration tables that do not exist yet.  Whether they
+        exist is answered from the table registrations in the request's
+        configuration snapshot or the in-process replica, so this
+        normally does not go to ETCD, and it notices tables removed by
+        a factory reset in any UAS Manager replica.
+
+        """
+        if tables_registered():
+            return
+        with _BOOTSTRAP_LOCK:
+            if tables_registered():
+                return
+            if UAIImage.get_all() is None:
+                # There are no UAI Image objects in ETCD.  Just register
+                # the empty table.  We no longer populate UAI images from
+                # a chart supplied configuration.
+                UAIImage.register()
+            if UAIVolume.get_all() is None:
+                # There are no UAI Volume objects in ETCD, populate that
+                # table now.
+                UAIVolume.register()
+                for vol in cfg.get('volume_mounts', []):
+                    UAIVolume.add_etcd_volume(thaw(vol))
+
     def get_images(self):
         """ Retrieve a list of image names.
         """
@@ -102,25 +239,15 @@ class UasCfg:
 
         """
         _ = self.get_config()
-        imgs = UAIImage.get_all()
-        imgs = [] if imgs is None else imgs
-        for img in imgs:
-            if img.default:  # pylint: disable=no-member
-                return img.imagename  # pylint: disable=no-member
-        return None
+        img = UAIImage.get_default()
+        return img.imagename if img is not None else None
 
     def validate_image(self, imagename):
         """Determine whether the specified imagename is a known image name.
 
         """
         _ = self.get_config()
-        imgs = UAIImage.get_all()
-        imgs = [] if imgs is None else imgs
-        # pylint: disable=no-member
-        for img in imgs:
-            if imagename == img.imagename:
-                return True
-        return False
+        return UAIImage.get_by_name(imagename) is not None
 
     def get_external_ip(self):
         """
@@ -237,7 +364,7 @@ class UasCfg:
         if not cfg:
             return port_list
         default_port = self.get_default_port()
-        cfg_ports = cfg.get('uas_ports', [])
+        cfg_ports = list(cfg.get('uas_ports', []))
         cfg_ports += [
             port
             for port in opt_ports
@@ -257,33 +384,11 @@ class UasCfg:
 
     @staticmethod
     def __get_sls_networks():
-        """Call into the SLS to get the list of configured networks
+        """Get the list of configured networks from SLS (cached and
+        refreshed in the background by SlsNetworks).
 
         """
-        logger.debug("retrieving SLS network data")
-        try:
-            response = requests.get("http://cray-sls/v1/networks", timeout=10)
-            # raise exception for 4XX and 5XX errors
-            response.raise_for_status()
-        except requests.exceptions.RequestException as err:
-            logger.warning(
-                "retrieving BICAN information %r %r", type(err), err
-            )
-            return []
-        except Exception as err:  # pylint: disable=broad-except
-            logger.warning(
-                "retrieving BICAN information %r %r", type(err), err
-            )
-            return []
-        try:
-            ret = response.json() or []
-        except json.decoder.JSONDecodeError as err:
-            logger.warning(
-                "decoding BICAN information %r %r", type(err), err
-            )
-            return []
-        logger.debug("retrieved SLS network data: %s", ret)
-        return ret
+        return SlsNetworks.get_instance().get()
 
     @classmethod
     def __get_bican_pool(cls):
@@ -446,3 +551,34 @@ class UasCfg:
                 UAS_CFG_DEFAULT_UAI_NAMESPACE
             )
             return UAS_CFG_DEFAULT_UAI_NAMESPACE
+
+    def get_broker_namespace(self):
+        """
+        Gets the namespace in which Broker UAIs are normally created.
+        Defaults to UAS_CFG_DEFAULT_BROKER_NAMESPACE if unset.
+        :return: k8s namespace
+        :rtype string
+        """
+        cfg = self.get_config()
+        if not cfg:
+            return UAS_CFG_DEFAULT_BROKER_NAMESPACE
+        return cfg.get('broker_namespace', UAS_CFG_DEFAULT_BROKER_NAMESPACE)
+
+    def get_uai_namespaces(self):
+        """
+        Gets the list of namespaces UAIs can be found in: the UAI
+        namespace, the broker namespace and the namespaces of all UAI
+        classes.
+        :return: sorted list of k8s namespaces
+        :rtype list
+        """
+        namespaces = {
+            self.get_uai_namespace() or UAS_CFG_DEFAULT_UAI_NAMESPACE,
+            self.get_broker_namespace(),
+        }
+        namespaces.update(
+            uai_class.namespace
+            for uai_class in UAIClass.get_all() or []
+            if uai_class.namespace
+        )
+        return sorted(namespaces)
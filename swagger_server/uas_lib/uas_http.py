@@ -0,0 +1,167 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+""" Pooled HTTP sessions for the services UAS Manager talks to.
+
+UAS Manager talks to Keycloak (user information and signing keys),
+SLS (network configuration) and Vault (Broker UAI secrets).  Each of
+these upstreams gets its own requests Session, shared by all threads,
+so connections (and, for Keycloak, TLS sessions) are kept alive and
+reused instead of being set up for every request.  Each upstream has
+its own connection pool size and connect and read timeouts, and the
+time taken by requests to each upstream is recorded in the UAS Manager
+metrics as '<upstream>_request' timings.
+
+"""
+import os
+import time
+import threading
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from swagger_server.uas_lib.uas_logging import logger
+from swagger_server.uas_lib import uas_metrics
+
+# Default (connect, read) timeouts in seconds for requests to an
+# upstream.
+HTTP_TIMEOUTS = (5.0, 10.0)
+
+# Default number of connections kept alive to each upstream host.
+HTTP_POOL_SIZE = 10
+
+
+def http_pool_size():
+    """Get the number of connections kept alive to each upstream host.
+    UAS_HTTP_POOL_SIZE comes from config in the Helm chart.
+
+    """
+    try:
+        return max(1, int(os.environ.get('UAS_HTTP_POOL_SIZE', HTTP_POOL_SIZE)))
+    except ValueError:
+        return HTTP_POOL_SIZE
+
+
+def http_timeouts(upstream):
+    """Get the (connect, read) timeouts for requests to 'upstream'.
+    UAS_HTTP_TIMEOUTS comes from config in the Helm chart and is a
+    comma separated list of '<upstream>=<connect>:<read>' settings.
+
+    """
+    for setting in os.environ.get('UAS_HTTP_TIMEOUTS', "").split(','):
+        name, _, timeouts = setting.strip().partition('=')
+        if name != upstream:
+            continue
+        try:
+            connect, read = timeouts.split(':')
+            return (float(connect), float(read))
+        except ValueError:
+            logger.warning(
+                "ignoring invalid HTTP timeouts setting '%s'", setting
+            )
+    return HTTP_TIMEOUTS
+
+
+class HttpUpstream:
+    """A service UAS Manager makes HTTP requests to, with its own pool of
+    kept alive connections.
+
+    """
+    def __init__(self, name):
+        """Constructor
+
+        """
+        self.name = name
+        self.lock = threading.Lock()
+        self.session = None
+
+    def get_session(self):
+        """Get the session for requests to this upstream, setting it up the
+        first time.
+
+        """
+        with self.lock:
+            if self.session is None:
+                session = requests.Session()
+                pool_size = http_pool_size()
+                adapter = HTTPAdapter(
+                    pool_connections=pool_size,
+                    pool_maxsize=pool_size
+                )
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                # The session is shared by requests made for different
+                # users, so nothing may be carried from one to the
+                # next.
+                session.cookies.set_policy(
+                    DefaultCookiePolicy(allowed_domains=[])
+                )
+                self.session = session
+            return self.session
+
+    def reset(self):
+        """Close all kept alive connections to this upstream.
+
+        """
+        with self.lock:
+            session, self.session = self.session, None
+        if session is not None:
+            session.close()
+
+    def request(self, method, url, **kwargs):
+        """Make a request to this upstream with the configured timeouts
+        (unless 'timeout' is given) and record how long it took.
+        Takes the same arguments as requests.request().
+
+        """
+        kwargs.setdefault('timeout', http_timeouts(self.name))
+        start = time.monotonic()
+        try:
+            return self.get_session().request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            uas_metrics.increment('%s_request_errors' % self.name)
+            raise
+        finally:
+            uas_metrics.observe(
+                '%s_request' % self.name, time.monotonic() - start
+            )
+
+    def get(self, url, **kwargs):
+        """Make a GET request to this upstream.
+
+        """
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Make a POST request to this upstream.
+
+        """
+        return self.request('POST', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        """Make a DELETE request to this upstream.
+
+        """
+        return self.request('DELETE', url, **kwargs)
+
+
+KEYCLOAK = HttpUpstream('keycloak')
+SLS = HttpUpstream('sls')
+VAULT = HttpUpstream('vault')
@@ -0,0 +1,303 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+""" Local verification of Keycloak issued JWTs.
+
+Looking up user information in Keycloak costs a round trip to Keycloak
+for every new token.  The access tokens Keycloak issues are signed
+JWTs, which can instead be verified locally against the signing keys
+of the realm (its JWKS).  The JWKS is retrieved once and retrieved
+again only when a token signed with a key that is not in it shows up
+(Keycloak has rotated its keys).
+
+The issuer (realm URL) tokens must come from, the JWKS URL and the
+clients tokens must be issued to are taken from config, never from
+the request, so callers cannot choose the keys their own tokens are
+checked against.  Only access tokens ('typ' of 'Bearer') from that
+issuer, issued to (or for) one of those clients, are accepted.
+
+Verification needs the 'cryptography' package.  Without it, without a
+configured issuer, or if a token cannot be verified for any reason,
+None is returned and the caller falls back to asking Keycloak.
+
+"""
+import base64
+import binascii
+import json
+import os
+import threading
+import time
+import requests
+from swagger_server.uas_lib.uas_logging import logger
+from swagger_server.uas_lib import uas_metrics
+from swagger_server.uas_lib.uas_http import KEYCLOAK
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding, rsa
+except ImportError:  # pragma: no cover
+    # pylint: disable=invalid-name
+    InvalidSignature = hashes = padding = rsa = None
+
+# Supported signing algorithms and the hashes they use.
+JWT_ALGORITHMS = {
+    'RS256': 'SHA256',
+    'RS384': 'SHA384',
+    'RS512': 'SHA512',
+}
+
+# Seconds of clock skew allowed when checking token validity times.
+JWT_LEEWAY = 30
+
+# Least number of seconds between retrievals of the JWKS when tokens
+# signed with unknown keys show up, so bad tokens cannot make us hammer
+# Keycloak.
+JWKS_MIN_REFRESH_INTERVAL = 10
+
+# Default clients access tokens must be issued to (or for).
+JWT_AUDIENCE = "shasta"
+
+
+def jwt_issuer():
+    """Get the issuer (Keycloak realm URL) tokens must come from, or None
+    if none is configured, in which case tokens are not verified
+    locally.  UAS_JWT_ISSUER comes from config in the Helm chart.
+
+    """
+    return os.environ.get('UAS_JWT_ISSUER', "").strip().rstrip('/') or None
+
+
+def jwks_url(issuer):
+    """Get the URL of the JWKS of the realm of 'issuer'.  UAS_JWKS_URL
+    comes from config in the Helm chart and defaults to the standard
+    location under the issuer.
+
+    """
+    return (
+        os.environ.get('UAS_JWKS_URL', "").strip() or
+        issuer + "/protocol/openid-connect/certs"
+    )
+
+
+def jwt_audiences():
+    """Get the list of clients access tokens must be issued to ('azp') or
+    for ('aud').  UAS_JWT_AUDIENCE comes from config in the Helm chart
+    and is a comma separated list.
+
+    """
+    audiences = [
+        audience.strip()
+        for audience in os.environ.get(
+            'UAS_JWT_AUDIENCE', JWT_AUDIENCE
+        ).split(',')
+    ]
+    return [audience for audience in audiences if audience]
+
+
+def b64decode(data):
+    """Decode unpadded base64url encoded 'data' (str) to bytes.
+
+    """
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def jwk_public_key(jwk):
+    """Make a public key from an RSA JSON Web Key, or return None if it
+    is not an RSA signing key.
+
+    """
+    if jwk.get('kty') != "RSA" or jwk.get('use', "sig") != "sig":
+        return None
+    return rsa.RSAPublicNumbers(
+        int.from_bytes(b64decode(jwk['e']), 'big'),
+        int.from_bytes(b64decode(jwk['n']), 'big')
+    ).public_key()
+
+
+class JwksCache:
+    """Process-wide cache of the signing keys (JWKS) of the configured
+    Keycloak realm.
+
+    """
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(self):
+        """Constructor
+
+        """
+        self.lock = threading.Lock()
+        self.url = None
+        self.keys = {}
+        self.fetched = None
+        self.fetching = None
+
+    @classmethod
+    def get_instance(cls):
+        """Get the process-wide JWKS cache.
+
+        """
+        with cls.__instance_lock:
+            if cls.__instance is None:
+                cls.__instance = JwksCache()
+            return cls.__instance
+
+    def reset(self):
+        """Forget all cached keys.
+
+        """
+        with self.lock:
+            self.url = None
+            self.keys = {}
+            self.fetched = None
+            self.fetching = None
+
+    @staticmethod
+    def fetch(url, cacert):
+        """Retrieve the JWKS at 'url' and return a dictionary of key IDs to
+        public keys, or None if that fails.
+
+        """
+        try:
+            response = KEYCLOAK.get(url, verify=cacert)
+            response.raise_for_status()
+            jwks = response.json()
+        except (requests.exceptions.RequestException, ValueError) as err:
+            logger.warning("retrieving JWKS from %s: %r", url, err)
+            return None
+        keys = {}
+        for jwk in jwks.get('keys', []):
+            try:
+                key = jwk_public_key(jwk)
+            except (KeyError, TypeError, ValueError, binascii.Error) as err:
+                logger.warning("skipping unusable JWK %s: %r",
+                               jwk.get('kid'), err)
+                continue
+            if key is not None:
+                keys[jwk.get('kid')] = key
+        return keys
+
+    def get_key(self, url, cacert, kid):
+        """Get the public key with the key ID 'kid' from the JWKS at 'url',
+        retrieving the JWKS if the key is not known yet.  Return None if
+        there is no such key.  Only one retrieval is made at a time,
+        anyone else needing it in the meantime waits for that one.
+
+        """
+        with self.lock:
+            if url != self.url:
+                # The configured realm changed, forget the old one.
+                self.url = url
+                self.keys = {}
+                self.fetched = None
+                self.fetching = None
+            key = self.keys.get(kid)
+            if key is not None:
+                return key
+            fetching = self.fetching
+            leader = fetching is None
+            if leader:
+                if (
+                        self.fetched is not None and
+                        time.monotonic() - self.fetched <
+                        JWKS_MIN_REFRESH_INTERVAL
+                ):
+                    return None
+                # Nobody else retrieves it again for a while.
+                self.fetched = time.monotonic()
+                fetching = self.fetching = threading.Event()
+        if not leader:
+            fetching.wait()
+            with self.lock:
+                return self.keys.get(kid) if url == self.url else None
+        keys = None
+        try:
+            keys = self.fetch(url, cacert)
+            uas_metrics.increment('jwks_refreshes')
+        finally:
+            with self.lock:
+                if self.fetching is fetching:
+                    self.fetching = None
+                if keys is not None and url == self.url:
+                    self.keys = keys
+            fetching.set()
+        return keys.get(kid) if keys is not None else None
+
+
+def valid_claims(claims, issuer, audiences):
+    """Check that 'claims' are those of a current access token from
+    'issuer' issued to or for one of 'audiences'.
+
+    """
+    now = time.time()
+    if not (
+            float(claims.get('nbf', 0)) - JWT_LEEWAY <= now <=
+            float(claims['exp']) + JWT_LEEWAY
+    ):
+        return False
+    if claims.get('iss') != issuer or claims.get('typ') != "Bearer":
+        return False
+    aud = claims.get('aud', [])
+    aud = [aud] if isinstance(aud, str) else aud
+    return (
+        claims.get('azp') in audiences or
+        any(audience in aud for audience in audiences)
+    )
+
+
+def verify_jwt(token, cacert):
+    """Verify the signature and claims of a (possibly 'Bearer ' prefixed)
+    JWT against the JWKS of the configured realm and return its claims,
+    or None if it cannot be verified locally.
+
+    """
+    issuer = jwt_issuer()
+    if rsa is None or not token or issuer is None:
+        return None
+    try:
+        signing_input, _, signature = token.split()[-1].rpartition('.')
+        header, payload = signing_input.split('.')
+        header = json.loads(b64decode(header))
+        algorithm = JWT_ALGORITHMS.get(header.get('alg'))
+        if algorithm is None:
+            return None
+        key = JwksCache.get_instance().get_key(
+            jwks_url(issuer), cacert, header.get('kid')
+        )
+        if key is None:
+            return None
+        key.verify(
+            b64decode(signature),
+            signing_input.encode('ascii'),
+            padding.PKCS1v15(),
+            getattr(hashes, algorithm)()
+        )
+        claims = json.loads(b64decode(payload))
+        if not valid_claims(claims, issuer, jwt_audiences()):
+            return None
+    except (
+            AttributeError, KeyError, TypeError, ValueError,
+            binascii.Error, InvalidSignature
+    ) as err:
+        logger.debug("JWT not verified locally: %r", err)
+        return None
+    return claims if isinstance(claims, dict) else None
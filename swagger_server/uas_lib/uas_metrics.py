@@ -0,0 +1,66 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+""" Process-wide UAS Manager metrics.
+
+Simple named counters and timings kept in memory by each UAS Manager
+process and reported by the mgr-info API, which is polled regularly as
+the UAS readiness check.
+
+"""
+import threading
+
+_COUNTERS = {}
+_TIMINGS = {}
+_COUNTERS_LOCK = threading.Lock()
+
+
+def increment(name, amount=1):
+    """Add 'amount' to the counter called 'name'.
+
+    """
+    with _COUNTERS_LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + amount
+
+
+def observe(name, seconds):
+    """Record a timing of 'seconds' under 'name'.  Timings are reported as
+    the number of timings ('<name>_count'), their total
+    ('<name>_seconds') and the longest one ('<name>_max_seconds').
+
+    """
+    with _COUNTERS_LOCK:
+        count, total, longest = _TIMINGS.get(name, (0, 0.0, 0.0))
+        _TIMINGS[name] = (count + 1, total + seconds, max(longest, seconds))
+
+
+def get_metrics():
+    """Get a copy of all of the counters and timings as a dictionary of
+    names to values.
+
+    """
+    with _COUNTERS_LOCK:
+        ret = dict(_COUNTERS)
+        for name, (count, total, longest) in _TIMINGS.items():
+            ret['%s_count' % name] = count
+            ret['%s_seconds' % name] = round(total, 6)
+            ret['%s_max_seconds' % name] = round(longest, 6)
+        return ret
@@ -32,7 +32,7 @@ from flask import abort
 from kubernetes import client
 from swagger_server.uas_lib.uas_base import UasBase
 from swagger_server.uas_lib.uai_instance import UAIInstance
-from swagger_server.uas_lib.vault import remove_vault_data
+from swagger_server.uas_lib.vault_cleanup import VaultCleanupQueue
 from swagger_server.uas_data_model.uai_image import UAIImage
 from swagger_server.uas_data_model.uai_volume import UAIVolume
 from swagger_server.uas_data_model.uai_resource import UAIResource
@@ -64,13 +64,13 @@ class UasManager(UasBase):
                 labels.append("user=%s" % owner)
             if class_id is not None:
                 labels.append("uas-class-id=%s" % class_id)
-            uai_list = self.select_jobs(labels=labels)
+            resp_list = self.remove_uais_by_selector(labels=labels)
         else:
             uai_list = [
                 uai_name.strip() for uai_name in uai_list
                 if uai_name.strip() != ""
             ]
-        resp_list = self.remove_uais(uai_list)
+            resp_list = self.remove_uais(uai_list)
         logger.debug("uai's deleted: %s'", resp_list)
         return resp_list
 
@@ -159,12 +159,10 @@ class UasManager(UasBase):
 
         # Make sure the image ID is not in use by any classes, and, if
         # it is, get a list of them to complain about.
-        uai_classes = UAIClass.get_all()
-        uai_classes = [] if uai_classes is None else uai_classes
         # pylint: disable=no-member
         in_use = [
             uai_class.class_id
-            for uai_class in uai_classes if uai_class.image_id == image_id
+            for uai_class in UAIClass.get_by_index('image_id', image_id)
         ]
         if in_use:
             abort(
@@ -189,23 +187,25 @@ class UasManager(UasBase):
             imagename, default
         )
         self.uas_cfg.get_config()
-        if UAIImage.get_by_name(imagename):
-            abort(409, "image named '%s' already exists" % imagename)
         # Create it and store it...
         if default is None:
             default = False
-        if default:
-            # This is the default image. Check for any other image
-            # that is currently default and make it no longer default.
-            imgs = UAIImage.get_all()
-            imgs = [] if imgs is None else imgs
-            for img in imgs:
-                if img.default:
-                    img.default = False
-                    img.put()
-        # Now create the new image...
         img = UAIImage(imagename=imagename, default=default)
-        img.put()
+
+        def create(txn):
+            if UAIImage.get_by_name(imagename):
+                abort(409, "image named '%s' already exists" % imagename)
+            if default:
+                # This is the default image. Check for any other image
+                # that is currently default and make it no longer
+                # default.
+                for tmp in UAIImage.get_by_index('default', True):
+                    tmp.default = False
+                    txn.put(tmp)
+            # Now create the new image...
+            txn.put(img)
+
+        self.__commit(create, UAIImage)
         ret = img.expand()
         logger.debug("created (registered) UAI image: %s", ret)
         return ret
@@ -228,11 +228,8 @@ class UasManager(UasBase):
         if imagename is None:
             imagename = img.imagename
         if imagename != img.imagename:
-            # Going to change the image name, make sure it is unique...
-            tmp = UAIImage.get_by_name(imagename)
-            if tmp is not None:
-                abort(409, "image named '%s' already exists" % imagename)
-            # A value is specified to update...
+            # Going to change the image name, it is checked for
+            # uniqueness below.
             img.imagename = imagename
             changed = True
         # Is the default settting changing?
@@ -243,19 +240,26 @@ class UasManager(UasBase):
             img.default = default
             changed = True
         if changed:
-            if default:
-                # This will be the default image. If there is another
-                # image that is default right now, make it no longer
-                # default.
-                imgs = UAIImage.get_all()
-                imgs = [] if imgs is None else imgs
-                for tmp in imgs:
-                    if tmp.image_id == image_id:
-                        continue
-                    if tmp.default:
+            def update(txn):
+                # Make sure the image name is unique...
+                for tmp in UAIImage.get_by_index('imagename', imagename):
+                    if tmp.image_id != image_id:
+                        abort(
+                            409,
+                            "image named '%s' already exists" % imagename
+                        )
+                if default:
+                    # This will be the default image. If there is
+                    # another image that is default right now, make it
+                    # no longer default.
+                    for tmp in UAIImage.get_by_index('default', True):
+                        if tmp.image_id == image_id:
+                            continue
                         tmp.default = False
-                        tmp.put()
-            img.put()
+                        txn.put(tmp)
+                txn.put(img)
+
+            self.__commit(update, UAIImage)
         ret = img.expand()
         logger.debug("Updated image %s: %s", image_id, ret)
         return ret
@@ -301,12 +305,10 @@ class UasManager(UasBase):
         self.uas_cfg.get_config()
         # Make sure the volume ID is not in use by any classes, and, if
         # it is, get a list of them to complain about.
-        uai_classes = UAIClass.get_all()
-        uai_classes = [] if uai_classes is None else uai_classes
         # pylint: disable=no-member
         in_use = [
             uai_class.class_id
-            for uai_class in uai_classes if volume_id in uai_class.volume_list
+            for uai_class in UAIClass.get_by_index('volume_list', volume_id)
         ]
         if in_use:
             abort(
@@ -479,13 +481,10 @@ class UasManager(UasBase):
 
         # Make sure the resource is not in use by any classes, and, if
         # it is, get a list of them to complain about.
-        uai_classes = UAIClass.get_all()
-        uai_classes = [] if uai_classes is None else uai_classes
         # pylint: disable=no-member
         in_use = [
             uai_class.class_id
-            for uai_class in uai_classes
-            if uai_class.resource_id == resource_id
+            for uai_class in UAIClass.get_by_index('resource_id', resource_id)
         ]
         if in_use:
             abort(
@@ -627,18 +626,31 @@ class UasManager(UasBase):
         logger.debug("got list of resources: %s", ret)
         return ret
 
+    @staticmethod
+    def __commit(build, *models):
+        """Make a change to the UAS configuration atomically (see
+        UASDataModel.transaction()), guarded against concurrent changes
+        to 'models', or fail the request if that keeps conflicting with
+        other changes.
+
+        """
+        if not UAIClass.transaction(build, *models):
+            abort(
+                409,
+                "The UAS configuration is being changed by another request, "
+                "please try again"
+            )
+
     @staticmethod
     def _validate_volume_list(volume_list):
         """ Verify that a volume list is a list and all the elements exist.
 
         """
         try:
-            missing_vols = ""
-            for volume_id in volume_list:
-                if UAIVolume.get(volume_id) is None:
-                    if missing_vols:
-                        missing_vols += ", "
-                    missing_vols += volume_id
+            vols = UAIVolume.get_many(volume_list)
+            missing_vols = ", ".join(
+                [volume_id for volume_id in volume_list if volume_id not in vols]
+            )
             if missing_vols:
                 abort(
                     400,
@@ -783,35 +795,62 @@ class UasManager(UasBase):
             )
 
     @staticmethod
-    def _expanded_uai_class(uai_class):
-        """Fully expand a UAI Class object and all of its sub-objects.  This
-        differs from the object based `expand` method used elsewhere
-        in that it knows how to dig into the sub-objects.
+    def _expanded_uai_classes(uai_classes):
+        """Fully expand a list of UAI Class objects and all of their
+        sub-objects.  This differs from the object based `expand`
+        method used elsewhere in that it knows how to dig into the
+        sub-objects.  The sub-objects of each kind are retrieved for
+        all of the classes at once.
 
         """
-        ret = uai_class.expand()
-        ret['comment'] = uai_class.comment or ""
-        ret['default'] = uai_class.default or False
-        ret['public_ip'] = uai_class.public_ip or False
-        ret['uai_compute_network'] = uai_class.uai_compute_network or False
-        ret['uai_image'] = UAIImage.get(
-            uai_class.image_id, expandable=True
-        ).expand()
-        ret['resource_config'] = (
-            None if uai_class.resource_id is None
-            else UAIResource.get(
-                    uai_class.resource_id, expandable=True
-            ).expand()
+        # pylint: disable=no-member
+        imgs = UAIImage.get_many(
+            [uai_class.image_id for uai_class in uai_classes],
+            expandable=True
         )
-        ret['volume_mounts'] = (
-            [] if uai_class.volume_list is None
-            else [
-                    UAIVolume.get(vol, expandable=True).expand()
-                    for vol in uai_class.volume_list
-            ]
+        resources = UAIResource.get_many(
+            [
+                uai_class.resource_id for uai_class in uai_classes
+                if uai_class.resource_id is not None
+            ],
+            expandable=True
+        )
+        vols = UAIVolume.get_many(
+            [
+                vol
+                for uai_class in uai_classes
+                for vol in uai_class.volume_list or []
+            ],
+            expandable=True
         )
+        ret = []
+        for uai_class in uai_classes:
+            expanded = uai_class.expand()
+            expanded['comment'] = uai_class.comment or ""
+            expanded['default'] = uai_class.default or False
+            expanded['public_ip'] = uai_class.public_ip or False
+            expanded['uai_compute_network'] = (
+                uai_class.uai_compute_network or False
+            )
+            expanded['uai_image'] = imgs[uai_class.image_id].expand()
+            expanded['resource_config'] = (
+                None if uai_class.resource_id is None
+                else resources[uai_class.resource_id].expand()
+            )
+            expanded['volume_mounts'] = (
+                [] if uai_class.volume_list is None
+                else [vols[vol].expand() for vol in uai_class.volume_list]
+            )
+            ret.append(expanded)
         return ret
 
+    def _expanded_uai_class(self, uai_class):
+        """Fully expand a UAI Class object and all of its sub-objects (see
+        _expanded_uai_classes()).
+
+        """
+        return self._expanded_uai_classes([uai_class])[0]
+
     def delete_class(self, class_id):
         """Delete a UAI Class
 
@@ -821,8 +860,17 @@ class UasManager(UasBase):
         uai_class = UAIClass.get(class_id)
         if uai_class is None:
             abort(404, "UAI Class '%s' does not exist" % class_id)
-        uai_class.remove() # don't use x.delete() you actually want it removed
-        remove_vault_data(class_id)
+        cleanups = VaultCleanupQueue.get_instance()
+
+        def remove(txn):
+            # don't use x.delete() you actually want it removed
+            txn.remove(uai_class)
+            # Cleaning up Vault can take a while, it is queued along
+            # with removing the class and done in the background.
+            txn.put(cleanups.queue(class_id))
+
+        self.__commit(remove, UAIClass)
+        cleanups.wake()
         ret = self._expanded_uai_class(uai_class)
         logger.debug("deleted UAI class '%s': %s", class_id, ret)
         return ret
@@ -937,15 +985,18 @@ class UasManager(UasBase):
             service_account=service_account,
             replicas=int(replicas)
         )
-        if default:
-            default_class = UAIClass.get_default()
-            if default_class is not None:
-                # There was a previously default class, this class is
-                # usurping that, so set the previously default class
-                # no longer default.
-                default_class.default = False
-                default_class.put()  # pylint: disable=no-member
-        uai_class.put()
+
+        def create(txn):
+            if default:
+                # If there was a previously default class, this class is
+                # usurping that, so set the previously default class no
+                # longer default.
+                for default_class in UAIClass.get_by_index('default', True):
+                    default_class.default = False
+                    txn.put(default_class)
+            txn.put(uai_class)
+
+        self.__commit(create, UAIClass)
         ret = self._expanded_uai_class(uai_class)
         logger.debug("created UAI class: %s", ret)
         return ret
@@ -1073,15 +1124,21 @@ class UasManager(UasBase):
             uai_class.replicas = int(replicas)
             changed = True
         if changed:
-            if default:  # this implies that default is not None
-                default_class = UAIClass.get_default()
-                if default_class is not None:
-                    # There was a previously default class, this class is
-                    # usurping that, so set the previously default class
-                    # no longer default.
-                    default_class.default = False
-                    default_class.put()
-            uai_class.put()
+            def update(txn):
+                if default:  # this implies that default is not None
+                    # If there was a previously default class, this
+                    # class is usurping that, so set the previously
+                    # default class no longer default.
+                    for default_class in UAIClass.get_by_index(
+                            'default', True
+                    ):
+                        if default_class.class_id == class_id:
+                            continue
+                        default_class.default = False
+                        txn.put(default_class)
+                txn.put(uai_class)
+
+            self.__commit(update, UAIClass)
         ret =  self._expanded_uai_class(uai_class)
         logger.debug("updated UAI class '%s': %s", class_id, ret)
         return ret
@@ -1110,13 +1167,21 @@ class UasManager(UasBase):
         self.uas_cfg.get_config()
         uai_classes = UAIClass.get_all()
         uai_classes = [] if uai_classes is None else uai_classes
-        ret = [
-            self._expanded_uai_class(uai_class)
-            for uai_class in uai_classes
-        ]
+        ret = self._expanded_uai_classes(uai_classes)
         logger.debug("got list of UAI classes: %s", ret)
         return ret
 
+    @staticmethod
+    def get_vault_cleanups():
+        """Get the list of pending cleanups of the Vault data of deleted UAI
+        classes.
+
+        """
+        logger.debug("listing pending vault cleanups")
+        ret = VaultCleanupQueue.get_instance().pending()
+        logger.debug("got list of pending vault cleanups: %s", ret)
+        return ret
+
     def factory_reset(self):
         """Delete all the local configuration so that the next operation
         reloads config from the configmap configuration.
@@ -1124,31 +1189,27 @@ class UasManager(UasBase):
         """
         logger.debug("resetting UAS config to factory defaults")
         self.uas_cfg.get_config()
-        # Delete all the classes first, since they are the consumers
-        # of all the rest.  This avoids conflicts when removing the
-        # images, volumes and resources.
-        uai_classes = UAIClass.get_all()
-        uai_classes = [] if uai_classes is None else uai_classes
-        for uai_class in uai_classes:
-            uai_class.remove()
-            remove_vault_data(uai_class.class_id) # pylint: disable=no-member
-
-        vols = UAIVolume.get_all()
-        vols = [] if vols is None else vols
-        for vol in vols:
-            vol.remove()
-        imgs = UAIImage.get_all()
-        imgs = [] if imgs is None else imgs
-        for img in imgs:
-            img.remove()
-        resources = UAIResource.get_all()
-        resources = [] if resources is None else resources
-        for resource in resources:
-            resource.remove()
-        cfgs = PopulatedConfig.get_all()
-        cfgs = [] if cfgs is None else cfgs
-        for cfg in cfgs:
-            cfg.remove()
+        # Remove everything in one go.  The classes come first, since
+        # they are the consumers of all the rest.  This avoids
+        # conflicts when removing the images, volumes and resources if
+        # the changes have to be made one at a time.
+        class_ids = []
+
+        def reset(txn):
+            uai_classes = UAIClass.get_all()
+            uai_classes = [] if uai_classes is None else uai_classes
+            # pylint: disable=no-member
+            class_ids[:] = [uai_class.class_id for uai_class in uai_classes]
+            for model in [
+                    UAIClass, UAIVolume, UAIImage, UAIResource, PopulatedConfig
+            ]:
+                txn.remove_all(model)
+            for class_id in class_ids:
+                txn.put(cleanups.queue(class_id))
+
+        cleanups = VaultCleanupQueue.get_instance()
+        self.__commit(reset, UAIClass, UAIVolume, UAIImage, UAIResource)
+        cleanups.wake()
         logger.debug("Re-running the update-uas job to restore the defaults")
         self.restore_default_config()
         logger.debug("UAS config has been reset to factory defaults")
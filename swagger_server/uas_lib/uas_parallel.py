@@ -0,0 +1,64 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+""" Bounded concurrent execution of independent UAS operations.
+
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Default limit on how many operations (typically Kubernetes API calls)
+# a single UAS request runs at once.
+UAS_MAX_CONCURRENCY = 8
+
+
+def max_concurrency():
+    """Get the maximum number of operations a single request runs
+    concurrently.  UAS_MAX_CONCURRENCY comes from config in the Helm
+    chart.
+
+    """
+    try:
+        return max(
+            1,
+            int(os.environ.get('UAS_MAX_CONCURRENCY', UAS_MAX_CONCURRENCY))
+        )
+    except ValueError:
+        return UAS_MAX_CONCURRENCY
+
+
+def parallel_map(func, items, max_workers=None):
+    """Call 'func' on each of 'items' using a bounded number of threads
+    and return the list of results in the same order as 'items'.  If
+    any of the calls raises, the first such exception (in 'items'
+    order) is raised once all of the calls are done.
+
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    max_workers = max_workers or max_concurrency()
+    with ThreadPoolExecutor(
+            max_workers=min(max_workers, len(items)),
+            thread_name_prefix="uas-parallel"
+    ) as executor:
+        futures = [executor.submit(func, item) for item in items]
+    return [future.result() for future in futures]
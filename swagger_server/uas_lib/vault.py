@@ -26,8 +26,97 @@ Classes.
 
 import os
 import json
+import time
+import threading
 import requests
 from swagger_server.uas_lib.uas_logging import logger
+from swagger_server.uas_lib import uas_metrics
+from swagger_server.uas_lib.uas_http import VAULT
+from swagger_server.uas_lib.uas_parallel import parallel_map
+
+VAULT_URL = "http://cray-vault.vault:8200/v1"
+
+# Number of seconds before the end of its lease that a Vault client
+# token stops being used and a new one is obtained.
+VAULT_TOKEN_RENEW_MARGIN = 60
+
+
+class VaultForbidden(Exception):
+    """Vault refused a request made with the client token, typically
+    because the token has expired or been revoked.
+
+    """
+
+
+class VaultToken:
+    """Process-wide Vault client token, obtained by logging in to Vault
+    with the service account of this pod and reused until shortly
+    before its lease runs out.
+
+    """
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(self):
+        """Constructor
+
+        """
+        self.lock = threading.Lock()
+        self.token = None
+        self.expires = None
+
+    @classmethod
+    def get_instance(cls):
+        """Get the process-wide Vault client token.
+
+        """
+        with cls.__instance_lock:
+            if cls.__instance is None:
+                cls.__instance = VaultToken()
+            return cls.__instance
+
+    def reset(self):
+        """Forget the client token.
+
+        """
+        with self.lock:
+            self.token = None
+            self.expires = None
+
+    def forget(self, token):
+        """Forget the client token if it is still 'token', so the next
+        user logs in again.
+
+        """
+        with self.lock:
+            if self.token == token:
+                self.token = None
+                self.expires = None
+
+    def get(self, login):
+        """Get the client token, calling 'login' to get a new one (as a
+        (token, lease duration) tuple or None) if there is no usable
+        token.  Return None if there is no token.
+
+        """
+        with self.lock:
+            if self.token is not None and (
+                    self.expires is None or time.monotonic() < self.expires
+            ):
+                return self.token
+            # Only one login at a time, everyone else waits for it.
+            login_data = login()
+            uas_metrics.increment('vault_logins')
+            if login_data is None:
+                return None
+            self.token, lease_duration = login_data
+            # A lease duration of 0 means the token does not expire.
+            self.expires = (
+                time.monotonic() +
+                max(0, lease_duration - VAULT_TOKEN_RENEW_MARGIN)
+                if lease_duration else None
+            )
+            return self.token
 
 
 def get_vault_path(uai_class_id):
@@ -41,21 +130,44 @@ def get_vault_path(uai_class_id):
 
 def remove_vault_data(uai_class_id):
     """Remove all Broker UAI data from vault pertaining to the specified
-       UAI class.
+       UAI class.  Return True if all of it was removed.
     """
-    client_token = __vault_authenticate()
-    if client_token is None:
-        return
-    __remove_vault_subtree(get_vault_path(uai_class_id), client_token)
+    return remove_vault_classes([uai_class_id])
+
+
+def remove_vault_classes(uai_class_ids):
+    """Remove all Broker UAI data from vault pertaining to each of the
+       specified UAI classes.  Return True if all of it was removed.
+    """
+    paths = [get_vault_path(uai_class_id) for uai_class_id in uai_class_ids]
+    if not paths:
+        return True
+    vault_token = VaultToken.get_instance()
+    # If Vault refuses the cached token, log in again and retry once.
+    for attempt in range(2):
+        client_token = vault_token.get(__vault_authenticate)
+        if client_token is None:
+            return False
+        try:
+            return __remove_vault_subtrees(paths, client_token)
+        except VaultForbidden as err:
+            vault_token.forget(client_token)
+            if attempt > 0:
+                logger.warning(
+                    "vault refused the client token, "
+                    "secrets won't be cleaned up - %s",
+                    str(err)
+                )
+    return False
 
 
 def __vault_authenticate():
     """Authenticate with vault using the namespace service account for this
-    pod.
+    pod.  Return the client token and its lease duration or None.
 
     """
     sa_token_file = "/run/secrets/kubernetes.io/serviceaccount/token"
-    login_url = "http://cray-vault.vault:8200/v1/auth/kubernetes/login"
+    login_url = os.path.join(VAULT_URL, "auth/kubernetes/login")
     with open(sa_token_file, 'r', encoding='utf-8') as token_file:
         sa_token = token_file.read()
     login_payload = {
@@ -63,7 +175,7 @@ def __vault_authenticate():
         'role': "services"
     }
     try:
-        response = requests.post(login_url, data=login_payload, timeout=10)
+        response = VAULT.post(login_url, data=login_payload)
             # raise exception for 4XX and 5XX errors
         response.raise_for_status()
     except requests.exceptions.RequestException as err:
@@ -82,28 +194,43 @@ def __vault_authenticate():
             str(err)
         )
         return None
-    auth = token_data.get('auth', {})
+    auth = token_data.get('auth', None) or {}
     token = auth.get('client_token', None)
     if token is None:
         logger.warning(
             "authentication with vault returned no token "
             "secrets won't be cleaned up."
         )
-    return token
+        return None
+    return token, auth.get('lease_duration', 0) or 0
+
+
+def __check_forbidden(response, path):
+    """Raise VaultForbidden if Vault refused a request at 'path' because of
+    the client token.
+
+    """
+    if response.status_code == 403:
+        raise VaultForbidden("permission denied at path '%s'" % path)
 
 
 def __get_vault_children(path, client_token):
     """Retrieve the children (sub-paths) found at a given path in vault.
-    One layer deep.
+    One layer deep.  Return None if they could not be retrieved.
 
     """
-    print("get_vault_children: %s" % path)
+    logger.debug("listing vault path '%s'", path)
     headers = {"X-Vault-Token": "%s" % client_token }
-    url = os.path.join("http://cray-vault.vault:8200/v1", path)
+    url = os.path.join(VAULT_URL, path)
     params = {"list": "true"}
     try:
-        response = requests.get(url, headers=headers, params=params, timeout=10)
-            # raise exception for 4XX and 5XX errors
+        response = VAULT.get(url, headers=headers, params=params)
+        __check_forbidden(response, path)
+        # Nothing to list (404) is not a failure, the path is just
+        # a leaf or not there.
+        if response.status_code == 404:
+            return []
+        # raise exception for 4XX and 5XX errors
         response.raise_for_status()
     except requests.exceptions.RequestException as err:
         logger.warning(
@@ -111,6 +238,7 @@ def __get_vault_children(path, client_token):
             path,
             str(err)
         )
+        return None
     try:
         child_data = response.json()
     except json.decoder.JSONDecodeError as err:
@@ -119,21 +247,26 @@ def __get_vault_children(path, client_token):
             path,
             str(err)
         )
-    data = child_data.get('data', {})
+        return None
+    data = (child_data or {}).get('data', None) or {}
     return data.get('keys', [])
 
 
 def __delete_vault_path(path, client_token):
-    """Delete a single node from vault at the specified path.
+    """Delete a single node from vault at the specified path.  Return True
+    if it is gone.
 
     """
-    print("delete_vault_path: %s" % path)
     logger.debug("removing vault path '%s'", path)
     headers = {"X-Vault-Token": "%s" % client_token }
-    url = os.path.join("http://cray-vault.vault:8200/v1", path)
+    url = os.path.join(VAULT_URL, path)
     try:
-        response = requests.delete(url, headers=headers, timeout=10)
-            # raise exception for 4XX and 5XX errors
+        response = VAULT.delete(url, headers=headers)
+        __check_forbidden(response, path)
+        # Already gone (404) is as good as removed.
+        if response.status_code == 404:
+            return True
+        # raise exception for 4XX and 5XX errors
         response.raise_for_status()
     except requests.exceptions.RequestException as err:
         logger.warning(
@@ -141,15 +274,48 @@ def __delete_vault_path(path, client_token):
             path,
             str(err)
         )
+        return False
+    return True
 
 
-def __remove_vault_subtree(path, client_token):
-    """Recursively remove the tree found at the specified path in vault.
+def __remove_vault_subtrees(paths, client_token):
+    """Remove the trees found at the specified paths in vault.  The trees
+    are listed one level at a time, listing all of the sub-trees
+    ('<name>/' children) at a level concurrently, then the nodes are
+    removed deepest level first, all of the nodes at a level
+    concurrently.  Return True if everything was removed.
 
     """
-    print("remove_vault_subtree: '%s'" % path)
+    complete = True
+    levels = []
+    level = list(paths)
+    while level:
+        levels.append(level)
+        # Leaves have no children, so only the tops of the trees and
+        # sub-trees need listing.
+        subtrees = [
+            path for path in level
+            if path in paths or path.endswith('/')
+        ]
+        children = parallel_map(
+            lambda path: __get_vault_children(path, client_token),
+            subtrees
+        )
+        complete = complete and None not in children
+        level = [
+            os.path.join(path, child)
+            for path, kids in zip(subtrees, children)
+            for child in kids or []
+        ]
+    logger.debug(
+        "removing %d vault paths under %s",
+        sum(len(level) for level in levels), paths
+    )
     # Depth first, remove the kids...
-    for child in __get_vault_children(path, client_token):
-        child_path = os.path.join(path, child)
-        __remove_vault_subtree(child_path, client_token)
-    __delete_vault_path(path, client_token)
+    for level in reversed(levels):
+        removed = parallel_map(
+            lambda path: __delete_vault_path(path, client_token),
+            level
+        )
+        complete = complete and all(removed)
+    return complete
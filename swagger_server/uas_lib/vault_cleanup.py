@@ -0,0 +1,236 @@
+# MIT License
+#
+# (C) Copyright [2024] Hewlett Packard Enterprise Development LP
+#
+# Permission is hereby granted, free of charge, to any person obtaining a
+# copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL
+# THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR
+# OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE,
+# ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
+# OTHER DEALINGS IN THE SOFTWARE.
+""" Background removal of the Broker UAI data in Vault of deleted UAI
+classes.
+
+Deleting a UAI class (or resetting the UAS configuration) queues the
+removal of the Vault data of the class as a VaultCleanup object in
+ETCD, in the same transaction that removes the class, and returns.  A
+worker thread in each UAS Manager process works through the queue,
+removing the data and then the VaultCleanup object, and backing off
+exponentially when Vault cannot be reached or refuses.  Since the
+queue is in ETCD, cleanups left over when a UAS Manager stops are
+picked up by whichever UAS Manager looks next.  Removal is idempotent,
+so two UAS Managers working on the same cleanup does no harm.
+
+"""
+import threading
+import time
+from swagger_server.uas_data_model.vault_cleanup import VaultCleanup
+from swagger_server.uas_lib.uas_logging import logger
+from swagger_server.uas_lib import uas_metrics
+from swagger_server.uas_lib.vault import remove_vault_data
+
+# Number of seconds to wait before retrying a failed cleanup, doubled
+# on every further failure up to VAULT_CLEANUP_MAX_BACKOFF.
+VAULT_CLEANUP_BACKOFF = 10
+VAULT_CLEANUP_MAX_BACKOFF = 900
+
+# Least number of seconds between looks for cleanups left over from
+# other (or earlier) UAS Managers when there is no known work.
+VAULT_CLEANUP_RESUME_INTERVAL = 60
+
+
+def cleanup_backoff(attempts):
+    """Get the number of seconds to wait before retrying a cleanup that
+    has failed 'attempts' times.
+
+    """
+    return min(
+        VAULT_CLEANUP_MAX_BACKOFF,
+        VAULT_CLEANUP_BACKOFF * 2 ** max(0, attempts - 1)
+    )
+
+
+class VaultCleanupQueue:
+    """Process-wide worker for the queue of pending Vault cleanups.
+
+    """
+    __instance = None
+    __instance_lock = threading.Lock()
+
+    def __init__(self):
+        """Constructor
+
+        """
+        self.lock = threading.Lock()
+        self.worker = None
+        self.last_start = None
+        self.wakeup = threading.Event()
+
+    @classmethod
+    def get_instance(cls):
+        """Get the process-wide Vault cleanup worker.
+
+        """
+        with cls.__instance_lock:
+            if cls.__instance is None:
+                cls.__instance = VaultCleanupQueue()
+            return cls.__instance
+
+    @staticmethod
+    def queue(class_id):
+        """Compose the VaultCleanup object that queues the cleanup of the
+        Vault data of the UAI class 'class_id', for the caller to
+        store, typically in the transaction removing the class.  Call
+        wake() once it is stored.
+
+        """
+        return VaultCleanup(class_id=class_id, queued=time.time())
+
+    @staticmethod
+    def pending():
+        """Get the list of pending cleanups, oldest first.
+
+        """
+        cleanups = VaultCleanup.get_all()
+        cleanups = [] if cleanups is None else cleanups
+        return [
+            cleanup.expand()
+            for cleanup in sorted(
+                cleanups, key=lambda cleanup: cleanup.queued or 0
+            )
+        ]
+
+    def wake(self):
+        """Start working on the queue now, new cleanups have been queued.
+
+        """
+        # Set before looking for a running worker, so a worker that is
+        # just stopping either sees it or has already stopped.
+        self.wakeup.set()
+        self.__start(force=True)
+
+    def resume(self):
+        """Make sure cleanups left over from other or earlier UAS Managers
+        get done.  This is called frequently (on every mgr-info
+        request), so it only actually looks at the queue now and then.
+
+        """
+        self.__start(force=False)
+
+    def __start(self, force):
+        """Start the worker thread unless it is running.  Unless 'force' is
+        set, only start it if it has not been started recently.
+
+        """
+        with self.lock:
+            if self.worker is not None:
+                return
+            now = time.monotonic()
+            if (
+                    not force and self.last_start is not None and
+                    now - self.last_start < VAULT_CLEANUP_RESUME_INTERVAL
+            ):
+                return
+            self.last_start = now
+            self.worker = threading.Thread(
+                target=self.run,
+                name="uas-vault-cleanup",
+                daemon=True
+            )
+            self.worker.start()
+
+    @staticmethod
+    def attempt(cleanup):
+        """Try to remove the Vault data for a pending cleanup, then either
+        remove the cleanup or put off the next attempt.  The cleanup is
+        only written back if nobody else has changed or removed it
+        since this attempt started.
+
+        """
+        revision = cleanup.revision()
+        if revision is None:
+            # Finished by another UAS Manager already.
+            return
+        logger.debug("cleaning up vault data of UAI class '%s'",
+                     cleanup.class_id)
+        try:
+            error = (
+                None if remove_vault_data(cleanup.class_id)
+                else "vault data could not all be removed"
+            )
+        except Exception as err:  # pylint: disable=broad-except
+            error = repr(err)
+        if error is None:
+            cleanup.remove()
+            uas_metrics.increment('vault_cleanups')
+            logger.info("cleaned up vault data of UAI class '%s'",
+                        cleanup.class_id)
+            return
+        uas_metrics.increment('vault_cleanup_failures')
+        cleanup.attempts = (cleanup.attempts or 0) + 1
+        cleanup.last_error = error
+        cleanup.next_attempt = time.time() + cleanup_backoff(cleanup.attempts)
+        logger.warning(
+            "cleaning up vault data of UAI class '%s' failed "
+            "(attempt %d), retrying in %d seconds - %s",
+            cleanup.class_id, cleanup.attempts,
+            cleanup_backoff(cleanup.attempts), error
+        )
+        if not cleanup.update(revision):
+            logger.info(
+                "vault cleanup of UAI class '%s' changed by someone else "
+                "during the attempt, leaving it as it is", cleanup.class_id
+            )
+
+    def work(self):
+        """Do all of the pending cleanups that are due.  Return the number
+        of seconds until the next one is due or None if there are no
+        more.
+
+        """
+        cleanups = VaultCleanup.get_all()
+        cleanups = [] if cleanups is None else cleanups
+        for cleanup in cleanups:
+            if (cleanup.next_attempt or 0) <= time.time():
+                self.attempt(cleanup)
+        if not cleanups:
+            return None
+        cleanups = VaultCleanup.get_all()
+        if not cleanups:
+            return None
+        return max(0, min(
+            (cleanup.next_attempt or 0) for cleanup in cleanups
+        ) - time.time())
+
+    def run(self):
+        """Work through the queue until it is empty.
+
+        """
+        while True:
+            self.wakeup.clear()
+            try:
+                delay = self.work()
+            except Exception as err:  # pylint: disable=broad-except
+                # ETCD is not reachable right now, try again later.
+                logger.warning("unable to work on vault cleanups: %r", err)
+                delay = VAULT_CLEANUP_BACKOFF
+            if delay is None:
+                with self.lock:
+                    # Anything queued since the last look needs another
+                    # look before stopping.
+                    if not self.wakeup.is_set():
+                        self.worker = None
+                        return
+                continue
+            self.wakeup.wait(timeout=delay)